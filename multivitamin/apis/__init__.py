@@ -3,3 +3,4 @@ from .local_api import LocalAPI
 from .s3_api import S3API
 from .sqs_api import SQSAPI
 from .http_api import HTTPAPI
+from .output_pusher import OutputPusher
@@ -0,0 +1,152 @@
+import time
+import threading
+import traceback
+from queue import Queue
+
+import glog as log
+
+from multivitamin.apis.comm_api import CommAPI
+
+QUEUE_SIZE = 16
+MAX_RETRIES = 3
+BACKOFF_BASE_SEC = 0.5
+BACKOFF_MAX_SEC = 30.0
+
+_STOP = object()
+
+
+class OutputPusher:
+    def __init__(
+        self,
+        output_comms,
+        queue_size=QUEUE_SIZE,
+        max_retries=MAX_RETRIES,
+        backoff_base_sec=BACKOFF_BASE_SEC,
+        backoff_max_sec=BACKOFF_MAX_SEC,
+    ):
+        """Pushes responses to output_comms in background threads
+
+        Each output_comm has its own bounded queue, drained by its own
+        thread, so a slow sink does not hold back the others nor the
+        caller, until its queue is full. Failed pushes are retried with
+        exponential backoff. Responses are pushed to each output_comm in
+        the order they were submitted.
+
+        Args:
+            output_comms (list[CommAPI]): comms to push responses to
+            queue_size (int): max number of responses waiting per comm
+            max_retries (int): number of retries after a failed push
+            backoff_base_sec (float): wait before the first retry, doubled
+                                      for every following retry
+            backoff_max_sec (float): max wait between two retries
+        """
+        if not isinstance(output_comms, list):
+            output_comms = [output_comms]
+        for comm in output_comms:
+            assert isinstance(comm, CommAPI)
+        if queue_size < 1:
+            raise ValueError("queue_size must be >= 1")
+
+        self.output_comms = output_comms
+        self.max_retries = max_retries
+        self.backoff_base_sec = backoff_base_sec
+        self.backoff_max_sec = backoff_max_sec
+        self._queues = [Queue(maxsize=queue_size) for _ in output_comms]
+        self._stats = [
+            {"pushed": 0, "retried": 0, "failed": 0} for _ in output_comms
+        ]
+        self._lock = threading.Lock()
+        self._closed = False
+        self._threads = []
+        for idx in range(len(output_comms)):
+            thread = threading.Thread(
+                target=self._drain, args=(idx,), daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def push(self, response):
+        """Queue a response to be pushed to every output_comm
+
+        Blocks while the queue of an output_comm is full.
+
+        Args:
+            response (Response): response to push
+        """
+        if self._closed:
+            raise RuntimeError("OutputPusher is shut down")
+        for q in self._queues:
+            q.put(response)
+
+    def flush(self):
+        """Block until every queued response has been pushed (or failed)"""
+        for q in self._queues:
+            q.join()
+
+    def shutdown(self):
+        """Push every queued response, then stop the threads"""
+        if self._closed:
+            return
+        self._closed = True
+        log.info("Flushing queued responses before shutting down")
+        for q in self._queues:
+            q.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        for stats in self.stats():
+            log.info(f"Output pusher stats: {stats}")
+
+    def stats(self):
+        """Get queue depth and push counts of each output_comm
+
+        Returns:
+            list[dict]: one dict per output_comm
+        """
+        with self._lock:
+            return [
+                dict(
+                    output_comm=str(type(comm).__name__),
+                    queue_depth=q.qsize(),
+                    **stats,
+                )
+                for comm, q, stats in zip(
+                    self.output_comms, self._queues, self._stats
+                )
+            ]
+
+    def _drain(self, idx):
+        comm = self.output_comms[idx]
+        q = self._queues[idx]
+        while True:
+            response = q.get()
+            try:
+                if response is _STOP:
+                    return
+                self._push_with_retries(idx, comm, response)
+            finally:
+                q.task_done()
+
+    def _push_with_retries(self, idx, comm, response):
+        for attempt in range(self.max_retries + 1):
+            try:
+                comm.push(response)
+                self._count(idx, "pushed")
+                return
+            except Exception as e:
+                log.error(e)
+                log.error(traceback.format_exc())
+                if attempt == self.max_retries:
+                    break
+                wait = min(self.backoff_base_sec * 2 ** attempt,
+                           self.backoff_max_sec)
+                log.warning(f"Pushing to output_comm: {comm} failed,"
+                            f" retrying in {wait} sec")
+                self._count(idx, "retried")
+                time.sleep(wait)
+        log.error(f"Error pushing response to output_comm: {comm}"
+                  f" after {self.max_retries} retries")
+        self._count(idx, "failed")
+
+    def _count(self, idx, key):
+        with self._lock:
+            self._stats[idx][key] += 1
@@ -1,8 +1,6 @@
 import os
 import json
 import glog as log
-import tempfile
-import shutil
 import boto3
 import hashlib
 
@@ -25,6 +23,14 @@ class S3API(CommAPI):
         self.s3_bucket = s3_bucket
         self.s3_key = s3_key
         self.bin_encoding = bin_encoding
+        self._s3client = None
+
+    @property
+    def s3client(self):
+        """Get the boto3 s3 client, created once and reused for every push"""
+        if self._s3client is None:
+            self._s3client = boto3.client("s3")
+        return self._s3client
 
     def pull(self, n=1):
         raise NotImplementedError("S3API.pull() not yet implemented")
@@ -42,30 +48,16 @@ class S3API(CommAPI):
             assert isinstance(res, Response)
             fn = self.get_fn(res, self.bin_encoding)
             log.debug(f"fn: {fn}")
-            tmp_dir = tempfile.mkdtemp()
-            outfn = os.path.join(tmp_dir, fn)
-
-            log.info("Writing response to {}".format(outfn))
-            if not os.path.exists(os.path.dirname(outfn)):
-                os.makedirs(os.path.dirname(outfn))
 
             if self.bin_encoding is True:
-                with open(outfn, "wb") as wf:
-                    wf.write(res.to_bytes())
+                body = res.to_bytes()
             else:
-                with open(outfn, "w") as wf:
-                    wf.write(json.dumps(res.to_dict(), indent=INDENTATION))
+                body = json.dumps(res.to_dict(), indent=INDENTATION).encode()
 
-            s3client = boto3.client("s3")
             assert(self.s3_key is not None)
             key_fullpath = os.path.join(self.s3_key, fn)
-            log.info("Pushing {} to {}/{}".format(outfn, self.s3_bucket, key_fullpath))
-            with open(outfn, "rb") as data:
-                s3client.put_object(Bucket=self.s3_bucket, Key=key_fullpath, Body=data)
-
-            if os.path.exists(tmp_dir):
-                log.info("Removing temp dir {}".format(tmp_dir))
-                shutil.rmtree(tmp_dir)
+            log.info("Pushing {} to {}/{}".format(fn, self.s3_bucket, key_fullpath))
+            self.s3client.put_object(Bucket=self.s3_bucket, Key=key_fullpath, Body=body)
 
     def get_fn(self, response, bin_encoding):
         """Create a fn from url string from Response
@@ -0,0 +1,57 @@
+"""Image preprocessing of caffe.io, without caffe or skimage
+
+caffe.io.Transformer resizes images with caffe.io.resize_image, i.e. with
+skimage.transform.resize. resize_image reproduces it, for models served
+without py-caffe (see DNNClassifier) to get the same inputs and scores.
+"""
+import numpy as np
+from scipy import ndimage
+
+
+def resize_image(image, size, anti_aliasing=True):
+    """Resize an image like caffe.io.resize_image
+
+    The image is scaled to [0, 1], resized like skimage.transform.resize
+    with order=1 and mode="constant", then scaled back. Uniform images
+    are filled with their value, like caffe.io.resize_image does.
+
+    Args:
+        image (np.ndarray): (height, width, channels) image
+        size (tuple): (width, height) of the resized image
+        anti_aliasing (bool): smooth the image with a Gaussian before
+                              downscaling it, like skimage>=0.15. False
+                              resizes like older versions
+
+    Returns:
+        np.ndarray: float32 resized image
+    """
+    image = np.asarray(image, dtype=np.float32)
+    width, height = size
+    im_min, im_max = image.min(), image.max()
+    if im_max <= im_min:
+        return np.full((height, width, image.shape[2]), im_min, np.float32)
+    resized = (image - im_min) / (im_max - im_min)
+    scales = (image.shape[0] / height, image.shape[1] / width)
+    if anti_aliasing and max(scales) > 1:
+        sigmas = [max(0.0, (scale - 1) / 2) for scale in scales] + [0.0]
+        resized = ndimage.gaussian_filter(resized.astype(np.float64), sigmas,
+                                          mode="constant")
+    for axis, out_size in ((0, height), (1, width)):
+        resized = _interpolate(resized, axis, out_size)
+    return (resized * (im_max - im_min) + im_min).astype(np.float32)
+
+
+def _interpolate(array, axis, out_size):
+    """Resize array along axis by linear interpolation, like
+    skimage.transform.resize: pixel centers are aligned on a grid scaled
+    around the image edges, and pixels outside the image are zeros
+    """
+    scale = array.shape[axis] / out_size
+    array = np.moveaxis(np.asarray(array, dtype=np.float64), axis, 0)
+    coords = (np.arange(out_size) + 0.5) * scale - 0.5
+    lower = np.floor(coords).astype(np.int64)
+    weights = (coords - lower).reshape((-1,) + (1,) * (array.ndim - 1))
+    zeros = np.zeros_like(array[:1])
+    padded = np.concatenate([zeros, array, zeros])
+    resized = padded[lower + 1] * (1 - weights) + padded[lower + 2] * weights
+    return np.moveaxis(resized, 0, axis)
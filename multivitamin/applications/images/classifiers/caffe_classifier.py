@@ -4,15 +4,21 @@ import glog as log
 import numpy as np
 import traceback
 import importlib
-import numbers
 
 from multivitamin.module import ImagesModule
+from multivitamin.module.imagesmodule import (BATCH_SIZE,
+                                              DEFAULT_INTERPOLATION)
 from multivitamin.data.response.utils import (
     p0p1_from_bbox_contour,
     crop_image_from_bbox_contour,
 )
-from multivitamin.module.utils import min_conf_filter_predictions
-from multivitamin.data.response.dtypes import Region, Property
+from multivitamin.data.response.dtypes import Region
+from multivitamin.applications.utils import (
+    LOGOEXCLUDE,
+    load_labels,
+    label_thresholds,
+    classification_props,
+)
 
 glog_level = os.environ.get("GLOG_minloglevel", None)
 
@@ -46,8 +52,6 @@ else:
 from caffe.proto import caffe_pb2
 
 
-LOGOEXCLUDE = ["Garbage", "Messy", "MessyDark"]
-
 
 class CaffeClassifier(ImagesModule):
     def __init__(
@@ -65,6 +69,13 @@ class CaffeClassifier(ImagesModule):
         postprocess_predictions=None,
         postprocess_args=None,
         gpuid=0,
+        batch_size=BATCH_SIZE,
+        target_size=None,
+        interpolation=DEFAULT_INTERPOLATION,
+        skip_similar_threshold=None,
+        detect_every=1,
+        scene_change_threshold=None,
+        media_backend="opencv",
     ):
 
         super().__init__(
@@ -73,6 +84,13 @@ class CaffeClassifier(ImagesModule):
             prop_type=prop_type,
             prop_id_map=prop_id_map,
             module_id_map=module_id_map,
+            batch_size=batch_size,
+            target_size=target_size,
+            interpolation=interpolation,
+            skip_similar_threshold=skip_similar_threshold,
+            detect_every=detect_every,
+            scene_change_threshold=scene_change_threshold,
+            media_backend=media_backend,
         )
 
         self.confidence_min = confidence_min
@@ -94,21 +112,18 @@ class CaffeClassifier(ImagesModule):
 
         labels_file = os.path.join(net_data_dir, "labels.txt")
         try:
-            with open(labels_file) as f:
-                self.labels = f.read().strip().splitlines()
-        except Exception as err:
-            log.error("Unable to parse file: " + labels_file)
+            self.labels = load_labels(labels_file)
+        except ValueError:
             log.error(traceback.format_exc())
-            raise ValueError(err)
+            raise
 
-        self.labels = {idx: label for idx, label in enumerate(self.labels)}
         # Set min conf for all labels to 0, but exclude logos in LOGOEXCLDUE
-        self.min_conf_filter = {}
-        for idx, label in self.labels.items():
-            min_conf = self.confidence_min
-            if isinstance(confidence_min_dict.get(label), numbers.Number):
-                min_conf = confidence_min_dict[label]
-            self.min_conf_filter[label] = min_conf
+        self.min_conf_filter, self.min_confs = label_thresholds(
+            self.labels, self.confidence_min, confidence_min_dict
+        )
+        self.exclude_mask = np.array(
+            [self.labels[idx] in LOGOEXCLUDE for idx in range(len(self.labels))]
+        )
 
         self.net = caffe.Net(
             os.path.join(net_data_dir, "deploy.prototxt"),
@@ -128,77 +143,66 @@ class CaffeClassifier(ImagesModule):
         self.transformer.set_transpose("data", (2, 0, 1))
 
     def process_images(self, images, tstamps, prev_regions):
-        # log.debug("Processing images")
-        # log.debug("tstamps: "  + str(tstamps))
+        """Classify a batch of frames (or of crops of prev_regions) with a
+        single forward pass
+
+        The data blob is reshaped to the size of the batch, and the top_n
+        labels of each frame (LOGOEXCLUDE labels aside) get a property.
+        Labels under their min_conf_filter threshold are "Unknown".
+        """
         assert len(images) == len(tstamps) == len(prev_regions)
-        for i, (frame, tstamp, prev_region) in enumerate(
-            zip(images, tstamps, prev_regions)
-        ):
+        inputs = []
+        for frame, tstamp, prev_region in zip(images, tstamps, prev_regions):
             log.debug("caffe classifier tstamp: " + str(tstamp))
             try:
                 if prev_region is not None:
-                    frame = crop_image_from_bbox_contour(frame, prev_region.get("contour"))
-
-                im = self.transformer.preprocess("data", frame)
-                self.net.blobs["data"].data[...] = im
-
-                # TODO : clean this up
-                probs = self.net.forward()[self.layer_name]
-                # log.debug("probs: " + str(probs))
-                # log.debug("probs.shape: " + str(probs.shape))
-                target_shape = (1, len(self.labels))
-                if (probs.shape == target_shape) is False:
-                    log.debug(
-                        "Changing shape " + str(probs.shape) + "->" + str(target_shape)
-                    )
-                    probs = np.reshape(probs, target_shape)
-
-                props = []
-                for p in probs:
-                    # log.debug('p: ' + str(p))
-                    p_indexes = np.argsort(p)
-                    p_indexes = np.flip(p_indexes, 0)
-                    while True:
-                        if len(p_indexes) == 1:
-                            break
-                        index = p_indexes[0]
-                        label = self.labels[index]
-                        log.debug("label: " + str(label))
-                        if label in LOGOEXCLUDE:
-                            p_indexes = np.delete(p_indexes, 0)
-                        else:
-                            break
-                    p_indexes = p_indexes[:self.top_n]
-
-                    # log.debug("p_indexes: " + str(p_indexes))
-
-                    for i, property_id in enumerate(p_indexes):
-                        if i == self.top_n:
-                            break
-                        index = p_indexes[i]
-                        label = self.labels[index]
-                        confidence = p[index]
-
-                        # TODO remove this unknown
-
-                        if confidence < self.confidence_min:
-                            label = "Unknown"
-                        prop = Property(
-                            server=self.name,
-                            ver=self.version,
-                            value=label,
-                            property_type=self.prop_type,
-                            confidence=float(confidence),
-                            confidence_min=float(self.confidence_min),
-                        )
-                        if prev_region is not None:
-                            prev_region.get("props").append(prop)
-                        else:
-                            props.append(prop)
-                if prev_region is None:
-                    self.response.append_region(
-                        t=tstamp, region=Region(props=props)
+                    frame = crop_image_from_bbox_contour(
+                        frame, prev_region.get("contour")
                     )
+                inputs.append((self.transformer.preprocess("data", frame),
+                               tstamp, prev_region))
             except Exception as e:
-                log.error(traceback.print_exc())
+                log.error(traceback.format_exc())
                 log.error(e)
+        if not inputs:
+            return
+
+        try:
+            probs = self._forward([im for im, _, _ in inputs])
+        except Exception as e:
+            log.error(traceback.format_exc())
+            log.error(e)
+            return
+
+        all_props = classification_props(
+            probs,
+            self.labels,
+            self.top_n,
+            self.min_confs,
+            self.exclude_mask,
+            server=self.name,
+            ver=self.version,
+            property_type=self.prop_type,
+        )
+        for (_, tstamp, prev_region), props in zip(inputs, all_props):
+            if prev_region is not None:
+                prev_region.get("props").extend(props)
+            else:
+                self.response.append_region(
+                    t=tstamp, region=Region(props=props)
+                )
+
+    def _forward(self, ims):
+        """Run one forward pass on preprocessed images
+
+        Returns:
+            np.ndarray: (len(ims), len(self.labels)) probabilities
+        """
+        data = self.net.blobs["data"]
+        if data.data.shape[0] != len(ims):
+            data.reshape(len(ims), *data.data.shape[1:])
+            self.net.reshape()
+        for i, im in enumerate(ims):
+            data.data[i] = im
+        probs = self.net.forward()[self.layer_name]
+        return np.reshape(probs, (len(ims), len(self.labels)))
@@ -0,0 +1,203 @@
+"""CPU inference of Caffe (or ONNX) classifiers with OpenCV's dnn module
+
+Drop-in replacement of CaffeClassifier on hosts without GPUs or py-caffe
+"""
+import os
+import traceback
+
+import cv2
+import glog as log
+import numpy as np
+
+from multivitamin.module import ImagesModule
+from multivitamin.module.imagesmodule import (BATCH_SIZE,
+                                              DEFAULT_INTERPOLATION)
+from multivitamin.data.response.utils import crop_image_from_bbox_contour
+from multivitamin.data.response.dtypes import Region
+from multivitamin.applications.utils import (
+    LOGOEXCLUDE,
+    load_labels,
+    label_thresholds,
+    classification_props,
+    caffe_input_shape,
+    onnx_input_shape,
+    load_mean_binaryproto,
+    dnn_blob,
+    cpu_dnn_net,
+)
+
+
+class DNNClassifier(ImagesModule):
+    def __init__(
+        self,
+        server_name,
+        version,
+        net_data_dir,
+        prop_type=None,
+        prop_id_map=None,
+        module_id_map=None,
+        confidence_min=0.1,
+        confidence_min_dict=None,
+        layer_name="prob",
+        top_n=1,
+        batch_size=BATCH_SIZE,
+        num_threads=None,
+        input_size=None,
+        anti_aliasing=True,
+        target_size=None,
+        interpolation=DEFAULT_INTERPOLATION,
+        skip_similar_threshold=None,
+        detect_every=1,
+        scene_change_threshold=None,
+        media_backend="opencv",
+    ):
+        """Classifier running a Caffe net_data_dir on CPU with cv2.dnn
+
+        net_data_dir has the layout of CaffeClassifier: deploy.prototxt,
+        model.caffemodel, labels.txt and an optional mean.binaryproto.
+        OpenCV 5 has no Caffe importer, model.onnx (e.g. the Caffe model
+        converted to ONNX) can replace deploy.prototxt and
+        model.caffemodel. Frames are preprocessed like caffe.io.Transformer
+        does and the properties are built by the same code as
+        CaffeClassifier.
+
+        Args:
+            server_name (str): module name
+            version (str): version
+            net_data_dir (str): directory of the model files
+            prop_type (str, optional): Defaults to "label".
+            prop_id_map (dict, optional): Defaults to None.
+            module_id_map (dict, optional): Defaults to None.
+            confidence_min (float, optional): Defaults to 0.1.
+            confidence_min_dict (dict, optional): min confidence per label
+            layer_name (str, optional): output layer. Defaults to "prob".
+            top_n (int, optional): properties per frame. Defaults to 1.
+            batch_size (int, optional): frames per forward pass
+            num_threads (int, optional): OpenCV threads, process-wide
+            input_size (tuple, optional): (width, height) of the network
+                                          input. Defaults to the input
+                                          shape of the model
+            anti_aliasing (bool, optional): smooth frames before
+                                            downscaling them, like
+                                            skimage>=0.15. See
+                                            caffe_io.resize_image
+            target_size (tuple, optional): (width, height) the frames
+                                           are decoded at, see
+                                           ImagesModule
+            interpolation (str, optional): interpolation used to
+                                           resize the frames
+            skip_similar_threshold (float, optional): see ImagesModule
+            detect_every (int, optional): see ImagesModule
+            scene_change_threshold (float, optional): see ImagesModule
+            media_backend (str, optional): see ImagesModule
+        """
+        super().__init__(
+            server_name,
+            version,
+            prop_type=prop_type,
+            prop_id_map=prop_id_map,
+            module_id_map=module_id_map,
+            batch_size=batch_size,
+            target_size=target_size,
+            interpolation=interpolation,
+            skip_similar_threshold=skip_similar_threshold,
+            detect_every=detect_every,
+            scene_change_threshold=scene_change_threshold,
+            media_backend=media_backend,
+        )
+        self.confidence_min = confidence_min
+        self.layer_name = layer_name
+        self.top_n = top_n
+        if not self.prop_type:
+            self.prop_type = "label"
+
+        log.info("Constructing DNNClassifier")
+        self.labels = load_labels(os.path.join(net_data_dir, "labels.txt"))
+        self.min_conf_filter, self.min_confs = label_thresholds(
+            self.labels, self.confidence_min, confidence_min_dict
+        )
+        self.exclude_mask = np.array(
+            [self.labels[idx] in LOGOEXCLUDE for idx in range(len(self.labels))]
+        )
+
+        prototxt = os.path.join(net_data_dir, "deploy.prototxt")
+        onnx_file = os.path.join(net_data_dir, "model.onnx")
+        if os.path.exists(prototxt):
+            log.info("Loading Caffe model")
+            if not hasattr(cv2.dnn, "readNetFromCaffe"):
+                # the Caffe importer was removed in OpenCV 5
+                raise ImportError(
+                    "package: opencv<5 (cv2.dnn.readNetFromCaffe) not found"
+                )
+            net = cv2.dnn.readNetFromCaffe(
+                prototxt, os.path.join(net_data_dir, "model.caffemodel")
+            )
+            model_file, input_shape = prototxt, caffe_input_shape(prototxt)
+        else:
+            log.info("Loading ONNX model")
+            net = cv2.dnn.readNetFromONNX(onnx_file)
+            model_file, input_shape = onnx_file, onnx_input_shape(onnx_file)
+        self.net = cpu_dnn_net(net, num_threads)
+        if input_size is None:
+            if (input_shape is None or len(input_shape) != 4 or
+                    None in input_shape[2:]):
+                raise ValueError(f"No input shape found in {model_file}")
+            input_size = (input_shape[3], input_shape[2])
+        self.input_size = tuple(input_size)
+        self.anti_aliasing = anti_aliasing
+
+        self.mean = None
+        mean_file = os.path.join(net_data_dir, "mean.binaryproto")
+        if os.path.exists(mean_file):
+            log.info("Setting meanfile")
+            self.mean = load_mean_binaryproto(mean_file)
+
+    def process_images(self, images, tstamps, prev_regions):
+        """Classify a batch of frames (or of crops of prev_regions) with a
+        single forward pass, like CaffeClassifier
+        """
+        assert len(images) == len(tstamps) == len(prev_regions)
+        inputs = []
+        for frame, tstamp, prev_region in zip(images, tstamps, prev_regions):
+            try:
+                if prev_region is not None:
+                    frame = crop_image_from_bbox_contour(
+                        frame, prev_region.get("contour")
+                    )
+                if frame.size == 0:
+                    raise ValueError(f"Empty frame at tstamp {tstamp}")
+                inputs.append((frame, tstamp, prev_region))
+            except Exception as e:
+                log.error(traceback.format_exc())
+                log.error(e)
+        if not inputs:
+            return
+
+        try:
+            self.net.setInput(dnn_blob([frame for frame, _, _ in inputs],
+                                       self.input_size, self.mean,
+                                       anti_aliasing=self.anti_aliasing))
+            probs = self.net.forward(self.layer_name)
+            probs = np.reshape(probs, (len(inputs), len(self.labels)))
+        except Exception as e:
+            log.error(traceback.format_exc())
+            log.error(e)
+            return
+
+        all_props = classification_props(
+            probs,
+            self.labels,
+            self.top_n,
+            self.min_confs,
+            self.exclude_mask,
+            server=self.name,
+            ver=self.version,
+            property_type=self.prop_type,
+        )
+        for (_, tstamp, prev_region), props in zip(inputs, all_props):
+            if prev_region is not None:
+                prev_region.get("props").extend(props)
+            else:
+                self.response.append_region(
+                    t=tstamp, region=Region(props=props)
+                )
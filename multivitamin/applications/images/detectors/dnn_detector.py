@@ -0,0 +1,178 @@
+"""CPU inference of Caffe SSD and TensorFlow object detection API models
+with OpenCV's dnn module
+
+Drop-in replacement of SSDDetector and TFDetector on hosts without GPUs,
+py-caffe or tensorflow
+"""
+import os
+
+import cv2
+import glog as log
+
+from multivitamin.module import ImagesModule
+from multivitamin.module.imagesmodule import (BATCH_SIZE,
+                                              DEFAULT_INTERPOLATION)
+from multivitamin.applications.utils import (
+    load_idmap,
+    parse_label_prototxt,
+    caffe_input_shape,
+    load_mean_binaryproto,
+    label_array,
+    lookup_labels,
+    detection_regions,
+    dnn_blob,
+    cpu_dnn_net,
+)
+
+TF_INPUT_SIZE = (300, 300)
+
+
+class DNNDetector(ImagesModule):
+    def __init__(
+        self,
+        server_name,
+        version,
+        net_data_dir,
+        confidence_min=0.3,
+        prop_type=None,
+        prop_id_map=None,
+        module_id_map=None,
+        batch_size=BATCH_SIZE,
+        num_threads=None,
+        input_size=None,
+        anti_aliasing=True,
+        target_size=None,
+        interpolation=DEFAULT_INTERPOLATION,
+        skip_similar_threshold=None,
+        detect_every=1,
+        scene_change_threshold=None,
+        media_backend="opencv",
+    ):
+        """Detector running a Caffe SSD or TF net_data_dir on CPU with
+        cv2.dnn
+
+        net_data_dir has the layout of SSDDetector (deploy.prototxt,
+        model.caffemodel, labelmap.prototxt and an optional
+        mean.binaryproto) or of TFDetector (frozen_inference_graph.pb and
+        idmap.txt). The TF graphs of the object detection API also need
+        the graph.pbtxt text graph generated for them by OpenCV's
+        tf_text_graph_*.py scripts. Caffe inputs are preprocessed like
+        caffe.io.Transformer does, TF inputs are resized by OpenCV.
+        Detections are decoded by the same code as SSDDetector, and TF
+        boxes are kept unbounded like TFDetector keeps them.
+
+        Args:
+            server_name (str): module name
+            version (str): version
+            net_data_dir (str): directory of the model files
+            confidence_min (float, optional): Defaults to 0.3.
+            prop_type (str, optional): Defaults to "object".
+            prop_id_map (dict, optional): Defaults to None.
+            module_id_map (dict, optional): Defaults to None.
+            batch_size (int, optional): frames per forward pass
+            num_threads (int, optional): OpenCV threads, process-wide
+            input_size (tuple, optional): (width, height) of the network
+                                          input. Defaults to the input
+                                          shape of deploy.prototxt, or
+                                          300x300 for TF graphs
+            anti_aliasing (bool, optional): smooth frames before
+                                            downscaling them for Caffe
+                                            models, see caffe_io.resize_image
+            target_size (tuple, optional): (width, height) the frames
+                                           are decoded at, see
+                                           ImagesModule
+            interpolation (str, optional): interpolation used to
+                                           resize the frames
+            skip_similar_threshold (float, optional): see ImagesModule
+            detect_every (int, optional): see ImagesModule
+            scene_change_threshold (float, optional): see ImagesModule
+            media_backend (str, optional): see ImagesModule
+        """
+        super().__init__(
+            server_name,
+            version,
+            prop_type=prop_type,
+            prop_id_map=prop_id_map,
+            module_id_map=module_id_map,
+            batch_size=batch_size,
+            target_size=target_size,
+            interpolation=interpolation,
+            skip_similar_threshold=skip_similar_threshold,
+            detect_every=detect_every,
+            scene_change_threshold=scene_change_threshold,
+            media_backend=media_backend,
+        )
+        self.confidence_min = confidence_min
+        if not self.prop_type:
+            self.prop_type = "object"
+
+        self.mean = None
+        prototxt = os.path.join(net_data_dir, "deploy.prototxt")
+        if os.path.exists(prototxt):
+            log.info("Loading Caffe SSD")
+            if not hasattr(cv2.dnn, "readNetFromCaffe"):
+                # the Caffe importer was removed in OpenCV 5
+                raise ImportError(
+                    "package: opencv<5 (cv2.dnn.readNetFromCaffe) not found"
+                )
+            net = cv2.dnn.readNetFromCaffe(
+                prototxt, os.path.join(net_data_dir, "model.caffemodel")
+            )
+            labelmap = parse_label_prototxt(
+                os.path.join(net_data_dir, "labelmap.prototxt")
+            )
+            if input_size is None:
+                input_shape = caffe_input_shape(prototxt)
+                if input_shape is None:
+                    raise ValueError(f"No input shape found in {prototxt}")
+                input_size = (input_shape[3], input_shape[2])
+            mean_file = os.path.join(net_data_dir, "mean.binaryproto")
+            if os.path.exists(mean_file):
+                log.info("Setting meanfile")
+                self.mean = load_mean_binaryproto(mean_file)
+            self.caffe_io = True
+            self.swap_rb = False
+        else:
+            log.info("Loading TF frozen graph")
+            pbtxt = os.path.join(net_data_dir, "graph.pbtxt")
+            net = cv2.dnn.readNetFromTensorflow(
+                os.path.join(net_data_dir, "frozen_inference_graph.pb"),
+                pbtxt if os.path.exists(pbtxt) else "",
+            )
+            labelmap = load_idmap(os.path.join(net_data_dir, "idmap.txt"))
+            input_size = input_size or TF_INPUT_SIZE
+            self.caffe_io = False
+            self.swap_rb = True
+
+        self.net = cpu_dnn_net(net, num_threads)
+        self.input_size = tuple(input_size)
+        self.anti_aliasing = anti_aliasing
+        self.labelmap = labelmap
+        self.labels = label_array(labelmap)
+        log.info(str(len(labelmap)) + " labels parsed.")
+
+    def process_images(self, images, tstamps, prev_detections=None):
+        """Detect objects in a batch of frames with a single forward pass,
+        like SSDDetector
+        """
+        self.net.setInput(dnn_blob(images, self.input_size, self.mean,
+                                   swap_rb=self.swap_rb,
+                                   caffe_io=self.caffe_io,
+                                   anti_aliasing=self.anti_aliasing))
+        predictions = self.net.forward().reshape(-1, 7)
+
+        regions = detection_regions(
+            len(images),
+            predictions[:, 0],
+            predictions[:, 3:7],
+            predictions[:, 2],
+            lookup_labels(self.labels, predictions[:, 1]),
+            confidence_min=self.confidence_min,
+            bound=self.caffe_io,
+            ver=self.version,
+            server=self.name,
+            property_type=self.prop_type,
+        )
+        for tstamp, frame_regions in zip(tstamps, regions):
+            if frame_regions:
+                self.response.append_regions(t=tstamp, regions=frame_regions)
@@ -31,16 +31,15 @@ except ImportError:
     raise ImportError("module: mmdet.apis not found")
     
 from multivitamin.module import ImagesModule
-from multivitamin.data.response.utils import (
-    crop_image_from_bbox_contour,
-    compute_box_area
+from multivitamin.module.imagesmodule import (BATCH_SIZE,
+                                              DEFAULT_INTERPOLATION)
+from multivitamin.applications.utils import (
+    label_array,
+    lookup_labels,
+    detection_regions,
 )
-from multivitamin.data.response.dtypes import (
-    create_bbox_contour_from_points,
-    Region,
-    Property,
-)
-from multivitamin.applications.utils import load_idmap
+
+WARMUP_SHAPES = [(720, 1280)]
 
 
 class MMDetector(ImagesModule):
@@ -55,9 +54,17 @@ class MMDetector(ImagesModule):
         prop_id_map=None,
         module_id_map=None,
         gpuid=0,
+        batch_size=BATCH_SIZE,
+        warmup_shapes=WARMUP_SHAPES,
+        target_size=None,
+        interpolation=DEFAULT_INTERPOLATION,
+        skip_similar_threshold=None,
+        detect_every=1,
+        scene_change_threshold=None,
+        media_backend="opencv",
     ):
         """Inference module for https://github.com/open-mmlab/mmdetection/
-        
+
         Args:
             server_name (str): module name
             version (str): version
@@ -68,6 +75,21 @@ class MMDetector(ImagesModule):
             prop_id_map (dict, optional): Defaults to None.
             module_id_map (dict, optional): Defaults to None.
             gpuid (int, optional): Defaults to 0.
+            batch_size (int, optional): max number of frames per inference
+            warmup_shapes (list[tuple], optional): (height, width) of the
+                                                   frames to expect, a
+                                                   batch of batch_size
+                                                   dummy frames of each is
+                                                   run at init
+            target_size (tuple, optional): (width, height) the frames
+                                           are decoded at, see
+                                           ImagesModule
+            interpolation (str, optional): interpolation used to
+                                           resize the frames
+            skip_similar_threshold (float, optional): see ImagesModule
+            detect_every (int, optional): see ImagesModule
+            scene_change_threshold (float, optional): see ImagesModule
+            media_backend (str, optional): see ImagesModule
         """
         super().__init__(
             server_name,
@@ -75,6 +97,13 @@ class MMDetector(ImagesModule):
             prop_type=prop_type,
             prop_id_map=prop_id_map,
             module_id_map=module_id_map,
+            batch_size=batch_size,
+            target_size=target_size,
+            interpolation=interpolation,
+            skip_similar_threshold=skip_similar_threshold,
+            detect_every=detect_every,
+            scene_change_threshold=scene_change_threshold,
+            media_backend=media_backend,
         )
         self.confidence_min = confidence_min
         if not self.prop_type:
@@ -88,49 +117,68 @@ class MMDetector(ImagesModule):
             raise ValueError("config_file and/or model_file does not exist")
         try:
             self.model = init_detector(config_file, model_file, device="cuda:{}".format(gpuid))
-            dummy_image= np.zeros((720, 1280, 3), dtype = "uint8")
-            images=[dummy_image]
-            tstamps=[0.0]
-            self.process_images(images, tstamps)
-            log.info('dummy forward pass successful')
-        except:
+            self.labels = label_array(dict(enumerate(self.model.CLASSES)))
+            self.warmup(warmup_shapes)
+        except Exception:
+            log.error(traceback.format_exc())
             raise ValueError("Could not init_detector")
 
+    def warmup(self, shapes):
+        """Run batches of batch_size dummy frames of each (height, width)
+
+        Args:
+            shapes (list[tuple]): (height, width) of the frames
+        """
+        for height, width in shapes:
+            dummy_image = np.zeros((height, width, 3), dtype="uint8")
+            self._inference([dummy_image] * self.batch_size)
+            log.info(f"dummy forward pass of {self.batch_size}x{height}x{width}"
+                     " successful")
+
+    def _inference(self, images):
+        """Run mmdet's inference on a list of frames
+
+        Returns:
+            list: bbox results of each frame, a list of (k, 5) arrays
+                  (xmin, ymin, xmax, ymax, confidence) per class
+        """
+        results = list(inference_detector(self.model, list(images)))
+        # models with masks return (bbox_result, segm_result)
+        return [r[0] if isinstance(r, tuple) else r for r in results]
+
     def process_images(self, images, tstamps, prev_regions=None):
-        for frame, tstamp in zip(images, tstamps):
-            predictions = inference_detector(self.model, frame)
-
-            for pred_idx, pred in enumerate(predictions):
-                try:
-                    for xmin, ymin, xmax, ymax, confidence in pred:
-                        if confidence < self.confidence_min:
-                            continue
-                        label = self.model.CLASSES[pred_idx]
-
-                        xmin_n = xmin / frame.shape[1]
-                        xmax_n = xmax / frame.shape[1]
-                        ymin_n = ymin / frame.shape[0]
-                        ymax_n = ymax / frame.shape[0]
-
-                        contour = create_bbox_contour_from_points(
-                            xmin_n, ymin_n, xmax_n, ymax_n, bound=True
-                        )
-
-                        area = compute_box_area(contour)
-
-                        prop = Property(
-                                confidence=float(confidence),
-                                confidence_min=self.confidence_min,
-                                ver=self.version,
-                                server=self.name,
-                                value=label,
-                                property_type=self.prop_type,
-                                fraction=area,
-                            )
-
-                        self.response.append_region(
-                            t=tstamp, region=Region(contour=contour, props=[prop])
-                        )
-
-                except Exception:
-                    log.error(traceback.format_exc())
+        """Detect objects in a batch of frames with a single inference call
+
+        The boxes of all the classes and frames are gathered into one array
+        to be normalized and filtered with numpy.
+        """
+        image_ids, class_ids, boxes = [], [], []
+        for image_id, (frame, result) in enumerate(
+            zip(images, self._inference(images))
+        ):
+            if not len(result):
+                continue
+            dets = np.concatenate(result).reshape(-1, 5)
+            image_ids.append(np.full(len(dets), image_id))
+            class_ids.append(np.repeat(np.arange(len(result)),
+                                       [len(r) for r in result]))
+            height, width = frame.shape[:2]
+            boxes.append(dets / [width, height, width, height, 1.0])
+        if not boxes:
+            return
+        boxes = np.concatenate(boxes)
+
+        regions = detection_regions(
+            len(images),
+            np.concatenate(image_ids),
+            boxes[:, :4],
+            boxes[:, 4],
+            lookup_labels(self.labels, np.concatenate(class_ids)),
+            confidence_min=self.confidence_min,
+            ver=self.version,
+            server=self.name,
+            property_type=self.prop_type,
+        )
+        for tstamp, frame_regions in zip(tstamps, regions):
+            if frame_regions:
+                self.response.append_regions(t=tstamp, regions=frame_regions)
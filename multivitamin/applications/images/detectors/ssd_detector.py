@@ -43,16 +43,15 @@ from google.protobuf import text_format
 from caffe.proto import caffe_pb2 as cpb2
 
 from multivitamin.module import ImagesModule
-from multivitamin.data.response.utils import (
-    crop_image_from_bbox_contour,
-    compute_box_area
+from multivitamin.module.imagesmodule import (BATCH_SIZE,
+                                              DEFAULT_INTERPOLATION)
+from multivitamin.applications.utils import (
+    load_idmap,
+    load_label_prototxt,
+    label_array,
+    lookup_labels,
+    detection_regions,
 )
-from multivitamin.data.response.dtypes import (
-    create_bbox_contour_from_points,
-    Region,
-    Property,
-)
-from multivitamin.applications.utils import load_idmap, load_label_prototxt
 
 LAYER_NAME = "detection_out"
 
@@ -68,6 +67,13 @@ class SSDDetector(ImagesModule):
         prop_id_map=None,
         module_id_map=None,
         gpuid=0,
+        batch_size=BATCH_SIZE,
+        target_size=None,
+        interpolation=DEFAULT_INTERPOLATION,
+        skip_similar_threshold=None,
+        detect_every=1,
+        scene_change_threshold=None,
+        media_backend="opencv",
     ):
         super().__init__(
             server_name,
@@ -75,6 +81,13 @@ class SSDDetector(ImagesModule):
             prop_type=prop_type,
             prop_id_map=prop_id_map,
             module_id_map=module_id_map,
+            batch_size=batch_size,
+            target_size=target_size,
+            interpolation=interpolation,
+            skip_similar_threshold=skip_similar_threshold,
+            detect_every=detect_every,
+            scene_change_threshold=scene_change_threshold,
+            media_backend=media_backend,
         )
         self.confidence_min = confidence_min
         if not self.prop_type:
@@ -86,6 +99,7 @@ class SSDDetector(ImagesModule):
         idmap_file = os.path.join(net_data_dir, "labelmap.prototxt")
         self.labelmap = load_label_prototxt(idmap_file)
         log.info(str(len(self.labelmap.keys())) + " labels parsed.")
+        self.labels = label_array(self.labelmap)
 
         self.net = caffe.Net(
             os.path.join(net_data_dir, "deploy.prototxt"),
@@ -107,38 +121,30 @@ class SSDDetector(ImagesModule):
         self.transformer.set_transpose("data", (2, 0, 1))
 
     def process_images(self, images, tstamps, prev_detections=None):
-        for frame, tstamp in zip(images, tstamps):
-            im = self.transformer.preprocess("data", frame)
-            self.net.blobs["data"].data[...] = im
-            predictions = self.net.forward()[LAYER_NAME]
-
-            for pred_idx in range(predictions.shape[2]):
-                try:
-                    confidence = float(predictions[0, 0, pred_idx, 2])
-                    if confidence < self.confidence_min:
-                        continue
-                    index = int(predictions[0, 0, pred_idx, 1])
-                    label = self.labelmap[index]
-                    xmin = float(predictions[0, 0, pred_idx, 3])
-                    ymin = float(predictions[0, 0, pred_idx, 4])
-                    xmax = float(predictions[0, 0, pred_idx, 5])
-                    ymax = float(predictions[0, 0, pred_idx, 6])
-
-                    contour = create_bbox_contour_from_points(
-                        xmin, ymin, xmax, ymax, bound=True
-                    )
-                    area = compute_box_area(contour)
-                    prop = Property(
-                            confidence=confidence,
-                            confidence_min=self.confidence_min,
-                            ver=self.version,
-                            server=self.name,
-                            value=label,
-                            property_type=self.prop_type,
-                            fraction=area,
-                        )
-                    self.response.append_region(
-                        t=tstamp, region=Region(contour=contour, props=[prop])
-                    )
-                except Exception:
-                    log.error(traceback.format_exc())
+        """Detect objects in a batch of frames with a single forward pass
+
+        The detections of all the frames come out of the same detection_out
+        blob, column 0 holding the index of their frame in the batch.
+        """
+        data = self.net.blobs["data"]
+        if data.data.shape[0] != len(images):
+            data.reshape(len(images), *data.data.shape[1:])
+            self.net.reshape()
+        for i, frame in enumerate(images):
+            data.data[i] = self.transformer.preprocess("data", frame)
+        predictions = self.net.forward()[LAYER_NAME].reshape(-1, 7)
+
+        regions = detection_regions(
+            len(images),
+            predictions[:, 0],
+            predictions[:, 3:7],
+            predictions[:, 2],
+            lookup_labels(self.labels, predictions[:, 1]),
+            confidence_min=self.confidence_min,
+            ver=self.version,
+            server=self.name,
+            property_type=self.prop_type,
+        )
+        for tstamp, frame_regions in zip(tstamps, regions):
+            if frame_regions:
+                self.response.append_regions(t=tstamp, regions=frame_regions)
@@ -30,50 +30,103 @@ from google.protobuf import text_format
 
 from multivitamin.utils.GPUUtilities import GPUUtility
 from multivitamin.module import ImagesModule
-from multivitamin.data.response.utils import (
-    crop_image_from_bbox_contour,
-    compute_box_area
+from multivitamin.module.imagesmodule import (BATCH_SIZE,
+                                              DEFAULT_INTERPOLATION)
+from multivitamin.applications.utils import (
+    label_array,
+    lookup_labels,
+    detection_regions,
 )
-from multivitamin.data.response.dtypes import (
-    create_bbox_contour_from_points,
-    Region,
-    Property,
-    Point
-)
-from multivitamin.applications.utils import load_idmap, load_label_prototxt
 
 CONFIDENCE_MIN = 0.3
+TENSOR_NAMES = [
+    "detection_boxes:0",
+    "detection_scores:0",
+    "detection_classes:0",
+    "num_detections:0",
+]
 
 
 class TFDetector(ImagesModule):
     def __init__(
-        self, 
-        server_name, 
-        version, 
+        self,
+        server_name,
+        version,
         net_data_dir,
         prop_type=None,
         prop_id_map=None,
         module_id_map=None,
+        confidence_min=CONFIDENCE_MIN,
+        batch_size=BATCH_SIZE,
+        use_gpu=True,
+        target_size=None,
+        interpolation=DEFAULT_INTERPOLATION,
+        skip_similar_threshold=None,
+        detect_every=1,
+        scene_change_threshold=None,
+        media_backend="opencv",
         **gpukwargs
     ):
+        """Inference module for frozen TensorFlow object detection API graphs
+
+        Args:
+            server_name (str): module name
+            version (str): version
+            net_data_dir (str): directory of frozen_inference_graph.pb and
+                                idmap.txt
+            prop_type (str, optional): Defaults to "object".
+            prop_id_map (dict, optional): Defaults to None.
+            module_id_map (dict, optional): Defaults to None.
+            confidence_min (float, optional): Defaults to 0.3.
+            batch_size (int, optional): max number of frames per session run
+            use_gpu (bool, optional): False to run on CPU only, without
+                                      looking for GPUs
+            target_size (tuple, optional): (width, height) the frames
+                                           are decoded at, see
+                                           ImagesModule
+            interpolation (str, optional): interpolation used to
+                                           resize the frames
+            skip_similar_threshold (float, optional): see ImagesModule
+            detect_every (int, optional): see ImagesModule
+            scene_change_threshold (float, optional): see ImagesModule
+            media_backend (str, optional): see ImagesModule
+            **gpukwargs: arguments of GPUUtility
+        """
         super().__init__(
-            server_name, 
-            version, 
+            server_name,
+            version,
             prop_type=prop_type,
             prop_id_map=prop_id_map,
-            module_id_map=module_id_map
+            module_id_map=module_id_map,
+            batch_size=batch_size,
+            target_size=target_size,
+            interpolation=interpolation,
+            skip_similar_threshold=skip_similar_threshold,
+            detect_every=detect_every,
+            scene_change_threshold=scene_change_threshold,
+            media_backend=media_backend,
         )
         self.server_name = server_name
         self.version = version
+        self.confidence_min = confidence_min
 
         if not self.prop_type:
-            self.prop_type="object" 
-        gpu_util = GPUUtility(**gpukwargs)
-        available_devices = gpu_util.get_gpus()
-        log.info("Found GPU devices: {}".format(available_devices))
-        if available_devices:
-            os.environ["CUDA_DEVICE_ORDER"]="PCI_BUS_ID"
-            os.environ["CUDA_VISIBLE_DEVICES"]= ",".join([str(gpu) for gpu in available_devices])
+            self.prop_type = "object"
+        cfg = tf.ConfigProto()
+        if use_gpu:
+            gpu_util = GPUUtility(**gpukwargs)
+            available_devices = gpu_util.get_gpus()
+            log.info("Found GPU devices: {}".format(available_devices))
+            if available_devices:
+                os.environ["CUDA_DEVICE_ORDER"] = "PCI_BUS_ID"
+                os.environ["CUDA_VISIBLE_DEVICES"] = ",".join(
+                    [str(gpu) for gpu in available_devices]
+                )
+            cfg.gpu_options.allow_growth = True
+        else:
+            log.info("Running on CPU")
+            cfg.device_count["GPU"] = 0
+
         self.label_map = dict()
         labelmap_file = os.path.join(net_data_dir, 'idmap.txt')
         try:
@@ -87,8 +140,16 @@ class TFDetector(ImagesModule):
             log.error("Unable to parse file: " + labelmap_file)
             log.error(traceback.format_exc())
             exit(1)
+        labelmap = {}
+        for label_id, label in self.label_map.items():
+            try:
+                labelmap[int(label_id)] = label
+            except ValueError:
+                log.warning(f"Ignoring label {label} of non-numeric id"
+                            f" {label_id} in {labelmap_file}")
+        self.labels = label_array(labelmap)
 
-        model = os.path.join(net_data_dir,'frozen_inference_graph.pb')
+        model = os.path.join(net_data_dir, 'frozen_inference_graph.pb')
         detection_graph = tf.Graph()
         with detection_graph.as_default():
             od_graph_def = tf.GraphDef()
@@ -97,44 +158,46 @@ class TFDetector(ImagesModule):
                 od_graph_def.ParseFromString(serialized_graph)
                 tf.import_graph_def(od_graph_def, name='')
         self._detection_graph = detection_graph
-        cfg = tf.ConfigProto()
-        cfg.gpu_options.allow_growth = True
-        self._sess =  tf.Session(graph=detection_graph, config=cfg)
-        
+        self._image_tensor = detection_graph.get_tensor_by_name('image_tensor:0')
+        self._output_tensors = [
+            detection_graph.get_tensor_by_name(name) for name in TENSOR_NAMES
+        ]
+        self._sess = tf.Session(graph=detection_graph, config=cfg)
 
     def process_images(self, images, tstamps, detections_of_interest=None):
-        image_tensor = self._detection_graph.get_tensor_by_name('image_tensor:0')
-        detection_boxes = self._detection_graph.get_tensor_by_name('detection_boxes:0')
-        detection_scores = self._detection_graph.get_tensor_by_name('detection_scores:0')
-        detection_classes = self._detection_graph.get_tensor_by_name('detection_classes:0')
-        num_pred_detections = self._detection_graph.get_tensor_by_name('num_detections:0')
+        """Detect objects in a batch of frames
 
-        for frame, tstamp in zip(images, tstamps):
-            frame_np = np.array(frame)
-            frame_np = frame_np[...,::-1]
-            frame_np_expanded = np.expand_dims(frame_np, axis=0)
-            (detections, scores, classes, num) = self._sess.run([detection_boxes, detection_scores, detection_classes, num_pred_detections], feed_dict={image_tensor: frame_np_expanded})
-            num = int(num[0])
-            for det_idx in range(num):
-                try:
-                    confidence = float(scores[0,det_idx])
-                    if confidence < CONFIDENCE_MIN:
-                        continue
-                    xmin = float(detections[0,det_idx,1])
-                    ymin = float(detections[0,det_idx,0])
-                    xmax = float(detections[0,det_idx,3])
-                    ymax = float(detections[0,det_idx,2])
-                    contour = [Point(xmin, ymin), Point(xmax, ymin), Point(xmax, ymax), Point(xmin, ymax)]
-                    prop = Property(
-                           property_type=self.prop_type,
-                           server=self.server_name,
-                           ver=self.version,
-                           value = str(self.label_map[str(int(classes[0,det_idx]))]),
-                           confidence=confidence,
-                           confidence_min=CONFIDENCE_MIN
-                           )
-                    region = Region(contour, [prop])
-                    self.response.append_region(t=tstamp, region=region)
+        Frames of the same size are stacked into one image_tensor batch,
+        i.e. one session run per frame size.
+        """
+        buckets = {}
+        for idx, frame in enumerate(images):
+            buckets.setdefault(np.shape(frame), []).append(idx)
 
-                except Exception as e:
-                    log.error(traceback.format_exc())
+        for indices in buckets.values():
+            batch = np.stack([np.asarray(images[idx])[..., ::-1]
+                              for idx in indices])
+            boxes, scores, classes, num = self._sess.run(
+                self._output_tensors, feed_dict={self._image_tensor: batch}
+            )
+            # only the first num[i] detections of image i are valid
+            valid = np.arange(scores.shape[1]) < num[:, None]
+            image_ids = np.broadcast_to(
+                np.arange(len(indices))[:, None], scores.shape
+            )
+            regions = detection_regions(
+                len(indices),
+                image_ids[valid],
+                boxes[valid][:, [1, 0, 3, 2]],  # ymin, xmin, ymax, xmax
+                scores[valid],
+                lookup_labels(self.labels, classes[valid]),
+                confidence_min=self.confidence_min,
+                bound=False,
+                property_type=self.prop_type,
+                server=self.server_name,
+                ver=self.version,
+            )
+            for idx, frame_regions in zip(indices, regions):
+                if frame_regions:
+                    self.response.append_regions(t=tstamps[idx],
+                                                 regions=frame_regions)
@@ -116,9 +116,11 @@ class FrameDrawer(PropertiesModule):
         frames_iterator = []
         if tstamps_of_interest is not None:
             if type(tstamps_of_interest) is list:
-                for t in tstamps_of_interest:
-                    frame = self.med_ret.get_frame(tstamp=t)
-                    frames_iterator.append((frame, t))
+                frames = self.med_ret.get_frames(tstamps_of_interest)
+                frames_iterator = [
+                    (frame, t) for frame, t in zip(frames, tstamps_of_interest)
+                    if frame is not None
+                ]
         else:
             try:
                 frames_iterator = self.med_ret.get_frames_iterator(
@@ -0,0 +1,95 @@
+"""Protobuf messages of Caffe and ONNX model files
+
+Only the fields multivitamin reads are declared, so that model files can
+be parsed without caffe or onnx: the protobuf parser skips the others.
+Field numbers are the ones of caffe.proto and onnx.proto.
+"""
+try:
+    from google.protobuf import descriptor_pb2, descriptor_pool, text_format
+    from google.protobuf import message_factory
+except ImportError:
+    raise ImportError("package: protobuf not found")
+
+CAFFE_PROTO = """
+name: "multivitamin/caffe.proto"
+package: "caffe"
+syntax: "proto2"
+message_type {
+  name: "BlobShape"
+  field { name: "dim" number: 1 label: LABEL_REPEATED type: TYPE_INT64 }
+}
+message_type {
+  name: "BlobProto"
+  field { name: "num" number: 1 label: LABEL_OPTIONAL type: TYPE_INT32 }
+  field { name: "channels" number: 2 label: LABEL_OPTIONAL type: TYPE_INT32 }
+  field { name: "height" number: 3 label: LABEL_OPTIONAL type: TYPE_INT32 }
+  field { name: "width" number: 4 label: LABEL_OPTIONAL type: TYPE_INT32 }
+  field { name: "data" number: 5 label: LABEL_REPEATED type: TYPE_FLOAT }
+  field { name: "shape" number: 7 label: LABEL_OPTIONAL type: TYPE_MESSAGE
+          type_name: ".caffe.BlobShape" }
+  field { name: "double_data" number: 8 label: LABEL_REPEATED
+          type: TYPE_DOUBLE }
+}
+"""
+
+ONNX_PROTO = """
+name: "multivitamin/onnx.proto"
+package: "onnx"
+syntax: "proto2"
+message_type {
+  name: "TensorShapeProto"
+  field { name: "dim" number: 1 label: LABEL_REPEATED type: TYPE_MESSAGE
+          type_name: ".onnx.TensorShapeProto.Dimension" }
+  nested_type {
+    name: "Dimension"
+    field { name: "dim_value" number: 1 label: LABEL_OPTIONAL
+            type: TYPE_INT64 oneof_index: 0 }
+    field { name: "dim_param" number: 2 label: LABEL_OPTIONAL
+            type: TYPE_STRING oneof_index: 0 }
+    oneof_decl { name: "value" }
+  }
+}
+message_type {
+  name: "TypeProto"
+  field { name: "tensor_type" number: 1 label: LABEL_OPTIONAL
+          type: TYPE_MESSAGE type_name: ".onnx.TypeProto.Tensor" }
+  nested_type {
+    name: "Tensor"
+    field { name: "elem_type" number: 1 label: LABEL_OPTIONAL
+            type: TYPE_INT32 }
+    field { name: "shape" number: 2 label: LABEL_OPTIONAL type: TYPE_MESSAGE
+            type_name: ".onnx.TensorShapeProto" }
+  }
+}
+message_type {
+  name: "ValueInfoProto"
+  field { name: "name" number: 1 label: LABEL_OPTIONAL type: TYPE_STRING }
+  field { name: "type" number: 2 label: LABEL_OPTIONAL type: TYPE_MESSAGE
+          type_name: ".onnx.TypeProto" }
+}
+message_type {
+  name: "GraphProto"
+  field { name: "input" number: 11 label: LABEL_REPEATED type: TYPE_MESSAGE
+          type_name: ".onnx.ValueInfoProto" }
+}
+message_type {
+  name: "ModelProto"
+  field { name: "graph" number: 7 label: LABEL_OPTIONAL type: TYPE_MESSAGE
+          type_name: ".onnx.GraphProto" }
+}
+"""
+
+_POOL = descriptor_pool.DescriptorPool()
+for _proto in (CAFFE_PROTO, ONNX_PROTO):
+    _POOL.Add(text_format.Parse(_proto, descriptor_pb2.FileDescriptorProto()))
+
+
+def _message_class(full_name):
+    descriptor = _POOL.FindMessageTypeByName(full_name)
+    if hasattr(message_factory, "GetMessageClass"):
+        return message_factory.GetMessageClass(descriptor)
+    return message_factory.MessageFactory(_POOL).GetPrototype(descriptor)
+
+
+BlobProto = _message_class("caffe.BlobProto")
+ModelProto = _message_class("onnx.ModelProto")
@@ -1,4 +1,15 @@
 import os
+import re
+import numbers
+
+import cv2
+import numpy as np
+
+from multivitamin.data.response.dtypes import Point, Property, Region
+from multivitamin.module.utils import top_n_predictions
+from multivitamin.applications.caffe_io import resize_image
+
+LOGOEXCLUDE = ["Garbage", "Messy", "MessyDark"]
 
 
 def load_idmap(idmap_file):
@@ -35,3 +46,329 @@ def load_label_prototxt(prototxt_file):
             label = item.display_name
             labelmap[index] = label
     return labelmap
+
+
+def parse_label_prototxt(prototxt_file):
+    """Parse a Caffe SSD labelmap.prototxt without caffe, like
+    load_label_prototxt
+
+    Args:
+        prototxt_file (str): filepath to labelmap.prototxt
+
+    Returns:
+        dict: labelmap (key=label index, value=display_name)
+    """
+    with open(prototxt_file) as f:
+        text = f.read()
+    labelmap = {}
+    for item in re.findall(r"item\s*\{([^}]*)\}", text):
+        label = re.search(r"\blabel\s*:\s*(-?\d+)", item)
+        display_name = re.search(r"\bdisplay_name\s*:\s*[\"']([^\"']*)[\"']",
+                                 item)
+        if label is not None and display_name is not None:
+            labelmap[int(label.group(1))] = display_name.group(1)
+    return labelmap
+
+
+def caffe_input_shape(prototxt_file):
+    """Read the (num, channels, height, width) input shape of a Caffe
+    deploy.prototxt, declared with input_shape, input_dim or an Input layer
+
+    Returns:
+        tuple: input shape, None if not found
+    """
+    with open(prototxt_file) as f:
+        text = f.read()
+    dims = re.findall(r"\b(?:input_dim|dim)\s*:\s*(\d+)", text)
+    if len(dims) < 4:
+        return None
+    return tuple(int(dim) for dim in dims[:4])
+
+
+def onnx_input_shape(model_file):
+    """Read the shape of the first input of an ONNX model, without onnx
+
+    Returns:
+        tuple: input shape, with None for dynamic dimensions, or None if
+               not found
+    """
+    from multivitamin.applications.protos import ModelProto
+
+    with open(model_file, "rb") as rf:
+        model = ModelProto.FromString(rf.read())
+    if not model.graph.input:
+        return None
+    tensor_type = model.graph.input[0].type.tensor_type
+    if not tensor_type.HasField("shape"):
+        return None
+    return tuple(dim.dim_value if dim.HasField("dim_value") else None
+                 for dim in tensor_type.shape.dim)
+
+
+def load_mean_binaryproto(mean_file):
+    """Read the mean of a Caffe mean.binaryproto (a BlobProto) without caffe
+
+    Returns:
+        np.ndarray: squeezed mean, like
+                    np.squeeze(caffe.io.blobproto_to_array(blob))
+    """
+    from multivitamin.applications.protos import BlobProto
+
+    with open(mean_file, "rb") as rf:
+        blob = BlobProto.FromString(rf.read())
+    data = np.array(blob.double_data or blob.data, dtype=np.float32)
+    if any(blob.HasField(dim) for dim in ("num", "channels", "height",
+                                          "width")):
+        shape = (blob.num, blob.channels, blob.height, blob.width)
+    else:
+        shape = tuple(blob.shape.dim)
+    return np.squeeze(data.reshape(shape))
+
+
+def load_labels(labels_file):
+    """Load a labels.txt file, one label per line
+
+    Returns:
+        dict: labels (key=index, value=string)
+
+    Raises:
+        ValueError: if the file cannot be read
+    """
+    try:
+        with open(labels_file) as f:
+            labels = f.read().strip().splitlines()
+    except Exception as err:
+        raise ValueError(f"Unable to parse file: {labels_file}: {err}")
+    return {idx: label for idx, label in enumerate(labels)}
+
+
+def label_thresholds(labels, confidence_min, confidence_min_dict=None):
+    """Get the min confidence of each label
+
+    Args:
+        labels (dict): key=index, value=string
+        confidence_min (float): default min confidence
+        confidence_min_dict (dict): min confidence of some labels
+
+    Returns:
+        tuple: (dict of label to min confidence, array of the min
+               confidences by label index)
+    """
+    if confidence_min_dict is None:
+        confidence_min_dict = {}
+    min_conf_filter = {}
+    for idx, label in labels.items():
+        min_conf = confidence_min
+        if isinstance(confidence_min_dict.get(label), numbers.Number):
+            min_conf = confidence_min_dict[label]
+        min_conf_filter[label] = min_conf
+    min_confs = np.array(
+        [min_conf_filter[labels[idx]] for idx in range(len(labels))],
+        dtype=np.float64,
+    )
+    return min_conf_filter, min_confs
+
+
+def classification_props(
+    probs,
+    labels,
+    top_n,
+    min_confs,
+    exclude_mask=None,
+    **prop_kwargs
+):
+    """Build the properties of the top_n labels of each row of probs
+
+    Labels under their min confidence are "Unknown".
+
+    Args:
+        probs (np.ndarray): (num_images, num_labels) probabilities
+        labels (dict): key=index, value=string
+        top_n (int): max number of properties per image
+        min_confs (np.ndarray): (num_labels,) min confidence of each label
+        exclude_mask (np.ndarray): (num_labels,) True for labels never
+                                   predicted (see top_n_predictions)
+        **prop_kwargs: other fields of the properties, e.g. server, ver,
+                       property_type
+
+    Returns:
+        list[list[Property]]: properties of each image
+    """
+    top = top_n_predictions(probs, top_n, exclude_mask)
+    confidences = np.take_along_axis(probs, top, axis=1)
+    out = []
+    for indices, confs in zip(top.tolist(), confidences.tolist()):
+        props = []
+        for index, confidence in zip(indices, confs):
+            label = labels[index]
+            min_conf = float(min_confs[index])
+            # TODO remove this unknown
+            if confidence < min_conf:
+                label = "Unknown"
+            props.append(Property(
+                value=label,
+                confidence=confidence,
+                confidence_min=min_conf,
+                **prop_kwargs
+            ))
+        out.append(props)
+    return out
+
+
+def dnn_blob(images, size, mean=None, swap_rb=False, caffe_io=True,
+             anti_aliasing=True):
+    """Preprocess images into one NCHW float32 blob for cv2.dnn, like
+    caffe.io.Transformer with a mean and a (2, 0, 1) transpose
+
+    Args:
+        images (list[np.ndarray]): BGR images, of any sizes
+        size (tuple): (width, height) of the network input
+        mean (np.ndarray): (channels,) or (channels, height, width) mean to
+                           subtract, e.g. from load_mean_binaryproto
+        swap_rb (bool): convert the images to RGB
+        caffe_io (bool): resize the images like caffe.io.Transformer (see
+                         caffe_io.resize_image), else with OpenCV's
+                         bilinear resize
+        anti_aliasing (bool): see caffe_io.resize_image
+
+    Returns:
+        np.ndarray: (len(images), channels, height, width) blob
+    """
+    width, height = size
+    images = [np.asarray(image, dtype=np.float32) for image in images]
+    if caffe_io:
+        # Transformer only resizes the images of another size
+        blob = np.stack([
+            image if image.shape[:2] == (height, width)
+            else resize_image(image, size, anti_aliasing)
+            for image in images
+        ]).transpose(0, 3, 1, 2)
+        if swap_rb:
+            blob = blob[:, ::-1]
+        blob = np.ascontiguousarray(blob)
+    else:
+        blob = cv2.dnn.blobFromImages(images, 1.0, (width, height),
+                                      swapRB=swap_rb, crop=False)
+    if mean is not None:
+        mean = np.asarray(mean, dtype=np.float32)
+        if mean.ndim == 1:
+            mean = mean[:, None, None]
+        blob -= mean
+    return blob
+
+
+def cpu_dnn_net(net, num_threads=None):
+    """Run a cv2.dnn network with OpenCV's own CPU backend
+
+    Args:
+        net (cv2.dnn_Net): network
+        num_threads (int): threads used by OpenCV, None to keep the
+                           default. Note that this is set process-wide
+    """
+    net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+    net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+    if num_threads is not None:
+        cv2.setNumThreads(num_threads)
+    return net
+
+
+def label_array(labelmap):
+    """Convert a labelmap to an array, to look up labels with numpy indexing
+
+    Args:
+        labelmap (dict): key=index, value=string
+
+    Returns:
+        np.ndarray: object array of the labels, None for missing indices
+    """
+    labels = np.full(max(labelmap, default=-1) + 1, None, dtype=object)
+    for index, label in labelmap.items():
+        labels[index] = label
+    return labels
+
+
+def lookup_labels(labels, indices):
+    """Look up the labels of an array of indices
+
+    Args:
+        labels (np.ndarray): see label_array
+        indices (np.ndarray): label indices, of any numeric dtype
+
+    Returns:
+        np.ndarray: object array of labels, None for unknown indices
+    """
+    indices = np.asarray(indices).astype(np.int64)
+    valid = (indices >= 0) & (indices < len(labels))
+    out = np.full(len(indices), None, dtype=object)
+    out[valid] = labels[indices[valid]]
+    return out
+
+
+def detection_regions(
+    num_images,
+    image_ids,
+    boxes,
+    confidences,
+    labels,
+    confidence_min=0.0,
+    bound=True,
+    **prop_kwargs
+):
+    """Build the Regions of a batch of detections
+
+    Detections under confidence_min, with an unknown label or an image id
+    out of the batch (e.g. the -1 padding of Caffe's detection_out) are
+    filtered out with array masks. If bound, boxes are clamped to the
+    image, and the area of each box is computed, as
+    create_bbox_contour_from_points(..., bound=True) and compute_box_area
+    would. Only the kept detections are turned into Region objects.
+
+    Args:
+        num_images (int): number of images of the batch
+        image_ids (np.ndarray): (N,) index of the image of each detection
+        boxes (np.ndarray): (N, 4) normalized xmin, ymin, xmax, ymax
+        confidences (np.ndarray): (N,) confidences
+        labels (np.ndarray): (N,) labels, None for unknown (see lookup_labels)
+        confidence_min (float): min confidence of the kept detections
+        bound (bool): clamp the boxes and set the fraction of the
+                      properties. Else boxes are kept as is and fraction
+                      keeps its default
+        **prop_kwargs: other fields of the properties, e.g. server, ver,
+                       property_type
+
+    Returns:
+        list[list[Region]]: regions of each image of the batch
+    """
+    image_ids = np.asarray(image_ids).astype(np.int64)
+    confidences = np.asarray(confidences, dtype=np.float64)
+    labels = np.asarray(labels, dtype=object)
+    keep = ((confidences >= confidence_min) &
+            (image_ids >= 0) & (image_ids < num_images) &
+            (labels != None))  # noqa: E711
+    boxes = np.asarray(boxes, dtype=np.float64)[keep]
+    if bound:
+        boxes[:, :2] = np.maximum(boxes[:, :2], 0.0)
+        boxes[:, 2:] = np.minimum(boxes[:, 2:], 1.0)
+    areas = (np.abs(boxes[:, 2] - boxes[:, 0]) *
+             np.abs(boxes[:, 3] - boxes[:, 1]))
+
+    regions = [[] for _ in range(num_images)]
+    for image_id, (xmin, ymin, xmax, ymax), confidence, label, area in zip(
+        image_ids[keep].tolist(),
+        boxes.tolist(),
+        confidences[keep].tolist(),
+        labels[keep].tolist(),
+        areas.tolist(),
+    ):
+        contour = [Point(xmin, ymin), Point(xmax, ymin),
+                   Point(xmax, ymax), Point(xmin, ymax)]
+        if bound:
+            prop_kwargs["fraction"] = area
+        prop = Property(
+            confidence=confidence,
+            confidence_min=float(confidence_min),
+            value=label,
+            **prop_kwargs
+        )
+        regions[image_id].append(Region(contour=contour, props=[prop]))
+    return regions
@@ -1,3 +1,4 @@
+import sys
 import json
 import traceback
 
@@ -62,6 +63,28 @@ class Request:
         """
         return self.request.get("sample_rate", DEFAULT_SAMPLE_RATE)
 
+    @property
+    def start_tstamp(self):
+        """Getter for the start of the time range to process. Defaults to 0
+
+        Returns:
+            float: start_tstamp
+        """
+        return float(self.request.get("start_tstamp", 0.0))
+
+    @property
+    def end_tstamp(self):
+        """Getter for the end of the time range to process. Defaults to
+        the end of the media
+
+        Returns:
+            float: end_tstamp
+        """
+        end_tstamp = self.request.get("end_tstamp")
+        if end_tstamp is None:
+            return sys.maxsize
+        return float(end_tstamp)
+
     @property
     def bin_encoding(self):
         """Getter for bin_encoding flag. Defaults to False
@@ -138,6 +138,10 @@ class Footprint(DictLike):
         id (str): footprint id
         num_images_processed (int): number of images processed
         request_source (str): source of requests, e.g. SQS queue name
+        skipped_tstamps (List[float]): timestamps whose regions were copied
+                                       from a near-duplicate frame
+        tracked_tstamps (List[float]): timestamps whose regions were
+                                       tracked between detections
     """
 
     code: str = ""
@@ -152,6 +156,8 @@ class Footprint(DictLike):
     id: str = ""
     num_images_processed: int = 0
     request_source: str = ""
+    skipped_tstamps: List[float] = field(default_factory=list)
+    tracked_tstamps: List[float] = field(default_factory=list)
 
 
 @typechecked
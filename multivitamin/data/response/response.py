@@ -265,7 +265,7 @@ class Response():
         if t in self._tstamp2frameannsidx:
             log.debug(f"t: {t} in frame_anns, extending Regions")
             frame_anns_idx = self._tstamp2frameannsidx[t]
-            self._response_internal["media_annotation"]["frames_annotation"][frame_anns_idx].extend(regions)
+            self._response_internal["media_annotation"]["frames_annotation"][frame_anns_idx]["regions"].extend(regions)
         else:
             log.debug(f"t: {t} NOT in frame_anns, appending ImageAnn")
             ia = ImageAnn(t=t, regions=regions)
@@ -299,6 +299,16 @@ class Response():
         assert isinstance(video_ann, type(VideoAnn()))
         self._response_internal["media_annotation"]["media_summary"].append(video_ann)
 
+    def set_media_annotation(self, media_annotation):
+        """Replace the media annotation, e.g. with one restored from a cache
+
+        Args:
+            media_annotation (dict or MediaAnn): media annotation
+        """
+        self._response_internal["media_annotation"] = media_annotation
+        self._tstamp2frameannsidx = {}
+        self._init_tstamp2frameannsidx()
+
     def sort_image_anns_by_timestamp(self):
         tmp = self._response_internal["media_annotation"]["frames_annotation"]
         self._response_internal["media_annotation"]["frames_annotation"] = sorted(
@@ -10,4 +10,30 @@
 from .opencv_media_retriever import OpenCVMediaRetriever
 from .pims_media_retriever import PIMSMediaRetriever
 from .file_retriever import FileRetriever
+from .shared_frames_source import SharedFramesSource
+from .prefetching_frames_iterator import PrefetchingFramesIterator
 from .opencv_media_retriever import OpenCVMediaRetriever as MediaRetriever
+
+MEDIA_RETRIEVER_BACKENDS = ("opencv", "pims", "pyav")
+
+
+def get_media_retriever(url=None, backend="opencv", **kwargs):
+    """Construct a MediaRetriever with the given decoding backend
+
+    Args:
+        url (str | optional): The local or remote url to a file
+        backend (str): "opencv", "pims" or "pyav"
+        kwargs: backend specific arguments, see e.g. PyAVMediaRetriever
+
+    Returns:
+        AbstractMediaRetriever: media retriever
+    """
+    if backend == "opencv":
+        return OpenCVMediaRetriever(url, **kwargs)
+    if backend == "pims":
+        return PIMSMediaRetriever(url, **kwargs)
+    if backend == "pyav":
+        from .pyav_media_retriever import PyAVMediaRetriever
+        return PyAVMediaRetriever(url, **kwargs)
+    raise ValueError(f"Unknown backend: {backend}, expected one of:"
+                     f" {MEDIA_RETRIEVER_BACKENDS}")
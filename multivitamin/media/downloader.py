@@ -0,0 +1,184 @@
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import glog as log
+
+from .http_fileobj import get_session
+
+NUM_CONNECTIONS = 8
+PART_BYTES = 16 * 1024 ** 2
+CHUNK_BYTES = 1024 ** 2
+DOWNLOAD_TIMEOUT_SEC = 60
+PART_SUFFIX = ".part"
+STATE_SUFFIX = ".part.json"
+
+
+def download_file(
+    url,
+    path,
+    num_connections=NUM_CONNECTIONS,
+    part_bytes=PART_BYTES,
+    expected_etag=None,
+    session=None,
+):
+    """Download a remote file to path, over parallel range requests
+
+    The file is split into parts of part_bytes, fetched concurrently over
+    num_connections pooled connections and written straight into a
+    preallocated `path + ".part"` file with positional writes, so memory
+    use does not depend on the size of the file. Completed parts are
+    recorded next to it, so that an interrupted download resumes where it
+    stopped if the remote file (size and ETag) did not change.
+
+    Size, ETag and range support are read from a GET of the first byte,
+    like probe does, as e.g. presigned S3 GET urls reject HEAD requests.
+    Servers ignoring the range answer it with the whole file, which is
+    streamed to disk.
+
+    Args:
+        url (str): remote url
+        path (str): local filepath to write to
+        num_connections (int): max number of concurrent range requests
+        part_bytes (int): size of the parts
+        expected_etag (str): if set, the ETag the remote file must have
+        session (requests.Session): defaults to a shared pooled session
+
+    Returns:
+        str: path
+
+    Raises:
+        IOError: if the file changed during the download, or its length or
+                 ETag does not match
+    """
+    session = session or get_session()
+    part_path = path + PART_SUFFIX
+    with session.get(url, headers={"Range": "bytes=0-0"}, stream=True,
+                     timeout=DOWNLOAD_TIMEOUT_SEC) as resp:
+        resp.raise_for_status()
+        etag = resp.headers.get("ETag")
+        if (expected_etag is not None and etag is not None and
+                etag != expected_etag):
+            raise IOError(f"ETag of {url} changed: {etag} != {expected_etag}")
+        ranges = resp.status_code == 206
+        size = _total_size(resp)
+        if not ranges:
+            log.info(f"Downloading {url} without range requests")
+            _write_response(resp, part_path)
+
+    if ranges and size < 0:
+        log.info(f"Downloading {url} of unknown size without range requests")
+        _download_stream(session, url, part_path)
+    elif ranges:
+        _download_parts(session, url, part_path, size, etag,
+                        num_connections, part_bytes)
+
+    if size >= 0 and os.path.getsize(part_path) != size:
+        raise IOError(f"Downloaded {os.path.getsize(part_path)} bytes of"
+                      f" {url}, expected {size}")
+    os.replace(part_path, path)
+    _remove(path + STATE_SUFFIX)
+    return path
+
+
+def _total_size(resp):
+    """Size of the remote file of a range response, -1 if unknown"""
+    if resp.status_code == 206:
+        total = resp.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+        return int(total) if total.isdigit() else -1
+    return int(resp.headers.get("Content-Length", -1))
+
+
+def _download_stream(session, url, part_path):
+    with session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT_SEC) as resp:
+        resp.raise_for_status()
+        _write_response(resp, part_path)
+
+
+def _write_response(resp, part_path):
+    with open(part_path, "wb") as wf:
+        for chunk in resp.iter_content(CHUNK_BYTES):
+            wf.write(chunk)
+
+
+def _download_parts(session, url, part_path, size, etag, num_connections,
+                    part_bytes):
+    state_path = part_path[:-len(PART_SUFFIX)] + STATE_SUFFIX
+    state = {"url": url, "size": size, "etag": etag,
+             "part_bytes": part_bytes, "done": []}
+    prev_state = _load_state(state_path)
+    if (os.path.exists(part_path) and prev_state is not None and
+            etag is not None and
+            all(prev_state.get(k) == state[k] for k in
+                ("url", "size", "etag", "part_bytes"))):
+        state["done"] = prev_state["done"]
+        log.info(f"Resuming download of {url}:"
+                 f" {len(state['done'])} parts done")
+    else:
+        _remove(part_path)
+
+    parts = [
+        (start, min(start + part_bytes, size) - 1)
+        for start in range(0, size, part_bytes)
+        if start not in state["done"]
+    ]
+    lock = threading.Lock()
+    fd = os.open(part_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        os.ftruncate(fd, size)
+
+        def fetch(part):
+            _download_part(session, url, fd, part, etag)
+            with lock:
+                state["done"].append(part[0])
+                _save_state(state_path, state)
+
+        with ThreadPoolExecutor(max_workers=num_connections) as executor:
+            for future in [executor.submit(fetch, part) for part in parts]:
+                future.result()
+    finally:
+        os.close(fd)
+
+
+def _download_part(session, url, fd, part, etag):
+    start, end = part
+    headers = {"Range": f"bytes={start}-{end}"}
+    if etag is not None:
+        headers["If-Range"] = etag
+    with session.get(url, headers=headers, stream=True,
+                     timeout=DOWNLOAD_TIMEOUT_SEC) as resp:
+        resp.raise_for_status()
+        if resp.status_code != 206:
+            raise IOError(f"{url} changed during the download")
+        if etag is not None and resp.headers.get("ETag", etag) != etag:
+            raise IOError(f"ETag of {url} changed during the download")
+        offset = start
+        for chunk in resp.iter_content(CHUNK_BYTES):
+            os.pwrite(fd, chunk, offset)
+            offset += len(chunk)
+    if offset != end + 1:
+        raise IOError(f"Got {offset - start} bytes of range {start}-{end}"
+                      f" of {url}")
+
+
+def _load_state(state_path):
+    try:
+        with open(state_path, "r") as rf:
+            return json.load(rf)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(state_path, state):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w") as wf:
+        json.dump(state, wf)
+    os.replace(tmp_path, state_path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
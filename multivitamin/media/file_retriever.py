@@ -1,11 +1,15 @@
 import os
+import shutil
 import requests
 import magic
 from io import BytesIO
 import urllib.parse
 import glog as log
-from imohash import hashfileobject
+from imohash import hashfile, hashfileobject
 from .http_fileobj import HTTPFile
+from .probe import probe
+from .media_cache import get_media_cache
+from .downloader import download_file
 
 
 class FileRetriever:
@@ -21,6 +25,7 @@ class FileRetriever:
         self._url = None
         self._is_local = None
         self._content_type = None
+        self._info = None
         self._hash = None
         if url is not None:
             self.url = url
@@ -33,6 +38,8 @@ class FileRetriever:
     @url.setter
     def url(self, value):
         self._content_type = None
+        self._info = None
+        self._hash = None
         url_scheme = urllib.parse.urlparse(value).scheme
 
         self._url = value
@@ -41,10 +48,17 @@ class FileRetriever:
         else:
             self._is_local = False
 
-        if not self.exists:
+        self._info = probe(value)
+        if self._info is None:
             self._is_local = None
             self._url = None
             raise FileNotFoundError(value)
+        self._content_type = self._info.content_type
+
+    @property
+    def info(self):
+        """Get the MediaInfo of the file, probed once per url (and cached)."""
+        return self._info
 
     @property
     def exists(self):
@@ -78,6 +92,24 @@ class FileRetriever:
         """
         return self.url.replace("file://", "") if self.is_local else None
 
+    @property
+    def local_path(self):
+        """Get a local filepath to the file bytes.
+
+        Returns:
+            the filepath if the file is local, the path of the file in the
+            media cache if it is remote (downloaded on first access), `None`
+            if it is remote and the media cache is disabled
+
+        """
+        if self.is_local:
+            return self.filepath
+        media_cache = get_media_cache()
+        if media_cache is None or self.url is None:
+            return None
+        etag = self.info.etag if self.info is not None else None
+        return media_cache.get_path(self.url, etag)
+
     @property
     def content_type(self):
         """Get the MIME type of the file."""
@@ -110,14 +142,22 @@ class FileRetriever:
     def hash(self):
         """Get quick hash of file bytes."""
         if self._hash is None:
-            filelike = HTTPFile(self.url)
-            self._hash = hashfileobject(filelike, hexdigest=True)
+            local_path = self.local_path
+            if local_path is not None:
+                self._hash = hashfile(local_path, hexdigest=True)
+            else:
+                filelike = HTTPFile(self.url)
+                self._hash = hashfileobject(filelike, hexdigest=True)
 
         return self._hash
 
     def download(self, filepath=None, return_filelike=False):
         """Download file to filepath.
 
+        Remote files are written to filepath with download_file (parallel
+        range requests, constant memory), unless they are in the media
+        cache.
+
         Args:
             filepath (str | optional): Filepath to write file to.
                                 If directory, it will take it's original
@@ -128,23 +168,27 @@ class FileRetriever:
             filelike_obj: A BytesIO object containing the file bytes
                             (only if return_filelike is True)
         """
-
-        if self.is_remote:
-            response = requests.get(self.url)
-            filelike_obj = BytesIO(response.content)
-        else:
-            with open(self.filepath, "rb") as f:
-                filelike_obj = BytesIO(f.read())
-
         path = None
         if isinstance(filepath, str):
             if os.path.isdir(filepath):
                 path = "{}/{}".format(filepath, self.filename)
             else:
                 path = filepath
-            with open(path, "wb") as f:
-                f.write(filelike_obj.read())
 
-        if return_filelike is True:
-            filelike_obj.seek(0)
-            return filelike_obj
+        local_path = self.local_path
+        if path is not None:
+            if local_path is None:
+                etag = self.info.etag if self.info is not None else None
+                download_file(self.url, path, expected_etag=etag)
+            elif os.path.abspath(local_path) != os.path.abspath(path):
+                shutil.copyfile(local_path, path)
+            local_path = path
+
+        if return_filelike is not True:
+            return None
+
+        if local_path is None:
+            response = requests.get(self.url)
+            return BytesIO(response.content)
+        with open(local_path, "rb") as f:
+            return BytesIO(f.read())
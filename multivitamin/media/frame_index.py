@@ -0,0 +1,208 @@
+import os
+import json
+import bisect
+import threading
+from collections import OrderedDict
+
+import cv2
+import glog as log
+
+try:
+    import av
+except ImportError:
+    av = None
+
+FRAME_INDEX_CACHE_SIZE = 64
+INDEX_SUFFIX = ".index.json"
+
+_INDEXES = OrderedDict()
+_LOCK = threading.Lock()
+
+
+class FrameIndex:
+    def __init__(self, pts, keyframes=None):
+        """Presentation timestamps of every frame of a video
+
+        Args:
+            pts (list[float]): timestamp in seconds of every frame, relative
+                               to the start of the video stream
+            keyframes (list[int]): sorted indices of the keyframes, None if
+                                   unknown
+        """
+        self.pts = sorted(pts)
+        self.keyframes = keyframes
+
+    def __len__(self):
+        return len(self.pts)
+
+    def frame_index(self, tstamp):
+        """Get the index of the frame displayed at tstamp
+
+        i.e. the last frame with a timestamp <= tstamp (up to a ms), the
+        first frame if tstamp is before it.
+        """
+        idx = bisect.bisect_right(self.pts, tstamp + 0.001) - 1
+        return min(max(idx, 0), len(self.pts) - 1)
+
+    def keyframe_tstamps(self):
+        """Get the timestamps of the keyframes, empty if unknown"""
+        return [self.pts[idx] for idx in self.keyframes or []]
+
+    def keyframe_before(self, idx):
+        """Get the index of the keyframe at or before frame idx, None if unknown"""
+        if not self.keyframes:
+            return None
+        pos = bisect.bisect_right(self.keyframes, idx) - 1
+        return self.keyframes[max(pos, 0)]
+
+    def should_seek(self, cur_idx, idx, seek_cost_frames):
+        """Check if decoding frame idx from frame cur_idx is worth a seek
+
+        Seeking is pointless while idx is in the GOP being decoded, and
+        costs about seek_cost_frames decoded frames otherwise.
+
+        Args:
+            cur_idx (int): index of the next frame to be decoded, None if
+                           nothing is being decoded
+            idx (int): index of the frame to decode
+            seek_cost_frames (int): cost of a seek in decoded frames
+
+        Returns:
+            bool
+        """
+        if cur_idx is None or idx < cur_idx:
+            return True
+        keyframe = self.keyframe_before(idx)
+        if keyframe is not None and keyframe <= cur_idx:
+            return False
+        if keyframe is not None:
+            return idx - cur_idx > idx - keyframe + seek_cost_frames
+        return idx - cur_idx > seek_cost_frames
+
+    def is_constant_rate(self, fps, tolerance=0.25):
+        """Check if frame i is displayed at i / fps, for every frame
+
+        Args:
+            fps (float): frame rate reported by the container
+            tolerance (float): max error on a timestamp, in frames
+
+        Returns:
+            bool
+        """
+        if not fps or fps <= 0 or not self.pts:
+            return False
+        max_error = tolerance / fps
+        return all(abs(pts - idx / fps) <= max_error
+                   for idx, pts in enumerate(self.pts))
+
+    def to_dict(self):
+        return {"pts": self.pts, "keyframes": self.keyframes}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["pts"], d.get("keyframes"))
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as wf:
+            json.dump(self.to_dict(), wf)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as rf:
+            return cls.from_dict(json.load(rf))
+
+
+def build_frame_index(src):
+    """Build the FrameIndex of a video
+
+    With PyAV, only the packets are read (no decoding), which also gives
+    the keyframes. Otherwise every frame is grabbed with OpenCV, and the
+    keyframes are unknown.
+
+    Args:
+        src (str): local filepath or remote url
+
+    Returns:
+        FrameIndex
+    """
+    if av is None:
+        log.info("package: av not found, indexing frames with OpenCV")
+        return _build_frame_index_opencv(src)
+
+    with av.open(src) as container:
+        stream = container.streams.video[0]
+        start_time = stream.start_time or 0
+        frames = []
+        for packet in container.demux(stream):
+            if packet.pts is None:
+                continue
+            frames.append((float((packet.pts - start_time) * stream.time_base),
+                           packet.is_keyframe))
+    frames.sort()
+    return FrameIndex(
+        [pts for pts, _ in frames],
+        [idx for idx, (_, is_keyframe) in enumerate(frames) if is_keyframe],
+    )
+
+
+def _build_frame_index_opencv(src):
+    cap = cv2.VideoCapture(src, cv2.CAP_FFMPEG)
+    pts = []
+    try:
+        while cap.grab():
+            pts.append(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
+    finally:
+        cap.release()
+    return FrameIndex(pts)
+
+
+def get_frame_index(media, allow_full_scan=True):
+    """Get the FrameIndex of the video of a MediaRetriever
+
+    Indexes are built once per url and ETag and kept in memory. Indexes of
+    files in the media cache are also saved next to the cached file.
+
+    Args:
+        media (AbstractMediaRetriever): media retriever of a video
+        allow_full_scan (bool): if False, the video is only indexed if
+                                its packets can be read locally with
+                                PyAV, not by decoding every frame (PyAV
+                                not installed) nor by streaming a remote
+                                file (media cache disabled)
+
+    Returns:
+        FrameIndex: None if not allow_full_scan and the video would have
+                    to be decoded or streamed to be indexed
+    """
+    key = (media.url, media.info.etag if media.info is not None else None)
+    with _LOCK:
+        if key in _INDEXES:
+            _INDEXES.move_to_end(key)
+            return _INDEXES[key]
+
+    local_path = media.local_path
+    index_path = None
+    if local_path is not None and media.is_remote:
+        index_path = local_path + INDEX_SUFFIX
+
+    index = None
+    if index_path is not None and os.path.exists(index_path):
+        try:
+            index = FrameIndex.load(index_path)
+        except (OSError, ValueError, KeyError) as e:
+            log.warning(f"Failed to load frame index {index_path}: {e}")
+    if index is None:
+        if not allow_full_scan and (av is None or local_path is None):
+            return None
+        log.info(f"Indexing frames of {media.url}")
+        index = build_frame_index(local_path or media.url)
+        if index_path is not None:
+            index.save(index_path)
+
+    with _LOCK:
+        _INDEXES[key] = index
+        while len(_INDEXES) > FRAME_INDEX_CACHE_SIZE:
+            _INDEXES.popitem(last=False)
+    return index
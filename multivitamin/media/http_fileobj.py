@@ -5,19 +5,55 @@ https://github.com/valgur/pyhttpio
 
 import cgi
 import time
-import urllib.request
+import threading
+from collections import OrderedDict
 from io import IOBase
 from sys import stderr
 
+import requests
+from requests.adapters import HTTPAdapter
+
+BLOCK_SIZE = 64 * 1024
+MAX_CACHED_BLOCKS = 64
+MAX_READ_AHEAD_BLOCKS = 16
+POOL_MAXSIZE = 32
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def get_session():
+    """Get the requests session shared by HTTPFiles, to reuse connections"""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=POOL_MAXSIZE)
+            _SESSION.mount("http://", adapter)
+            _SESSION.mount("https://", adapter)
+    return _SESSION
+
 
 class HTTPFile(IOBase):
     """Turns URLs into Filelike objects."""
 
-    def __init__(self, url, name=None, repeat_time=-1, debug=False):
+    def __init__(self, url, name=None, repeat_time=-1, debug=False,
+                 block_size=BLOCK_SIZE, max_cached_blocks=MAX_CACHED_BLOCKS,
+                 max_read_ahead_blocks=MAX_READ_AHEAD_BLOCKS, session=None):
         """Allow a file accessible via HTTP to be used like a local file by
         utilities that use `seek()` to read arbitrary parts of the file, such
         as `ZipFile`. Seeking is done via the 'range: bytes=xx-yy' HTTP header.
 
+        The file is read in aligned blocks of block_size bytes, kept in an
+        LRU cache of max_cached_blocks blocks. Missing adjacent blocks are
+        fetched with a single range request, over the persistent
+        connections of a shared session. While reads are sequential, up to
+        max_read_ahead_blocks following blocks are fetched along (the
+        read-ahead doubles with every sequential read).
+
+        If the server ignores range requests, the file is not seekable and
+        is read from the body of the first response as it streams in.
+
         Parameters
         ----------
         url : str
@@ -30,27 +66,50 @@ class HTTPFile(IOBase):
             again.
             Negative value or `None` disables retrying and simply passes on
             the exception (the default).
+        block_size : int, optional
+            Size of the cached blocks, in bytes.
+        max_cached_blocks : int, optional
+            Max number of cached blocks.
+        max_read_ahead_blocks : int, optional
+            Max number of blocks read ahead of sequential reads.
+        session : requests.Session, optional
+            Session to send the requests with, defaults to get_session().
         """
         super().__init__()
         self.url = url
         self.name = name
         self.repeat_time = repeat_time
         self.debug = debug
+        self.block_size = block_size
+        self.max_cached_blocks = max_cached_blocks
+        self.max_read_ahead_blocks = max_read_ahead_blocks
+        self.session = session or get_session()
+        self.num_requests = 0
         self._pos = 0
         self._seekable = True
-        with self._urlopen() as f:
-            if self.debug:
-                print(f.getheaders())
-            self.content_length = int(f.getheader("Content-Length", -1))
-            if self.content_length < 0:
-                self._seekable = False
-            if f.getheader("Accept-Ranges", "none").lower() != "bytes":
-                self._seekable = False
-            if name is None:
-                header = f.getheader("Content-Disposition")
-                if header:
-                    value, params = cgi.parse_header(header)
-                    self.name = params.get("filename")
+        self._blocks = OrderedDict()
+        self._read_ahead = 0
+        self._last_end = None
+        self._lock = threading.Lock()
+        self._stream = None
+        self._stream_pos = 0
+
+        # the first block comes with the headers
+        resp = self._get((0, block_size - 1))
+        if self.debug:
+            print(resp.headers)
+        self.content_length = self._content_length(resp)
+        if self.content_length < 0:
+            self._seekable = False
+        if self.content_length >= 0:
+            self._store_blocks(0, self._body(resp, (0, block_size - 1)))
+        else:
+            resp.close()
+        if name is None:
+            header = resp.headers.get("Content-Disposition")
+            if header:
+                value, params = cgi.parse_header(header)
+                self.name = params.get("filename")
 
     def seek(self, offset, whence=0):
         if not self.seekable():
@@ -76,21 +135,35 @@ class HTTPFile(IOBase):
     def read(self, amt=-1):
         if self._pos >= self.content_length:
             return b""
-        if amt < 0:
+        if amt is None or amt < 0:
             end = self.content_length - 1
         else:
             end = min(self._pos + amt - 1, self.content_length - 1)
-        byte_range = (self._pos, end)
+        if end < self._pos:
+            return b""
+        with self._lock:
+            data = self._read_range(self._pos, end)
         self._pos = end + 1
-        with self._urlopen(byte_range) as f:
-            return f.read()
+        return data
 
     def readall(self):
         return self.read(-1)
 
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
     def tell(self):
         return self._pos
 
+    def close(self):
+        self._blocks.clear()
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        super().close()
+
     def __getattribute__(self, item):
         attr = object.__getattribute__(self, item)
         if not object.__getattribute__(self, "debug"):
@@ -108,17 +181,125 @@ class HTTPFile(IOBase):
         else:
             return attr
 
-    def _urlopen(self, byte_range=None):
+    def _read_range(self, start, end):
+        """Read bytes start to end (included) through the block cache"""
+        first = start // self.block_size
+        last = end // self.block_size
+
+        if self._last_end is not None and start == self._last_end + 1:
+            self._read_ahead = min(max(1, 2 * self._read_ahead),
+                                   self.max_read_ahead_blocks)
+        else:
+            self._read_ahead = 0
+        self._last_end = end
+        num_blocks = (self.content_length - 1) // self.block_size + 1
+        fetch_last = min(last + self._read_ahead, num_blocks - 1)
+
+        blocks = {}
+        missing = []
+        for idx in range(first, fetch_last + 1):
+            if idx > last and (idx in self._blocks or not missing):
+                break  # read ahead up to the next cached block
+            if idx in self._blocks:
+                self._blocks.move_to_end(idx)
+                blocks[idx] = self._blocks[idx]
+            else:
+                missing.append(idx)
+
+        for run_first, run_last in _runs(missing):
+            byte_range = (run_first * self.block_size,
+                          min((run_last + 1) * self.block_size,
+                              self.content_length) - 1)
+            data = self._fetch(byte_range)
+            blocks.update(self._store_blocks(run_first, data))
+
+        data = b"".join(blocks[idx] for idx in range(first, last + 1))
+        offset = first * self.block_size
+        return data[start - offset:end - offset + 1]
+
+    def _store_blocks(self, first, data):
+        """Split data starting at block first into blocks and cache them"""
+        blocks = {}
+        for i in range(0, len(data), self.block_size):
+            idx = first + i // self.block_size
+            blocks[idx] = data[i:i + self.block_size]
+            self._blocks[idx] = blocks[idx]
+            self._blocks.move_to_end(idx)
+        while len(self._blocks) > self.max_cached_blocks:
+            self._blocks.popitem(last=False)
+        return blocks
+
+    def _fetch(self, byte_range):
+        if self._stream is not None:
+            return self._read_stream(byte_range)
+        return self._body(self._get(byte_range), byte_range)
+
+    def _body(self, resp, byte_range):
+        """Read byte_range from the body of a response to a range request"""
+        if resp.status_code == 206:
+            return resp.content
+        # the server ignored the range and sends the whole file: keep
+        # reading it from this response, without seeking
+        self._seekable = False
+        self._stream = resp
+        self._stream_pos = 0
+        return self._read_stream(byte_range)
+
+    def _read_stream(self, byte_range):
+        """Read byte_range from the streamed body of the whole file"""
+        start, end = byte_range
+        if start < self._stream_pos:
+            raise OSError("{} is not seekable, cannot read back to byte {}"
+                          .format(self.url, start))
+        while self._stream_pos < start:
+            if not self._read_stream_bytes(min(start - self._stream_pos,
+                                               self.block_size)):
+                return b""
+        return self._read_stream_bytes(end + 1 - start)
+
+    def _read_stream_bytes(self, amt):
+        chunks = []
+        while amt > 0:
+            chunk = self._stream.raw.read(amt, decode_content=True)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            amt -= len(chunk)
+            self._stream_pos += len(chunk)
+        return b"".join(chunks)
+
+    def _content_length(self, resp):
+        content_range = resp.headers.get("Content-Range", "")
+        if resp.status_code == 206 and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            return int(total) if total != "*" else -1
+        return int(resp.headers.get("Content-Length", -1))
+
+    def _get(self, byte_range=None):
         header = {}
         if byte_range:
             header = {"range": "bytes={}-{}".format(*byte_range)}
         while True:
             try:
-                r = urllib.request.Request(self.url, headers=header)
-                return urllib.request.urlopen(r)
-            except urllib.error.HTTPError as e:
+                self.num_requests += 1
+                resp = self.session.get(self.url, headers=header,
+                                        stream=True)
+                resp.raise_for_status()
+                return resp
+            except requests.HTTPError as e:
                 if self.repeat_time is None or self.repeat_time < 0:
                     raise
                 print("Server responded with " + str(e), file=stderr)
                 print("Sleeping for {} seconds before trying again".format(self.repeat_time), file=stderr)
                 time.sleep(self.repeat_time)
+
+
+def _runs(indices):
+    """Group sorted indices into (first, last) runs of consecutive indices"""
+    runs = []
+    for idx in indices:
+        if runs and idx == runs[-1][1] + 1:
+            runs[-1][1] = idx
+        else:
+            runs.append([idx, idx])
+    return [tuple(run) for run in runs]
@@ -0,0 +1,117 @@
+import os
+import hashlib
+import threading
+import urllib.parse
+from collections import OrderedDict
+
+import glog as log
+
+from multivitamin.utils.single_flight import SingleFlight
+from .downloader import download_file, PART_SUFFIX, STATE_SUFFIX
+from .frame_index import INDEX_SUFFIX
+
+MAX_MEDIA_CACHE_BYTES = 10 * 1024 ** 3
+
+_NOT_CACHED_SUFFIXES = (PART_SUFFIX, STATE_SUFFIX, INDEX_SUFFIX, ".tmp")
+
+
+class MediaCache:
+    def __init__(self, cache_dir, max_bytes=MAX_MEDIA_CACHE_BYTES):
+        """Caches remote media as local files, with LRU eviction
+
+        Files are stored under a hash of their url and ETag, so that a
+        changed remote file is downloaded again. Files are downloaded with
+        download_file (parallel range requests, resumed if interrupted),
+        and concurrent downloads of the same file are coalesced. The least
+        recently used files are deleted once the total size of the
+        directory exceeds max_bytes (the most recent file is always kept).
+
+        Args:
+            cache_dir (str): directory of the cache
+            max_bytes (int): max total size of the cached files
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._single_flight = SingleFlight()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._sizes = OrderedDict(
+            (path, os.path.getsize(path))
+            for path in sorted(self._paths(), key=os.path.getmtime)
+        )
+        self._size = sum(self._sizes.values())
+
+    @property
+    def size(self):
+        """Get the total size of the cached files"""
+        return self._size
+
+    def get_path(self, url, etag=None):
+        """Get the local path of a remote file, downloaded if not cached
+
+        Args:
+            url (str): remote url
+            etag (str): ETag of the remote file, None if unknown
+
+        Returns:
+            str: local filepath
+        """
+        path = self._path(url, etag)
+        with self._lock:
+            if path in self._sizes:
+                self._sizes.move_to_end(path)
+                return path
+        return self._single_flight.do(path, self._download, url, path, etag)
+
+    def _download(self, url, path, etag):
+        with self._lock:
+            if path in self._sizes:
+                return path
+        log.info(f"Downloading {url} to media cache")
+        download_file(url, path, expected_etag=etag)
+        with self._lock:
+            self._sizes[path] = os.path.getsize(path)
+            self._size += self._sizes[path]
+            self._evict()
+        return path
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._sizes) > 1:
+            path, size = self._sizes.popitem(last=False)
+            for evicted_path in (path, path + INDEX_SUFFIX):
+                try:
+                    os.remove(evicted_path)
+                except FileNotFoundError:
+                    pass
+            self._size -= size
+            log.debug(f"Evicted {path} from media cache")
+
+    def _path(self, url, etag):
+        key = hashlib.sha256(f"{url}\n{etag}".encode()).hexdigest()
+        ext = os.path.splitext(urllib.parse.urlparse(url).path)[1]
+        return os.path.join(self.cache_dir, key + ext)
+
+    def _paths(self):
+        return [
+            os.path.join(self.cache_dir, fn)
+            for fn in os.listdir(self.cache_dir)
+            if not fn.endswith(_NOT_CACHED_SUFFIXES)
+        ]
+
+
+_MEDIA_CACHE = None
+
+
+def get_media_cache():
+    """Get the MediaCache used by the retrievers, None if disabled"""
+    return _MEDIA_CACHE
+
+
+def set_media_cache(cache):
+    """Set the MediaCache used by the retrievers, None to disable it
+
+    Usage:
+    set_media_cache(MediaCache("/tmp/media_cache", max_bytes=10 * 1024 ** 3))
+    """
+    global _MEDIA_CACHE
+    _MEDIA_CACHE = cache
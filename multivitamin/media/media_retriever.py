@@ -5,9 +5,19 @@ import glog as log
 import math
 from abc import ABC, abstractmethod
 from .file_retriever import FileRetriever
+from .frame_index import get_frame_index
 
 FRAME_EPS = 0.001
 DECIMAL_SIGFIG = 3
+SEEK_COST_FRAMES = 30
+DEFAULT_INTERPOLATION = "area"
+INTERPOLATIONS = ("nearest", "linear", "cubic", "area")
+PIL_INTERPOLATIONS = {
+    "nearest": Image.NEAREST,
+    "linear": Image.BILINEAR,
+    "cubic": Image.BICUBIC,
+    "area": Image.BOX,
+}
 
 
 class AbstractMediaRetriever(FileRetriever, ABC):
@@ -22,6 +32,7 @@ class AbstractMediaRetriever(FileRetriever, ABC):
         """
         self._cap = None
         self._image = None
+        self._resized_images = {}
         self._shape = None
 
         super(AbstractMediaRetriever, self).__init__(url=url)
@@ -32,6 +43,7 @@ class AbstractMediaRetriever(FileRetriever, ABC):
         FileRetriever.url.fset(self, value)
         self._cap = None
         self._image = None
+        self._resized_images = {}
         self._shape = None
         if not self.is_image and not self.is_video:
             raise ValueError(
@@ -117,6 +129,9 @@ class AbstractMediaRetriever(FileRetriever, ABC):
     @property
     def shape(self):
         """Get height by width by channels for frames."""
+        if self._shape is None and self.info is not None and self.info.width:
+            self._shape = (self.info.height, self.info.width, 3)
+
         if self._shape is None:
             if self.is_image:
                 self._shape = self.image.shape
@@ -154,38 +169,184 @@ class AbstractMediaRetriever(FileRetriever, ABC):
         self._image = image[:, :, ::-1].copy()
         return self._image
 
+    def get_image(self, target_size=None, interpolation=DEFAULT_INTERPOLATION):
+        """Get the image, optionally resized.
+
+        JPEGs are downscaled while decoding (in the DCT domain) to the
+        smallest power of 2 fraction of their size above target_size,
+        then resized to target_size.
+
+        Args:
+            target_size (tuple): (width, height) of the image, or None for
+                                 the original size
+            interpolation (str): one of INTERPOLATIONS
+
+        Returns:
+            np.ndarray: BGR image, `None` if it's a video
+
+        """
+        if target_size is None or not self.is_image:
+            return self.image
+
+        key = (tuple(target_size), interpolation)
+        if key not in self._resized_images:
+            check_interpolation(interpolation)
+            filelike_obj = self.download(return_filelike=True)
+            image = Image.open(filelike_obj)
+            image.draft("RGB", tuple(target_size))
+            image = image.convert("RGB").resize(
+                tuple(target_size), PIL_INTERPOLATIONS[interpolation]
+            )
+            self._resized_images[key] = np.array(image)[:, :, ::-1].copy()
+        return self._resized_images[key]
+
+    @property
+    def frame_index(self):
+        """Get the FrameIndex of the video, built on first access.
+
+        Return `None` if it's an image.
+
+        """
+        if not self.is_video:
+            return None
+        return get_frame_index(self)
+
+    @property
+    def indexed(self):
+        """Check if the FrameIndex of the video is available without
+        decoding (or streaming) the whole video, see get_frame_index."""
+        return (self.is_video and
+                get_frame_index(self, allow_full_scan=False) is not None)
+
     def tstamp_to_frame_index(self, tstamp):
         """Convert a timestamp to a frame index.
 
+        The frame index is only used if it is available without decoding
+        the whole video (see `indexed`).
+
         Args:
             tstamp (float): A float in seconds.
 
         Returns:
-            int: The nearest frame to that tstamp.
+            int: The index of the frame displayed at that tstamp if the
+                 video is indexed, the nearest frame to that tstamp
+                 otherwise.
 
         """
+        if self.indexed:
+            return self.frame_index.frame_index(tstamp)
         return round(tstamp * self.fps)
 
-    def get_frame(self, tstamp=0.0):
+    def get_frame(self, tstamp=0.0, target_size=None,
+                  interpolation=DEFAULT_INTERPOLATION):
         """Return frame if image, or get frame with timestamp in seconds (w/ demicals).
 
-        Note: iterating using get_frames_iterator is significantly faster
+        If the video is indexed (see `indexed`), the frame is found with
+        the frame index, i.e. it is the frame displayed at tstamp.
+        Otherwise, the video is seeked to tstamp.
+
+        Note: iterating using get_frames_iterator or get_frames is
+        significantly faster
+
+        Args:
+            tstamp (float): timestamp of the frame
+            target_size (tuple): (width, height) of the frame, or None for
+                                 the original size
+            interpolation (str): one of INTERPOLATIONS
 
         """
         if not self.url:
             raise ValueError('URL not set. Please use med_ret.set_url("...")')
 
         if self.is_image:
-            return self.image
+            return self.get_image(target_size, interpolation)
 
         elif self.is_video:
-            ret, frame = self._get_frame_from_video(tstamp=tstamp)
-            if not ret:
-                return ret
+            if not self.indexed:
+                ret, frame = self._get_frame_from_video(
+                    tstamp=tstamp,
+                    target_size=target_size,
+                    interpolation=interpolation,
+                )
+                if not ret:
+                    return ret
+                return frame
+            frame = self.get_frames([tstamp], target_size, interpolation)[0]
+            if frame is None:
+                return False
             return frame
 
+    def get_frames(self, tstamps, target_size=None,
+                   interpolation=DEFAULT_INTERPOLATION):
+        """Get the frames displayed at a list of timestamps.
+
+        Timestamps are sorted and decoded in a single forward pass, seeking
+        only to skip whole GOPs. The frame index is built on the first call.
+
+        Args:
+            tstamps (list[float]): timestamps in seconds, in any order
+            target_size (tuple): (width, height) of the frames, or None for
+                                 the original size
+            interpolation (str): one of INTERPOLATIONS
+
+        Returns:
+            list: frames in the order of tstamps, `None` for frames that
+                  could not be decoded
+
+        """
+        if not self.url:
+            raise ValueError('URL not set. Please use med_ret.set_url("...")')
+
+        check_interpolation(interpolation)
+        if self.is_image:
+            image = self.get_image(target_size, interpolation)
+            return [image for _ in tstamps]
+
+        frame_index = self.frame_index
+        idxs = [frame_index.frame_index(t) for t in tstamps]
+        frames = dict(self._decode_frames(sorted(set(idxs)), target_size,
+                                          interpolation))
+        return [frames.get(idx) for idx in idxs]
+
+    def _decode_frames(self, frame_idxs, target_size, interpolation):
+        """Decode frames by index.
+
+        Backends override it with a single forward pass.
+
+        Args:
+            frame_idxs (list[int]): sorted frame indices
+
+        Yields:
+            tuple: (frame index, frame) of the decoded frames, in order
+
+        """
+        for idx in frame_idxs:
+            ret, frame = self._get_frame_from_video(
+                tstamp=self.frame_index.pts[idx],
+                target_size=target_size,
+                interpolation=interpolation,
+            )
+            if ret:
+                yield idx, frame
+
+    def _labeled_frame_index(self, tstamp):
+        """Get the index of the frame frames iterators label with tstamp"""
+        return self.frame_index.frame_index(tstamp)
+
+    def _iter_frames_at(self, tstamps, target_size, interpolation):
+        """Yield (frame, tstamp) for the given tstamps, sorted"""
+        tstamps_of_idx = {}
+        for tstamp in sorted(set(tstamps)):
+            idx = self._labeled_frame_index(tstamp)
+            tstamps_of_idx.setdefault(idx, []).append(tstamp)
+        for idx, frame in self._decode_frames(sorted(tstamps_of_idx),
+                                              target_size, interpolation):
+            for tstamp in tstamps_of_idx[idx]:
+                yield frame, tstamp
+
     @abstractmethod
-    def _get_frame_from_video(self, tstamp):
+    def _get_frame_from_video(self, tstamp, target_size=None,
+                              interpolation=DEFAULT_INTERPOLATION):
         pass
 
     @abstractmethod
@@ -193,12 +354,21 @@ class AbstractMediaRetriever(FileRetriever, ABC):
         pass
 
     def get_frames_iterator(
-        self, sample_rate=100.0, start_tstamp=0.0, end_tstamp=sys.maxsize
+        self,
+        sample_rate=100.0,
+        start_tstamp=0.0,
+        end_tstamp=sys.maxsize,
+        target_size=None,
+        interpolation=DEFAULT_INTERPOLATION,
+        tstamps=None,
     ):
         """Get a frames iterator.
 
         If image, returns a list of length 0 with a tuple (image, tstamp),
-        If video, returns a FramesIterator
+        If video, returns a FramesIterator, or if tstamps is given, an
+        iterator over the frames the FramesIterator labels with these
+        tstamps: only those frames are decoded, in one forward pass that
+        seeks over the GOPs without any.
 
         Usage in either image or video case:
         for frame, tstamp in med_ret.get_frames_iterator():
@@ -208,6 +378,11 @@ class AbstractMediaRetriever(FileRetriever, ABC):
             sample_rate (float): sample rate for extracting frames from video
             start_tstamp (float): starting timestamp for iteration
             end_tstamp (float): ending timestamp for iteration
+            target_size (tuple): (width, height) of the frames, or None for
+                                 the original size
+            interpolation (str): one of INTERPOLATIONS
+            tstamps (list[float]): explicit tstamps to iterate over (sorted),
+                                   instead of sampling at sample_rate
 
         Returns:
             iterator
@@ -219,16 +394,22 @@ class AbstractMediaRetriever(FileRetriever, ABC):
         if not self.url:
             raise ValueError('URL not set. Please use med_ret.set_url("...")')
 
+        check_interpolation(interpolation)
         if self.is_image:
-            return [(self.image, 0.00)]
+            return [(self.get_image(target_size, interpolation), 0.00)]
 
         elif self.is_video:
+            if tstamps is not None:
+                return self._iter_frames_at(tstamps, target_size,
+                                            interpolation)
             fi = self._get_frames_iterator_class()
             return fi(self.video_capture,
                       self.fps,
                       sample_rate,
                       start_tstamp,
-                      end_tstamp)
+                      end_tstamp,
+                      target_size=target_size,
+                      interpolation=interpolation)
 
     def get_length(self):
         """Get the temporal length of the image/video."""
@@ -247,6 +428,13 @@ class AbstractMediaRetriever(FileRetriever, ABC):
         return self.shape[0:2][::-1]
 
 
+def check_interpolation(interpolation):
+    """Raise a ValueError if interpolation is not one of INTERPOLATIONS"""
+    if interpolation not in INTERPOLATIONS:
+        raise ValueError(f"Unknown interpolation: {interpolation},"
+                         f" expected one of: {INTERPOLATIONS}")
+
+
 class AbstractFramesIterator(ABC):
     """Frames iterator object for videos.
 
@@ -264,7 +452,9 @@ class AbstractFramesIterator(ABC):
                  video_fps,
                  sample_rate=100.0,
                  start_tstamp=0.0,
-                 end_tstamp=sys.maxsize):
+                 end_tstamp=sys.maxsize,
+                 target_size=None,
+                 interpolation=DEFAULT_INTERPOLATION):
         """Frames iterator constructor.
 
         Args:
@@ -273,9 +463,15 @@ class AbstractFramesIterator(ABC):
             sample_rate (float): rate to sample video
             start_tstamp (float): start time for iterating
             end_tstamp (float): end time condition for iterating
+            target_size (tuple): (width, height) of the frames, or None for
+                                 the original size
+            interpolation (str): one of INTERPOLATIONS
 
         """
         self.cap = video_cap
+        self.target_size = tuple(target_size) if target_size else None
+        self.interpolation = interpolation
+        self.fps = video_fps
         self.period = max(1.0 / sample_rate, 1.0 / video_fps)
         log.debug("Period: {}".format(self.period))
         self.start_tstamp = start_tstamp
@@ -1,8 +1,35 @@
 import cv2
 import sys
+import math
+from functools import partial
+
+import glog as log
 
 from .media_retriever import AbstractMediaRetriever, AbstractFramesIterator
-from .media_retriever import FRAME_EPS
+from .media_retriever import FRAME_EPS, SEEK_COST_FRAMES
+from .media_retriever import DEFAULT_INTERPOLATION
+
+GRAB_STRATEGY = "grab"
+COUNT_STRATEGY = "count"
+SEEK_STRATEGY = "seek"
+STRATEGIES = (GRAB_STRATEGY, COUNT_STRATEGY, SEEK_STRATEGY)
+SKIP_MARGIN_FRAMES = 2
+CFR_TOLERANCE_FRAMES = 0.25
+MAX_REWINDS = 4
+CV2_INTERPOLATIONS = {
+    "nearest": cv2.INTER_NEAREST,
+    "linear": cv2.INTER_LINEAR,
+    "cubic": cv2.INTER_CUBIC,
+    "area": cv2.INTER_AREA,
+}
+
+
+def resize(frame, target_size, interpolation=DEFAULT_INTERPOLATION):
+    """Resize a frame to target_size (width, height), if not None"""
+    if target_size is None or frame is None:
+        return frame
+    return cv2.resize(frame, tuple(target_size),
+                      interpolation=CV2_INTERPOLATIONS[interpolation])
 
 
 class OpenCVMediaRetriever(AbstractMediaRetriever):
@@ -34,7 +61,8 @@ class OpenCVMediaRetriever(AbstractMediaRetriever):
     def _create_video_capture(self):
         """Get the used video capture."""
         if self.is_video:
-            self._cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+            self._cap = cv2.VideoCapture(self.local_path or self.url,
+                                        cv2.CAP_FFMPEG)
 
         return self._cap
 
@@ -51,10 +79,11 @@ class OpenCVMediaRetriever(AbstractMediaRetriever):
         if not self.video_capture.isOpened():
             self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
 
-        f = self.get_frame()
+        _, f = self._get_frame_from_video(0.0)
         return f.shape
 
-    def _get_frame_from_video(self, tstamp):
+    def _get_frame_from_video(self, tstamp, target_size=None,
+                              interpolation=DEFAULT_INTERPOLATION):
         """Return frame if image, or get frame with timestamp in seconds (w/ demicals).
 
         Note: iterating using get_frames_iterator is significantly faster
@@ -62,15 +91,78 @@ class OpenCVMediaRetriever(AbstractMediaRetriever):
         """
         self.video_capture.set(cv2.CAP_PROP_POS_MSEC, tstamp * 1000)
         ret, frame = self.video_capture.read()
-        return ret, frame
+        return ret, resize(frame, target_size, interpolation)
+
+    def _decode_frames(self, frame_idxs, target_size, interpolation):
+        """Decode frames by index, in one forward pass.
+
+        Grabbed frames are identified by their timestamp in the frame index,
+        which is exact on variable frame rate videos. A seek is only done
+        when it is cheaper than grabbing the frames in between.
+
+        """
+        cap = self.video_capture
+        frame_index = self.frame_index
+        cur_idx = None
+        for idx in frame_idxs:
+            if frame_index.should_seek(cur_idx, idx, SEEK_COST_FRAMES):
+                # a POS_MSEC seek may land a frame early, never late
+                seek_idx = max(idx - SKIP_MARGIN_FRAMES, 0)
+                cap.set(cv2.CAP_PROP_POS_MSEC,
+                        frame_index.pts[seek_idx] * 1000)
+            while True:
+                if not cap.grab():
+                    return
+                grabbed = frame_index.frame_index(
+                    cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                )
+                cur_idx = grabbed + 1
+                if grabbed >= idx:
+                    break
+            if grabbed != idx:
+                log.warning(f"Seeked past frame {idx} of {self.url}")
+                continue
+            ret, frame = cap.retrieve()
+            if ret:
+                yield idx, resize(frame, target_size, interpolation)
+
+    def _labeled_frame_index(self, tstamp):
+        """Get the index of the frame frames iterators label with tstamp
+
+        OpenCVFramesIterator reads CAP_PROP_POS_MSEC before grabbing a
+        frame, i.e. labels frame k > 0 with the timestamp of frame k - 1.
+        """
+        idx = self.frame_index.frame_index(tstamp)
+        if idx == 0:
+            return 0
+        return min(idx + 1, len(self.frame_index) - 1)
 
     def _get_frames_iterator_class(self):
+        if self.indexed:
+            return partial(OpenCVFramesIterator, frame_index=self.frame_index)
         return OpenCVFramesIterator
 
 
 class OpenCVFramesIterator(AbstractFramesIterator):
     """Frames iterator object for videos.
 
+    Frames between two samples are skipped with one of these strategies:
+        "grab": grab every frame and query its timestamp
+        "count": grab frames without querying their timestamp, until a
+                 few frames before the next sample, predicted from the fps
+        "seek": seek to the frame a few frames before the next sample
+                (decoding from the previous keyframe), for sparse sampling
+
+    "count" and "seek" predict frame indices from the fps, which only
+    holds on videos with a constant frame rate, starting at 0. The
+    strategy is picked by comparing the number of frames per sample with
+    SEEK_COST_FRAMES, the cost of a seek in grabbed frames, unless a frame
+    index shows the frame rate is variable. After each skip, the timestamp
+    of the capture is checked against the predicted one: on a mismatch,
+    the iterator seeks back before the last sample if it may have skipped
+    the next one, and grabs every frame from then on. Frames and
+    timestamps are identical with every strategy.
+
     Usage:
     for frame, tstamp in frames_iter:
         do_something(frame)
@@ -82,7 +174,11 @@ class OpenCVFramesIterator(AbstractFramesIterator):
                  video_fps,
                  sample_rate=100.0,
                  start_tstamp=0.0,
-                 end_tstamp=sys.maxsize):
+                 end_tstamp=sys.maxsize,
+                 target_size=None,
+                 interpolation=DEFAULT_INTERPOLATION,
+                 strategy=None,
+                 frame_index=None):
         """Frames iterator constructor.
 
         Args:
@@ -90,27 +186,143 @@ class OpenCVFramesIterator(AbstractFramesIterator):
             sample_rate (float): rate to sample video
             start_tstamp (float): start time for iterating
             end_tstamp (float): end time condition for iterating
+            target_size (tuple): (width, height) of the frames, or None for
+                                 the original size
+            interpolation (str): one of INTERPOLATIONS
+            strategy (str): "grab", "count" or "seek". Picked from the
+                            sample_rate, fps and frame_index if None
+            frame_index (FrameIndex): frame index of the video, if built,
+                                      to grab every frame of videos with
+                                      a variable frame rate right away
 
         """
         super(OpenCVFramesIterator, self).__init__(video_cap,
                                                    video_fps=video_fps,
                                                    sample_rate=sample_rate,
                                                    start_tstamp=start_tstamp,
-                                                   end_tstamp=end_tstamp)
+                                                   end_tstamp=end_tstamp,
+                                                   target_size=target_size,
+                                                   interpolation=interpolation)
+        self.frame_index = frame_index
+        if strategy is None:
+            strategy = self._pick_strategy()
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy: {strategy}")
+        self.strategy = strategy
+        log.debug("Sampling strategy: {}".format(strategy))
+
+    def _pick_strategy(self):
+        if not self.fps or self.fps <= 0:
+            return GRAB_STRATEGY
+        if self.frame_index is not None and not (
+                self.frame_index.is_constant_rate(self.fps,
+                                                  CFR_TOLERANCE_FRAMES)):
+            return GRAB_STRATEGY
+        if self.period * self.fps > SEEK_COST_FRAMES:
+            return SEEK_STRATEGY
+        return COUNT_STRATEGY
 
     def _move_cursor_to_tstamp(self, tstamp):
-        """Iterate over frames."""
-        self.cap.set(cv2.CAP_PROP_POS_MSEC, tstamp * 1000)
+        """Move the capture to the frame at tstamp
+
+        Note: frames are labeled with the CAP_PROP_POS_MSEC read before
+        grabbing them, i.e. frame k > 0 with the timestamp of frame k - 1.
+        A CAP_PROP_POS_MSEC seek to tstamp grabs the frame at tstamp next,
+        so the seek is one frame later, for the frame labeled with tstamp
+        to be the one a pass from the start labels with it. On variable
+        frame rate videos, a seek landing late is retried earlier, and the
+        frames labeled before tstamp are skipped by _get_next_frame.
+        """
+        seek_tstamp = tstamp
+        if tstamp > 0 and self.fps:
+            seek_tstamp += 1.0 / self.fps
+        self.cap.set(cv2.CAP_PROP_POS_MSEC, seek_tstamp * 1000)
+        if (tstamp > 0 and self.fps and self.cap.get(cv2.CAP_PROP_POS_MSEC)
+                / 1000.0 > tstamp + FRAME_EPS):
+            self._seek_before(tstamp)
+        self._frame_idx = int(round(self.cap.get(cv2.CAP_PROP_POS_FRAMES)))
+
+    def _skip_to_next_sample(self):
+        """Skip the frames before the next sample, without decoding them
+        all if seeking, nor querying their timestamps.
+
+        The timestamp queried before grabbing frame k is the one of frame
+        k - 1, so the next sample is predicted to be frame
+        ceil(next_tstamp * fps) + 1. Frames from SKIP_MARGIN_FRAMES before
+        it are grabbed as usual, to get identical timestamps.
+        """
+        next_tstamp = self.cur_tstamp + self.period - FRAME_EPS
+        target_idx = math.ceil(next_tstamp * self.fps) + 1 - SKIP_MARGIN_FRAMES
+        num_skipped = target_idx - self._frame_idx
+        if num_skipped <= 0:
+            return
+
+        if self.strategy == SEEK_STRATEGY and num_skipped > SEEK_COST_FRAMES:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, target_idx)
+            self._frame_idx = target_idx
+        else:
+            for _ in range(num_skipped):
+                if not self.cap.grab():
+                    return
+                self._frame_idx += 1
+        self._check_constant_rate()
+
+    def _check_constant_rate(self):
+        """Fall back to the grab strategy if the capture is not at the
+        timestamp predicted from the fps, i.e. the frame rate is variable
+
+        After grabbing frame k - 1, the capture is at the timestamp of
+        frame k - 1, (k - 1) / fps on constant frame rate videos. If that
+        timestamp is past the next sample, frames that should have been
+        sampled may have been skipped, so the capture seeks back before
+        the last sample. Frames up to the last sample are grabbed again
+        but not sampled.
+        """
+        tstamp = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        expected = (self._frame_idx - 1) / self.fps
+        if abs(tstamp - expected) <= CFR_TOLERANCE_FRAMES / self.fps:
+            return
+        log.info(f"Frame at {tstamp:.3f}s instead of {expected:.3f}s, the"
+                 " frame rate is variable: grabbing every frame")
+        self.strategy = GRAB_STRATEGY
+        if tstamp + FRAME_EPS >= self.cur_tstamp + self.period:
+            self._seek_before(self.cur_tstamp)
+
+    def _seek_before(self, tstamp):
+        """Seek to a frame at or before tstamp
+
+        POS_MSEC seeks land late on variable frame rate videos (OpenCV
+        converts them to frame indices with the fps), so a seek landing
+        after tstamp is retried earlier by its overshoot, falling back to
+        the first frame.
+        """
+        seek_tstamp = tstamp - SKIP_MARGIN_FRAMES / self.fps
+        for _ in range(MAX_REWINDS):
+            if seek_tstamp <= 0:
+                break
+            self.cap.set(cv2.CAP_PROP_POS_MSEC, seek_tstamp * 1000)
+            landed = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if landed <= tstamp:
+                return
+            seek_tstamp -= landed - tstamp + SKIP_MARGIN_FRAMES / self.fps
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
 
     def _get_next_frame(self):
+        if self.strategy != GRAB_STRATEGY and not self.first_frame:
+            self._skip_to_next_sample()
+
         ret = True
         while ret and self.cur_tstamp <= self.end_tstamp:
             tstamp = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
             ret = self.cap.grab()
+            self._frame_idx += 1
+            if self.first_frame and tstamp + FRAME_EPS < self.start_tstamp:
+                continue
             if (tstamp - self.cur_tstamp + FRAME_EPS) >= (
                 self.period
             ) or self.first_frame:
                 ret, frame = self.cap.retrieve()
+                frame = resize(frame, self.target_size, self.interpolation)
                 self.cur_tstamp = tstamp
                 self.first_frame = False
                 return ret, frame, self._round_tstamp(tstamp)
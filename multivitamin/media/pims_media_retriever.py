@@ -1,7 +1,18 @@
 import sys
 import pims
 import numpy as np
+from PIL import Image
 from .media_retriever import AbstractMediaRetriever, AbstractFramesIterator
+from .media_retriever import DEFAULT_INTERPOLATION, PIL_INTERPOLATIONS
+
+
+def resize(frame, target_size, interpolation=DEFAULT_INTERPOLATION):
+    """Resize a frame to target_size (width, height), if not None"""
+    if target_size is None or frame is None:
+        return frame
+    image = Image.fromarray(frame).resize(tuple(target_size),
+                                          PIL_INTERPOLATIONS[interpolation])
+    return np.array(image)
 
 
 class PIMSMediaRetriever(AbstractMediaRetriever):
@@ -33,7 +44,7 @@ class PIMSMediaRetriever(AbstractMediaRetriever):
     def _create_video_capture(self):
         """Get the used video capture."""
         if self._cap is None:
-            self._cap = pims.Video(self.url)
+            self._cap = pims.Video(self.local_path or self.url)
 
         return self._cap
 
@@ -49,7 +60,8 @@ class PIMSMediaRetriever(AbstractMediaRetriever):
         shape = self.video_capture.frame_shape
         return shape
 
-    def _get_frame_from_video(self, tstamp=0.0):
+    def _get_frame_from_video(self, tstamp=0.0, target_size=None,
+                              interpolation=DEFAULT_INTERPOLATION):
         """Return frame if image, or get frame with timestamp in seconds (w/ demicals).
 
         Note: iterating using get_frames_iterator is significantly faster
@@ -61,6 +73,7 @@ class PIMSMediaRetriever(AbstractMediaRetriever):
         try:
             frame = self.video_capture[frame_idx]
             frame = np.array(frame)[:, :, ::-1]  # RGB to BGR
+            frame = resize(frame, target_size, interpolation)
         except ValueError:
             ret = False
 
@@ -78,7 +91,9 @@ class PIMSFramesIterator(AbstractFramesIterator):
                  video_fps,
                  sample_rate=100.0,
                  start_tstamp=0.0,
-                 end_tstamp=sys.maxsize):
+                 end_tstamp=sys.maxsize,
+                 target_size=None,
+                 interpolation=DEFAULT_INTERPOLATION):
         """Frames iterator constructor.
 
         Args:
@@ -86,13 +101,18 @@ class PIMSFramesIterator(AbstractFramesIterator):
             sample_rate (float): rate to sample video
             start_tstamp (float): start time for iterating
             end_tstamp (float): end time condition for iterating
+            target_size (tuple): (width, height) of the frames, or None for
+                                 the original size
+            interpolation (str): one of INTERPOLATIONS
 
         """
         super(PIMSFramesIterator, self).__init__(video_cap,
                                                  video_fps=video_fps,
                                                  sample_rate=sample_rate,
                                                  start_tstamp=start_tstamp,
-                                                 end_tstamp=end_tstamp)
+                                                 end_tstamp=end_tstamp,
+                                                 target_size=target_size,
+                                                 interpolation=interpolation)
 
     def _move_cursor_to_tstamp(self):
         """Iterate over frames."""
@@ -107,6 +127,7 @@ class PIMSFramesIterator(AbstractFramesIterator):
             frame_idx = round(self.cur_tstamp * self.cap.frame_rate)
             frame = self.cap[frame_idx]
             frame = np.array(frame)[:, :, ::-1]
+            frame = resize(frame, self.target_size, self.interpolation)
             self.cur_tstamp += self.period
             tstamp = frame_idx / self.cap.frame_rate
             return frame, self._round_tstamp(tstamp)
@@ -0,0 +1,123 @@
+import threading
+from collections import deque
+
+import glog as log
+
+PREFETCH_DEPTH = 16
+PREFETCH_MAX_BYTES = 256 * 1024 ** 2
+
+
+class PrefetchingFramesIterator:
+    """Decodes frames ahead of the consumer on a background thread.
+
+    Wraps a frames iterator (e.g. from get_frames_iterator), and fills a
+    bounded buffer of (frame, tstamp) pairs from a background thread, so
+    that decoding the next frames overlaps with processing the current
+    ones. OpenCV releases the GIL while decoding.
+
+    The buffer holds at most `depth` frames and `max_bytes` bytes of
+    frames (but always at least one frame). Exceptions raised by the
+    wrapped iterator are raised by the consumer, once the frames decoded
+    before the error have been consumed.
+
+    Call close() if the iterator is not consumed to the end, to stop the
+    background thread.
+
+    Usage:
+    frames_iterator = PrefetchingFramesIterator(
+        media.get_frames_iterator(sample_rate), depth=16
+    )
+    for frame, tstamp in frames_iterator:
+        do_something(frame, tstamp)
+    """
+
+    def __init__(self, frames_iterator, depth=PREFETCH_DEPTH,
+                 max_bytes=PREFETCH_MAX_BYTES):
+        """Init PrefetchingFramesIterator.
+
+        Args:
+            frames_iterator (iterable): (frame, tstamp) pairs
+            depth (int): max number of frames decoded ahead
+            max_bytes (int): max bytes of frames decoded ahead
+        """
+        if depth < 1:
+            raise ValueError("depth must be >= 1")
+        self.frames_iterator = frames_iterator
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self._buffer = deque()
+        self._buffered_bytes = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._done = False
+        self._stopped = False
+        self._error = None
+
+    @property
+    def buffered_bytes(self):
+        """Get the number of bytes of frames decoded ahead."""
+        return self._buffered_bytes
+
+    def __iter__(self):
+        self._start()
+        return self
+
+    def __next__(self):
+        self._start()
+        with self._cond:
+            # after close() no thread may be left to set _done
+            while not self._buffer and not self._done and not self._stopped:
+                self._cond.wait()
+            if self._buffer:
+                frame, tstamp, nbytes = self._buffer.popleft()
+                self._buffered_bytes -= nbytes
+                self._cond.notify_all()
+                return frame, tstamp
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        raise StopIteration()
+
+    def close(self):
+        """Stop decoding and drop the frames decoded ahead."""
+        with self._cond:
+            self._stopped = True
+            self._buffer.clear()
+            self._buffered_bytes = 0
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _start(self):
+        if self._thread is None and not self._stopped:
+            self._thread = threading.Thread(target=self._prefetch, daemon=True)
+            self._thread.start()
+
+    def _is_full(self, nbytes):
+        if not self._buffer:
+            return False
+        return (len(self._buffer) >= self.depth or
+                self._buffered_bytes + nbytes > self.max_bytes)
+
+    def _prefetch(self):
+        frames_iterator = iter(self.frames_iterator)
+        try:
+            for frame, tstamp in frames_iterator:
+                nbytes = getattr(frame, "nbytes", 0)
+                with self._cond:
+                    while not self._stopped and self._is_full(nbytes):
+                        self._cond.wait()
+                    if self._stopped:
+                        break
+                    self._buffer.append((frame, tstamp, nbytes))
+                    self._buffered_bytes += nbytes
+                    self._cond.notify_all()
+        except Exception as e:
+            log.error(f"Error decoding frames: {e}")
+            self._error = e
+        finally:
+            if hasattr(frames_iterator, "close"):
+                frames_iterator.close()
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
@@ -0,0 +1,340 @@
+import os
+import json
+import time
+import threading
+import urllib.parse
+from io import BytesIO
+from collections import OrderedDict
+
+import cv2
+import magic
+import requests
+import glog as log
+from PIL import Image
+
+from multivitamin.utils.single_flight import SingleFlight
+
+PROBE_TTL_SEC = 3600
+PROBE_CACHE_SIZE = 4096
+PROBE_HEADER_BYTES = 64 * 1024
+PROBE_MAX_HEADER_BYTES = 4 * 1024 ** 2
+PROBE_TIMEOUT_SEC = 30
+
+
+class MediaInfo:
+    def __init__(
+        self,
+        url,
+        content_type=None,
+        size=None,
+        etag=None,
+        width=None,
+        height=None,
+        fps=None,
+        num_frames=None,
+        duration=None,
+    ):
+        """Metadata of a media, as returned by probe
+
+        Args:
+            url (str): local or remote url
+            content_type (str): MIME type
+            size (int): size in bytes, None if unknown
+            etag (str): ETag (or Last-Modified) of a remote file, mtime and
+                        size of a local file
+            width (int): width of the frames
+            height (int): height of the frames
+            fps (float): frame rate of a video, None for images
+            num_frames (int): number of frames, 1 for images
+            duration (float): duration in seconds, 0 for images
+        """
+        self.url = url
+        self.content_type = content_type
+        self.size = size
+        self.etag = etag
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.num_frames = num_frames
+        self.duration = duration
+
+    @property
+    def is_image(self):
+        return self.content_type is not None and "image" in self.content_type
+
+    @property
+    def is_video(self):
+        return self.content_type is not None and "video" in self.content_type
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    def __repr__(self):
+        return f"MediaInfo({self.__dict__})"
+
+
+class ProbeCache:
+    def __init__(self, store=None, ttl=PROBE_TTL_SEC,
+                 max_entries=PROBE_CACHE_SIZE):
+        """Caches the MediaInfo of urls, in memory and optionally on disk
+
+        Entries are keyed by url and hold the ETag of the file they were
+        probed from. Local files are revalidated on every lookup with a
+        stat. Remote files are trusted for ttl seconds, then revalidated
+        with a single HEAD request: the media is only probed again if its
+        ETag changed. Concurrent probes of the same url are coalesced.
+
+        Args:
+            store (ResultStore): optional persistent store, e.g.
+                                 multivitamin.utils.result_cache.SQLiteResultStore,
+                                 shared across processes and restarts
+            ttl (float): seconds a remote entry is used without revalidation
+            max_entries (int): max number of entries kept in memory (LRU)
+        """
+        self.store = store
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._single_flight = SingleFlight()
+
+    def probe(self, url):
+        """Get the MediaInfo of url, None if it does not exist"""
+        return self._single_flight.do(url, self._probe, url)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _probe(self, url):
+        info, probed_at = self._get(url)
+        path = _local_path(url)
+        if path is not None:
+            etag = _local_etag(path)
+            if etag is None:
+                return None
+            if info is not None and info.etag == etag:
+                return info
+            info = _probe_local(url, path, etag)
+        else:
+            if info is not None and time.time() - probed_at < self.ttl:
+                return info
+            if info is not None and info.etag is not None:
+                if _remote_etag(url) == info.etag:
+                    log.debug(f"Revalidated probe of {url}")
+                    self._put(url, info)
+                    return info
+            info = _probe_remote(url)
+
+        if info is not None:
+            self._put(url, info)
+        return info
+
+    def _get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                return entry
+        if self.store is None:
+            return None, None
+        value = self.store.get(_store_key(url))
+        if value is None:
+            return None, None
+        d = json.loads(value)
+        entry = MediaInfo.from_dict(d["info"]), d["probed_at"]
+        self._remember(url, entry)
+        return entry
+
+    def _put(self, url, info):
+        entry = info, time.time()
+        self._remember(url, entry)
+        if self.store is not None:
+            value = {"info": info.to_dict(), "probed_at": entry[1]}
+            self.store.put(_store_key(url), json.dumps(value))
+
+    def _remember(self, url, entry):
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_PROBE_CACHE = ProbeCache()
+
+
+def get_probe_cache():
+    """Get the ProbeCache used by probe and the MediaRetrievers"""
+    return _PROBE_CACHE
+
+
+def set_probe_cache(cache):
+    """Set the ProbeCache used by probe and the MediaRetrievers
+
+    Usage:
+    set_probe_cache(ProbeCache(SQLiteResultStore("/tmp/probe.db")))
+    """
+    global _PROBE_CACHE
+    _PROBE_CACHE = cache
+
+
+def probe(url, cache=None):
+    """Get the metadata of a media in a single probe
+
+    Remote files are probed with one ranged GET of their first bytes,
+    which gives the content type, size and ETag, and the dimensions of
+    images (parsed from their header, without decoding). Videos are
+    opened (but not decoded) to read their dimensions, fps and number of
+    frames.
+
+    Args:
+        url (str): local or remote url
+        cache (ProbeCache): defaults to get_probe_cache()
+
+    Returns:
+        MediaInfo: None if the file does not exist
+    """
+    if cache is None:
+        cache = _PROBE_CACHE
+    return cache.probe(url)
+
+
+def _store_key(url):
+    return "probe:" + url
+
+
+def _local_path(url):
+    """Get the filepath of a local url, None if remote"""
+    if urllib.parse.urlparse(url).scheme in ["", "file"]:
+        return url.replace("file://", "")
+    return None
+
+
+def _local_etag(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def _probe_local(url, path, etag):
+    content_type = magic.Magic(mime=True).from_file(path)
+    info = MediaInfo(url, content_type=content_type,
+                     size=os.path.getsize(path), etag=etag)
+    if info.is_image:
+        try:
+            with Image.open(path) as image:
+                info.width, info.height = image.size
+        except Exception as e:
+            log.warning(f"Failed to read image header of {url}: {e}")
+        _set_image_frames(info)
+    elif info.is_video:
+        _probe_video(info, path)
+    return info
+
+
+def _remote_etag(url):
+    try:
+        resp = requests.head(url, allow_redirects=True,
+                             timeout=PROBE_TIMEOUT_SEC)
+    except Exception as e:
+        log.warning(f"Failed to retrieve url: {e}")
+        return None
+    return _etag(resp)
+
+
+def _etag(resp):
+    return resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+
+
+def _read_head(url, num_bytes):
+    """GET the first num_bytes of url
+
+    Returns:
+        tuple: (response, bytes), the response is closed
+    """
+    resp = requests.get(url, headers={"Range": f"bytes=0-{num_bytes - 1}"},
+                        stream=True, timeout=PROBE_TIMEOUT_SEC)
+    with resp:
+        if resp.status_code >= 400:
+            return resp, b""
+        return resp, resp.raw.read(num_bytes, decode_content=True)
+
+
+def _total_size(resp):
+    content_range = resp.headers.get("Content-Range", "")
+    if "/" in content_range and not content_range.endswith("*"):
+        return int(content_range.rsplit("/", 1)[1])
+    if resp.status_code == 200 and "Content-Length" in resp.headers:
+        return int(resp.headers["Content-Length"])
+    return None
+
+
+def _image_size(head):
+    try:
+        with Image.open(BytesIO(head)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def _probe_remote(url):
+    try:
+        resp, head = _read_head(url, PROBE_HEADER_BYTES)
+    except Exception as e:
+        log.warning(f"Failed to retrieve url: {e}")
+        return None
+    if resp.status_code >= 400:
+        log.warning(f"Failed to retrieve url: {url} ({resp.status_code})")
+        return None
+
+    info = MediaInfo(url, content_type=resp.headers.get("Content-Type"),
+                     size=_total_size(resp), etag=_etag(resp))
+    if info.is_image:
+        size = _image_size(head)
+        num_bytes = len(head)
+        # large metadata (e.g. EXIF thumbnails) before the image header
+        while (size is None and num_bytes < PROBE_MAX_HEADER_BYTES and
+               (info.size is None or num_bytes < info.size)):
+            num_bytes *= 4
+            try:
+                _, head = _read_head(url, num_bytes)
+            except Exception as e:
+                log.warning(f"Failed to retrieve url: {e}")
+                break
+            size = _image_size(head)
+        if size is not None:
+            info.width, info.height = size
+        _set_image_frames(info)
+    elif info.is_video:
+        _probe_video(info, url)
+    return info
+
+
+def _set_image_frames(info):
+    info.num_frames = 1
+    info.duration = 0
+
+
+def _probe_video(info, src):
+    """Read the dimensions, fps and number of frames of a video"""
+    cap = cv2.VideoCapture(src, cv2.CAP_FFMPEG)
+    try:
+        if not cap.isOpened():
+            log.warning(f"Failed to open video: {info.url}")
+            return
+        info.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or None
+        info.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or None
+        info.fps = cap.get(cv2.CAP_PROP_FPS)
+        info.num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        info.duration = info.num_frames / info.fps if info.fps else 0
+    finally:
+        cap.release()
@@ -0,0 +1,288 @@
+import sys
+import functools
+
+import numpy as np
+import glog as log
+
+try:
+    import av
+except ImportError:
+    raise ImportError("package: av not found")
+
+from .media_retriever import AbstractMediaRetriever, AbstractFramesIterator
+from .media_retriever import FRAME_EPS, SEEK_COST_FRAMES
+from .media_retriever import DEFAULT_INTERPOLATION
+
+THREAD_TYPE = "AUTO"  # frame and slice threading
+SKIP_NONREF_MIN_FRAMES = 4
+SWS_INTERPOLATIONS = {
+    "nearest": "POINT",
+    "linear": "BILINEAR",
+    "cubic": "BICUBIC",
+    "area": "AREA",
+}
+
+
+class PyAVMediaRetriever(AbstractMediaRetriever):
+    """A fileretriever for visual media, decoding videos with PyAV."""
+
+    def __init__(self, url=None, thread_type=THREAD_TYPE, thread_count=0,
+                 skip_nonref=None, num_buffers=0):
+        """Init MediaRetriever.
+
+        Args:
+            url (str | optional): The local or remote url to a file
+            thread_type (str): ffmpeg threading, "AUTO", "FRAME", "SLICE"
+                               or "NONE"
+            thread_count (int): number of decoding threads, 0 for auto
+            skip_nonref (bool): skip decoding non-reference frames when
+                                iterating. By default, only when sampling
+                                at least SKIP_NONREF_MIN_FRAMES frames
+                                apart
+            num_buffers (int): if > 0, frames iterators write frames into a
+                               ring of num_buffers reused arrays, which are
+                               overwritten num_buffers frames later
+
+        """
+        self.thread_type = thread_type
+        self.thread_count = thread_count
+        self.skip_nonref = skip_nonref
+        self.num_buffers = num_buffers
+        super(PyAVMediaRetriever, self).__init__(url=url)
+
+    @property
+    def is_video(self):
+        """Check if url is a video."""
+        if self.content_type is None:
+            return False
+        return "video" in self.content_type
+
+    @property
+    def is_image(self):
+        """Check if url is an image."""
+        if self.content_type is None:
+            return False
+        return "image" in self.content_type and "gif" not in self.content_type
+
+    @property
+    def video_stream(self):
+        """Get the video stream of the container."""
+        return self.video_capture.streams.video[0]
+
+    def _create_video_capture(self):
+        """Get the used video capture."""
+        if self.is_video:
+            self._cap = av.open(self.local_path or self.url)
+            stream = self._cap.streams.video[0]
+            stream.thread_type = self.thread_type
+            stream.thread_count = self.thread_count
+
+        return self._cap
+
+    def _get_fps_from_video_capture(self):
+        """Get the fps of the image/video."""
+        rate = self.video_stream.average_rate or self.video_stream.guessed_rate
+        return float(rate) if rate else 0.0
+
+    def _get_num_frames(self):
+        """Get the total number of frames."""
+        stream = self.video_stream
+        if stream.frames:
+            return stream.frames
+        if stream.duration is not None:
+            duration = float(stream.duration * stream.time_base)
+        else:
+            duration = self.video_capture.duration / av.time_base
+        return int(round(duration * self.fps))
+
+    def _get_video_frame_shape(self):
+        """Get height by width by channels for frames."""
+        codec_context = self.video_stream.codec_context
+        return codec_context.height, codec_context.width, 3
+
+    def _get_frame_from_video(self, tstamp, target_size=None,
+                              interpolation=DEFAULT_INTERPOLATION):
+        """Return frame if image, or get frame with timestamp in seconds (w/ demicals).
+
+        Note: iterating using get_frames_iterator is significantly faster
+
+        """
+        frames_iterator = PyAVFramesIterator(self.video_capture, self.fps,
+                                             start_tstamp=tstamp,
+                                             target_size=target_size,
+                                             interpolation=interpolation,
+                                             skip_nonref=False)
+        for frame, _ in frames_iterator:
+            return True, frame
+        return False, None
+
+    def _decode_frames(self, frame_idxs, target_size, interpolation):
+        """Decode frames by index, in one forward pass.
+
+        Decoded frames are identified by their PTS in the frame index. A
+        seek (to the keyframe before the next frame) is only done when it
+        is cheaper than decoding the frames in between.
+
+        """
+        frame_index = self.frame_index
+        stream = self.video_stream
+        stream.codec_context.skip_frame = "DEFAULT"
+        start_sec = float((stream.start_time or 0) * stream.time_base)
+        reformatter = av.video.reformatter.VideoReformatter()
+        decoded = None
+        cur_idx = None
+        for idx in frame_idxs:
+            if (decoded is None or
+                    frame_index.should_seek(cur_idx, idx, SEEK_COST_FRAMES)):
+                offset = round((frame_index.pts[idx] + start_sec) /
+                               stream.time_base)
+                self.video_capture.seek(offset, stream=stream, backward=True)
+                decoded = self.video_capture.decode(stream)
+            grabbed = None
+            for frame in decoded:
+                if frame.time is None:
+                    continue
+                grabbed = frame_index.frame_index(frame.time - start_sec)
+                cur_idx = grabbed + 1
+                if grabbed >= idx:
+                    break
+            else:
+                return
+            if grabbed == idx:
+                yield idx, to_ndarray(reformatter, frame, target_size,
+                                      interpolation)
+
+    def _get_frames_iterator_class(self):
+        return functools.partial(PyAVFramesIterator,
+                                 skip_nonref=self.skip_nonref,
+                                 num_buffers=self.num_buffers)
+
+
+class PyAVFramesIterator(AbstractFramesIterator):
+    """Frames iterator object for videos, decoded with PyAV.
+
+    Timestamps are the presentation timestamps of the frames, relative to
+    the start of the video stream. When the next sample is more than
+    SEEK_COST_FRAMES frames ahead, the iterator seeks to the keyframe
+    before it instead of decoding every frame in between.
+
+    Frames are scaled to target_size by the ffmpeg scaler, while being
+    converted to BGR.
+
+    When skipping non-reference frames, samples land on the first
+    reference frame at or after their target time.
+
+    Usage:
+    for frame, tstamp in frames_iter:
+        do_something(frame)
+
+    """
+
+    def __init__(self,
+                 video_cap,
+                 video_fps,
+                 sample_rate=100.0,
+                 start_tstamp=0.0,
+                 end_tstamp=sys.maxsize,
+                 target_size=None,
+                 interpolation=DEFAULT_INTERPOLATION,
+                 skip_nonref=None,
+                 num_buffers=0):
+        """Frames iterator constructor.
+
+        Args:
+            video_cap (av.container.InputContainer): container
+            sample_rate (float): rate to sample video
+            start_tstamp (float): start time for iterating
+            end_tstamp (float): end time condition for iterating
+            target_size (tuple): (width, height) of the frames, or None for
+                                 the original size
+            interpolation (str): one of INTERPOLATIONS
+            skip_nonref (bool): skip non-reference frames. By default, only
+                                when sampling at least
+                                SKIP_NONREF_MIN_FRAMES frames apart
+            num_buffers (int): if > 0, size of the ring of reused arrays
+                               frames are written into
+
+        """
+        self.stream = video_cap.streams.video[0]
+        start_time = self.stream.start_time or 0
+        self._start_sec = float(start_time * self.stream.time_base)
+        self._frames = None
+        self._last_tstamp = None
+        self._reformatter = av.video.reformatter.VideoReformatter()
+        self._buffers = [None] * num_buffers
+        self._buffer_idx = 0
+        super(PyAVFramesIterator, self).__init__(video_cap,
+                                                 video_fps=video_fps,
+                                                 sample_rate=sample_rate,
+                                                 start_tstamp=start_tstamp,
+                                                 end_tstamp=end_tstamp,
+                                                 target_size=target_size,
+                                                 interpolation=interpolation)
+        frames_per_sample = self.period * video_fps if video_fps else 0
+        if skip_nonref is None:
+            skip_nonref = frames_per_sample >= SKIP_NONREF_MIN_FRAMES
+        self.stream.codec_context.skip_frame = (
+            "NONREF" if skip_nonref else "DEFAULT"
+        )
+        self._seek_min_sec = (SEEK_COST_FRAMES / video_fps if video_fps
+                              else sys.maxsize)
+        log.debug("skip_nonref: {}".format(skip_nonref))
+
+    def _move_cursor_to_tstamp(self, tstamp):
+        """Seek to the keyframe before tstamp."""
+        offset = int((tstamp + self._start_sec) / self.stream.time_base)
+        self.cap.seek(offset, stream=self.stream, backward=True)
+        self._frames = self.cap.decode(self.stream)
+        self._last_tstamp = None
+
+    def _get_next_frame(self):
+        if self.first_frame:
+            target = self.start_tstamp - FRAME_EPS
+        else:
+            target = self.cur_tstamp + self.period - FRAME_EPS
+            if (self._last_tstamp is not None and
+                    target - self._last_tstamp > self._seek_min_sec):
+                self._move_cursor_to_tstamp(target)
+
+        for frame in self._frames:
+            if frame.time is None:
+                continue
+            tstamp = frame.time - self._start_sec
+            self._last_tstamp = tstamp
+            if tstamp > self.end_tstamp:
+                break
+            if tstamp >= target:
+                self.cur_tstamp = tstamp
+                self.first_frame = False
+                return True, self._to_ndarray(frame), self._round_tstamp(tstamp)
+        return False, None, None
+
+    def _to_ndarray(self, frame):
+        """Convert a frame to a BGR array, reusing the scaler context."""
+        array = to_ndarray(self._reformatter, frame, self.target_size,
+                           self.interpolation)
+        if not self._buffers:
+            return array
+
+        buffer = self._buffers[self._buffer_idx]
+        if buffer is None or buffer.shape != array.shape:
+            buffer = np.empty_like(array)
+            self._buffers[self._buffer_idx] = buffer
+        np.copyto(buffer, array)
+        self._buffer_idx = (self._buffer_idx + 1) % len(self._buffers)
+        return buffer
+
+
+def to_ndarray(reformatter, frame, target_size=None,
+               interpolation=DEFAULT_INTERPOLATION):
+    """Convert a frame to a BGR array of target_size (width, height)"""
+    width, height = target_size or (None, None)
+    return reformatter.reformat(
+        frame,
+        width=width,
+        height=height,
+        format="bgr24",
+        interpolation=SWS_INTERPOLATIONS[interpolation],
+    ).to_ndarray()
@@ -0,0 +1,164 @@
+import sys
+
+import glog as log
+
+from .media_retriever import DEFAULT_INTERPOLATION, FRAME_EPS
+
+MAX_CACHED_BYTES = 1024 ** 3
+
+
+class SharedFramesSource:
+    """Decodes the media of a request once and shares the frames.
+
+    The first frames iterator handed out decodes the media and records
+    the (frame, tstamp) pairs it yields. Once it has been fully consumed,
+    every following iterator replays the recorded frames instead of
+    decoding the media again.
+
+    If the recorded frames exceed `max_cached_bytes`, or the first
+    iterator is not consumed to the end, recording is dropped and
+    following iterators decode the media themselves.
+
+    Note: replayed frames are the same numpy arrays for every consumer,
+    they must not be modified in place.
+
+    Usage:
+    source = SharedFramesSource(url, sample_rate)
+    for module in modules:
+        for frame, tstamp in source.get_frames_iterator():
+            do_something(frame, tstamp)
+    """
+
+    def __init__(
+        self,
+        url,
+        sample_rate,
+        max_cached_bytes=MAX_CACHED_BYTES,
+        start_tstamp=0.0,
+        end_tstamp=sys.maxsize,
+        media_backend="opencv",
+    ):
+        """Init SharedFramesSource.
+
+        Args:
+            url (str): local or remote url to an image or video
+            sample_rate (float): rate to sample video
+            max_cached_bytes (int): max bytes of frames kept in memory
+            start_tstamp (float): start time for iterating
+            end_tstamp (float): end time condition for iterating
+            media_backend (str): decoding backend, see get_media_retriever
+        """
+        self.url = url
+        self.sample_rate = sample_rate
+        self.start_tstamp = start_tstamp
+        self.end_tstamp = end_tstamp
+        self.max_cached_bytes = max_cached_bytes
+        self.media_backend = media_backend
+        self._media = None
+        self._recordings = {}
+
+    @property
+    def media(self):
+        """Get the MediaRetriever, constructed once for all consumers."""
+        if self._media is None:
+            from . import get_media_retriever
+            self._media = get_media_retriever(self.url, self.media_backend)
+        return self._media
+
+    @property
+    def cached_bytes(self):
+        """Get the number of bytes of frames currently cached."""
+        return sum(rec.cached_bytes for rec in self._recordings.values())
+
+    def get_frames_iterator(self, target_size=None,
+                            interpolation=DEFAULT_INTERPOLATION,
+                            tstamps=None):
+        """Get a frames iterator at the source's sample_rate
+
+        Frames are recorded once per (target_size, interpolation), all
+        recordings share max_cached_bytes.
+
+        Args:
+            target_size (tuple): (width, height) of the frames, or None for
+                                 the original size
+            interpolation (str): one of INTERPOLATIONS
+            tstamps (list[float]): only iterate over the frames at these
+                                   tstamps (sorted). Picked from the
+                                   recording if complete, else only these
+                                   frames are decoded, and not recorded
+
+        Returns:
+            iterator: (frame, tstamp) pairs
+        """
+        key = (tuple(target_size) if target_size else None, interpolation)
+        recording = self._recordings.setdefault(key, _Recording())
+        if recording.complete:
+            log.debug(f"Replaying {len(recording.frames)} cached frames")
+            if tstamps is not None:
+                return _select(recording.frames, tstamps)
+            return iter(recording.frames)
+
+        frames_iterator = self.media.get_frames_iterator(
+            self.sample_rate,
+            start_tstamp=self.start_tstamp,
+            end_tstamp=self.end_tstamp,
+            target_size=target_size,
+            interpolation=interpolation,
+            tstamps=tstamps,
+        )
+        if (tstamps is not None or recording.overflowed or
+                recording.recording or self.max_cached_bytes <= 0):
+            return frames_iterator
+        return self._record(recording, frames_iterator)
+
+    def _record(self, recording, frames_iterator):
+        """Yield from frames_iterator while caching its frames"""
+        recording.recording = True
+        finished = False
+        try:
+            for frame, tstamp in frames_iterator:
+                if not recording.overflowed:
+                    self._cache(recording, frame, tstamp)
+                yield frame, tstamp
+            finished = True
+        finally:
+            recording.recording = False
+            if finished and not recording.overflowed:
+                recording.complete = True
+                log.debug(f"Cached {len(recording.frames)} frames"
+                          f" ({recording.cached_bytes} bytes)")
+            elif not recording.complete:
+                recording.clear()
+
+    def _cache(self, recording, frame, tstamp):
+        nbytes = getattr(frame, "nbytes", 0)
+        if self.cached_bytes + nbytes > self.max_cached_bytes:
+            log.info(f"Frames of {self.url} exceed {self.max_cached_bytes}"
+                     " bytes, not sharing them")
+            recording.overflowed = True
+            recording.clear()
+            return
+        recording.frames.append((frame, tstamp))
+        recording.cached_bytes += nbytes
+
+
+class _Recording:
+    """Frames recorded for one (target_size, interpolation)"""
+
+    def __init__(self):
+        self.frames = []
+        self.cached_bytes = 0
+        self.recording = False
+        self.complete = False
+        self.overflowed = False
+
+    def clear(self):
+        self.frames = []
+        self.cached_bytes = 0
+
+
+def _select(frames, tstamps):
+    """Iterate over the (frame, tstamp) pairs at tstamps, up to FRAME_EPS"""
+    keys = set(round(tstamp / FRAME_EPS) for tstamp in tstamps)
+    return ((frame, tstamp) for frame, tstamp in frames
+            if round(tstamp / FRAME_EPS) in keys)
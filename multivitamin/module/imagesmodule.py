@@ -1,17 +1,42 @@
 from abc import abstractmethod
+import copy
 import traceback
-import pandas as pd
 import glog as log
 
 from .module import Module, Codes
-from .utils import (pandas_query_matches_props,
-                    batch_generator)
-from ..media import MediaRetriever
+from .utils import (batch_generator,
+                    frame_signature,
+                    signature_distance)
+from ..media import get_media_retriever, MEDIA_RETRIEVER_BACKENDS
+from ..media.media_retriever import DEFAULT_INTERPOLATION, check_interpolation
+from ..media.prefetching_frames_iterator import (PrefetchingFramesIterator,
+                                                 PREFETCH_MAX_BYTES)
+from ..data.response.utils import round_float
+from ..data.response.config import TIME_EPS
+from ..data.response.dtypes import create_region_id
+from .tracking import BoxTracker
 
 
 MAX_PROBLEMATIC_FRAMES = 10
 BATCH_SIZE = 1
 
+_CONTEXT_ATTRS = (
+    "response",
+    "request",
+    "code",
+    "tstamps_processed",
+    "prev_regions_of_interest_count",
+    "media",
+    "frames_iterator",
+    "prev_footprints",
+    "prev_tstamps",
+    "skipped_tstamps",
+    "tracked_tstamps",
+    "skip_refs",
+    "ref_signature",
+    "tracker",
+)
+
 
 class ImagesModule(Module):
     def __init__(
@@ -22,7 +47,58 @@ class ImagesModule(Module):
         prop_id_map=None,
         module_id_map=None,
         batch_size=BATCH_SIZE,
+        incremental=False,
+        prefetch_depth=0,
+        prefetch_max_bytes=PREFETCH_MAX_BYTES,
+        target_size=None,
+        interpolation=DEFAULT_INTERPOLATION,
+        skip_similar_threshold=None,
+        detect_every=1,
+        scene_change_threshold=None,
+        media_backend="opencv",
     ):
+        """Module processing the frames of an image or video
+
+        Args:
+            server_name (str): name of the module
+            version (str): version of the module
+            prop_type (str): property type
+            prop_id_map (dict): map of property values to ids
+            module_id_map (dict): map of module names to ids
+            batch_size (int): max number of frames per process_images call
+            incremental (bool): skip the tstamps already processed by this
+                                module (same name and version) according
+                                to the footprints of the previous response,
+                                and merge them into a single footprint
+            prefetch_depth (int): number of video frames decoded ahead on a
+                                  background thread, while process_images
+                                  runs. 0 to decode on the calling thread
+            prefetch_max_bytes (int): max bytes of frames decoded ahead
+            target_size (tuple): (width, height) the frames are decoded at,
+                                 e.g. the input size of the model. None to
+                                 decode at the original size
+            interpolation (str): interpolation used to resize the frames,
+                                 one of "nearest", "linear", "cubic", "area"
+            skip_similar_threshold (float): if set, frames whose signature
+                                            (see frame_signature) is within
+                                            this mean absolute difference
+                                            (in gray levels) of the last
+                                            processed frame are not
+                                            processed, the regions of that
+                                            frame are copied instead. Only
+                                            without prev_pois
+            detect_every (int): run process_images on every detect_every-th
+                                frame only, the regions of this module are
+                                tracked in between (see BoxTracker). Only
+                                without prev_pois
+            scene_change_threshold (float): with detect_every > 1, also run
+                                            process_images on frames whose
+                                            signature is this far from the
+                                            last processed frame
+            media_backend (str): backend decoding the media, "opencv",
+                                 "pims" or "pyav" (see
+                                 get_media_retriever)
+        """
         super().__init__(
             server_name=server_name,
             version=version,
@@ -31,36 +107,52 @@ class ImagesModule(Module):
             module_id_map=module_id_map,
         )
         self.batch_size = batch_size
+        self.incremental = incremental
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_max_bytes = prefetch_max_bytes
+        check_interpolation(interpolation)
+        self.target_size = tuple(target_size) if target_size else None
+        self.interpolation = interpolation
+        if media_backend not in MEDIA_RETRIEVER_BACKENDS:
+            raise ValueError(f"Unknown media_backend: {media_backend},"
+                             f" expected one of: {MEDIA_RETRIEVER_BACKENDS}")
+        self.media_backend = media_backend
+        self.skip_similar_threshold = skip_similar_threshold
+        self.skip_refs = {}
+        self.ref_signature = None
+        self.detect_every = detect_every
+        self.scene_change_threshold = scene_change_threshold
+        self.tracker = None
+        self.frames_iterator = None
+        self.prev_footprints = []
+        self.prev_tstamps = set()
         log.debug(f"Creating ImagesModule with batch_size: {batch_size}")
 
-    def process(self, response):
+    def process(self, response, frames_source=None):
         """Process the message, calls process_images(batch, tstamps, contours=None)
            which is implemented by the child module
 
+        Args:
+            response (Response): response
+            frames_source (SharedFramesSource): source of frames shared with
+                                                the other modules processing
+                                                this request. If None, the
+                                                media is loaded by this module
+
         Returns:
             Response: response object
         """
         log.debug("Processing message")
         super().process(response)
+        self._init_prev_footprints()
+        self.skip_refs = {}
+        self.ref_signature = None
+        self.tracker = self._create_tracker()
 
-        try:
-            log.info(f"Loading media from {self.response.request}:"
-                     f" {self.response.request.url}")
-            self.media = MediaRetriever(self.response.request.url)
-            self.frames_iterator = self.media.get_frames_iterator(
-                self.response.request.sample_rate
-            )
-        except Exception as e:
-            log.error(e)
-            log.error(traceback.print_exc())
-            self.code = Codes.ERROR_LOADING_MEDIA
+        if not self._load_media(frames_source):
             return self.update_and_return_response()
 
-        self._update_w_h_in_response()
-
-        if self.prev_pois and not self.response.has_frame_anns():
-            log.warning("NO_PREV_REGIONS_OF_INTEREST, returning...")
-            self.code = Codes.NO_PREV_REGIONS_OF_INTEREST
+        if not self._check_prev_regions_of_interest():
             return self.update_and_return_response()
 
         num_problematic_frames = 0
@@ -80,6 +172,7 @@ class ImagesModule(Module):
                     log.error(e)
                     self.code = Codes.ERROR_PROCESSING
                     return self.update_and_return_response()
+            self._track(tstamp_batch)
         log.debug("Finished processing.")
 
         if self.prev_pois and self.prev_regions_of_interest_count == 0:
@@ -87,6 +180,313 @@ class ImagesModule(Module):
             self.code = Codes.NO_PREV_REGIONS_OF_INTEREST
         return self.update_and_return_response()
 
+    def process_batch(self, responses, frames_sources=None):
+        """Process several responses, batching their frames together
+
+        Frames of all the responses are gathered into batches of up to
+        batch_size frames, so that a single process_images call can hold
+        frames of several responses (e.g. one image per response).
+        Regions appended to self.response by process_images are routed
+        back to the response each frame belongs to. When a batch holds
+        frames of several responses, the tstamps passed to process_images
+        are replaced by unique keys, which are mapped back to the real
+        tstamps when appending regions.
+
+        Codes, footprints and errors are kept per response, like in
+        process(response).
+
+        Args:
+            responses (list[Response]): responses to process
+            frames_sources (list[SharedFramesSource]): optional shared
+                                                       source per response
+
+        Returns:
+            list[Response]: processed responses, in the same order
+        """
+        if frames_sources is None:
+            frames_sources = [None] * len(responses)
+        assert len(frames_sources) == len(responses)
+
+        contexts = []
+        for response, frames_source in zip(responses, frames_sources):
+            super().process(response)
+            self._init_prev_footprints()
+            self.skip_refs = {}
+            self.ref_signature = None
+            self.tracker = self._create_tracker()
+            ready = (self._load_media(frames_source) and
+                     self._check_prev_regions_of_interest())
+            context = self._save_context()
+            context["done"] = not ready
+            context["num_problematic_frames"] = 0
+            contexts.append(context)
+
+        try:
+            for items in batch_generator(
+                self._preprocess_input_of_contexts(contexts), self.batch_size
+            ):
+                self._process_contexts_batch(*items)
+        except Exception:
+            log.error(traceback.format_exc())
+            for context in contexts:
+                if not context["done"]:
+                    context["code"] = Codes.ERROR_PROCESSING
+                    context["done"] = True
+        log.debug("Finished processing batch.")
+
+        out = []
+        for context in contexts:
+            self._restore_context(context)
+            if (self.code == Codes.SUCCESS and self.prev_pois and
+                    self.prev_regions_of_interest_count == 0):
+                log.warning("NO_PREV_REGIONS_OF_INTEREST, returning...")
+                self.code = Codes.NO_PREV_REGIONS_OF_INTEREST
+            out.append(self.update_and_return_response())
+        return out
+
+    def _process_contexts_batch(self, image_batch, tstamp_batch,
+                                prev_region_batch, context_batch):
+        """Run process_images on a batch of frames of one or more contexts"""
+        batch_contexts = []
+        for context in context_batch:
+            if not any(context is c for c in batch_contexts):
+                batch_contexts.append(context)
+
+        if len(batch_contexts) == 1:
+            self._restore_context(batch_contexts[0])
+            keys = tstamp_batch
+        else:
+            router = _ResponseRouter(
+                [c["response"] for c in context_batch], tstamp_batch
+            )
+            self._restore_context(batch_contexts[0])
+            self.response = router
+            keys = router.keys
+
+        try:
+            self.process_images(image_batch, keys, prev_region_batch)
+            if len(batch_contexts) == 1:
+                batch_contexts[0].update(self._save_context())
+        except ValueError as e:
+            log.warning("Problem processing frames")
+            for context in batch_contexts:
+                context["num_problematic_frames"] += 1
+                if context["num_problematic_frames"] >= MAX_PROBLEMATIC_FRAMES:
+                    log.error(e)
+                    context["code"] = Codes.ERROR_PROCESSING
+                    context["done"] = True
+        except Exception:
+            log.error(traceback.format_exc())
+            log.error("Error processing batch of frames of"
+                      f" {len(batch_contexts)} responses")
+            for context in batch_contexts:
+                context["code"] = Codes.ERROR_PROCESSING
+                context["done"] = True
+
+        for context in batch_contexts:
+            if context["done"] or context["tracker"] is None:
+                continue
+            self._restore_context(context)
+            self._track([t for t, c in zip(tstamp_batch, context_batch)
+                         if c is context])
+            context.update(self._save_context())
+
+    def _preprocess_input_of_contexts(self, contexts):
+        """Chain preprocess_input() of several contexts
+
+        The context is restored before each item is pulled and saved back
+        after, since preprocess_input reads and updates the module state.
+
+        Yields:
+            frame, tstamp, region, context
+        """
+        for context in contexts:
+            self._restore_context(context)
+            items = self.preprocess_input()
+            while not context["done"]:
+                self._restore_context(context)
+                try:
+                    frame, tstamp, region = next(items)
+                except StopIteration:
+                    break
+                finally:
+                    context.update(self._save_context())
+                yield frame, tstamp, region, context
+            items.close()
+
+    def _init_prev_footprints(self):
+        """Find the footprints of this module in the previous response
+
+        Only used in incremental mode. Footprints with error codes are
+        ignored, since their tstamps may not have been fully processed.
+        """
+        self.prev_footprints = []
+        self.prev_tstamps = set()
+        if not self.incremental:
+            return
+
+        for footprint in self.response.footprints:
+            if (footprint["server"] == self.name and
+                    footprint["ver"] == self.version and
+                    not footprint["code"].startswith("ERROR")):
+                self.prev_footprints.append(footprint)
+                self.prev_tstamps.update(
+                    round_float(t) for t in footprint["tstamps"]
+                )
+        if self.prev_footprints:
+            log.info(f"Skipping {len(self.prev_tstamps)} tstamps already"
+                     f" processed by {self}")
+
+    def _merge_prev_footprints(self):
+        """Merge the footprints of the previous runs into the current one
+
+        The previous footprints are removed from the response, and their
+        tstamps (and skipped and tracked tstamps) are added to
+        tstamps_processed (and skipped_tstamps and tracked_tstamps).
+        """
+        merged = {}
+        for footprint in self.prev_footprints:
+            merged.update((round_float(t), t) for t in footprint["tstamps"])
+        merged.update((round_float(t), t) for t in self.tstamps_processed)
+        self.tstamps_processed = [merged[t] for t in sorted(merged)]
+        for attr in ("skipped_tstamps", "tracked_tstamps"):
+            merged = {}
+            for footprint in self.prev_footprints:
+                merged.update((round_float(t), t)
+                              for t in footprint.get(attr, []))
+            merged.update((round_float(t), t) for t in getattr(self, attr))
+            setattr(self, attr, [merged[t] for t in sorted(merged)])
+
+        footprints = self.response.footprints
+        footprints[:] = [
+            fp for fp in footprints
+            if not any(fp is prev for prev in self.prev_footprints)
+        ]
+        # regions of interest of earlier runs are not counted again
+        if (self.code == Codes.NO_PREV_REGIONS_OF_INTEREST and any(
+                fp["code"] == Codes.SUCCESS.name
+                for fp in self.prev_footprints)):
+            self.code = Codes.SUCCESS
+
+    def update_and_return_response(self):
+        """Update footprints, moduleID, propertyIDs
+
+        Stops prefetching frames, if the frames iterator was not consumed
+        to the end. Regions are tracked through the remaining frames
+        between detections, and copied to the near-duplicate frames that
+        were skipped. In incremental mode, the footprints of the previous
+        runs are merged into the new one, unless this run failed.
+
+        Returns:
+            Response: output response
+        """
+        if isinstance(self.frames_iterator, PrefetchingFramesIterator):
+            self.frames_iterator.close()
+        if self.tracker is not None and not self.code.name.startswith("ERROR"):
+            self._finish_tracking()
+        if self.skip_refs and not self.code.name.startswith("ERROR"):
+            self._copy_skipped_regions()
+        if self.prev_footprints and not self.code.name.startswith("ERROR"):
+            self._merge_prev_footprints()
+        return super().update_and_return_response()
+
+    def _save_context(self):
+        """Save the per-response state of the module"""
+        return {attr: getattr(self, attr, None) for attr in _CONTEXT_ATTRS}
+
+    def _restore_context(self, context):
+        """Restore the per-response state of the module"""
+        for attr in _CONTEXT_ATTRS:
+            setattr(self, attr, context[attr])
+
+    def _load_media(self, frames_source=None):
+        """Load the media and frames iterator of self.response
+
+        Args:
+            frames_source (SharedFramesSource): optional shared source
+
+        Returns:
+            bool: False if the media could not be loaded
+        """
+        self.frames_iterator = None
+        try:
+            log.info(f"Loading media from {self.response.request}:"
+                     f" {self.response.request.url}")
+            request = self.response.request
+            if frames_source is not None:
+                self.media = frames_source.media
+            else:
+                self.media = get_media_retriever(request.url,
+                                                 self.media_backend)
+            tstamps = None
+            if self.prev_pois and self.media.is_video:
+                tstamps = self._tstamps_of_interest()
+            if frames_source is not None:
+                self.frames_iterator = frames_source.get_frames_iterator(
+                    target_size=self.target_size,
+                    interpolation=self.interpolation,
+                    tstamps=tstamps,
+                )
+            else:
+                self.frames_iterator = self.media.get_frames_iterator(
+                    request.sample_rate,
+                    start_tstamp=request.start_tstamp,
+                    end_tstamp=request.end_tstamp,
+                    target_size=self.target_size,
+                    interpolation=self.interpolation,
+                    tstamps=tstamps,
+                )
+            if self.prefetch_depth > 0 and self.media.is_video:
+                self.frames_iterator = PrefetchingFramesIterator(
+                    self.frames_iterator,
+                    depth=self.prefetch_depth,
+                    max_bytes=self.prefetch_max_bytes,
+                )
+        except Exception as e:
+            log.error(e)
+            log.error(traceback.print_exc())
+            self.code = Codes.ERROR_LOADING_MEDIA
+            return False
+
+        self._update_w_h_in_response()
+        return True
+
+    def _tstamps_of_interest(self):
+        """Get the tstamps with regions matching prev_pois
+
+        Only the frames at these tstamps are decoded, instead of every
+        frame at sample_rate.
+
+        Returns:
+            list[float]: sorted tstamps of the frame annotations of the
+                         response, in the request's time range
+        """
+        request = self.response.request
+        tstamps = []
+        for image_ann in self.response.frame_anns:
+            tstamp = image_ann["t"]
+            if (tstamp < request.start_tstamp - TIME_EPS or
+                    tstamp > request.end_tstamp or
+                    round_float(tstamp) in self.prev_tstamps):
+                continue
+            if any(self._region_contains_props(region)
+                   for region in image_ann["regions"]):
+                tstamps.append(tstamp)
+        log.info(f"Decoding {len(tstamps)} frames with regions of interest")
+        return sorted(tstamps)
+
+    def _check_prev_regions_of_interest(self):
+        """Check there are previous regions to process, if prev_pois are set
+
+        Returns:
+            bool: False if there is nothing to process
+        """
+        if self.prev_pois and not self.response.has_frame_anns():
+            log.warning("NO_PREV_REGIONS_OF_INTEREST, returning...")
+            self.code = Codes.NO_PREV_REGIONS_OF_INTEREST
+            return False
+        return True
+
     def preprocess_input(self):
         """Parses request for data
 
@@ -104,7 +504,17 @@ class ImagesModule(Module):
                 log.warning("Invalid tstamp")
                 continue
 
+            if round_float(tstamp) in self.prev_tstamps:
+                log.debug(f"tstamp: {tstamp} already processed, skipping")
+                continue
+
             self.tstamps_processed.append(tstamp)
+            if self._is_similar_to_ref(frame, tstamp):
+                continue
+            if (self.tracker is not None and
+                    not self.tracker.is_keyframe(frame, tstamp)):
+                self.tracked_tstamps.append(tstamp)
+                continue
             log.debug(f"tstamp: {tstamp}")
             if i % 100 == 0:
                 log.info(f"Processing {self.response.request} inprogress:"
@@ -133,6 +543,71 @@ class ImagesModule(Module):
                 for region in regions_that_match_props:
                     yield frame, tstamp, region
 
+    def _is_similar_to_ref(self, frame, tstamp):
+        """Check if a frame is a near-duplicate of the last processed frame
+
+        If it is, tstamp is recorded as skipped, else the frame becomes the
+        reference for the next frames.
+
+        Returns:
+            bool: True if the frame must not be processed
+        """
+        if self.skip_similar_threshold is None or self.prev_pois:
+            return False
+        signature = frame_signature(frame)
+        if (self.ref_signature is not None and
+                signature_distance(signature, self.ref_signature[0]) <=
+                self.skip_similar_threshold):
+            log.debug(f"tstamp: {tstamp} similar to {self.ref_signature[1]},"
+                      " skipping")
+            self.skipped_tstamps.append(tstamp)
+            self.skip_refs[tstamp] = self.ref_signature[1]
+            return True
+        self.ref_signature = (signature, tstamp)
+        return False
+
+    def _copy_skipped_regions(self):
+        """Copy the regions of this module at the reference of each skipped
+        tstamp to the skipped tstamp
+        """
+        for tstamp, ref_tstamp in self.skip_refs.items():
+            regions = self.response.get_regions_from_tstamp(ref_tstamp)
+            for region in regions or []:
+                if not any(prop["server"] == self.name
+                           for prop in region["props"]):
+                    continue
+                region = copy.deepcopy(region)
+                region["id"] = create_region_id()
+                self.response.append_region(t=tstamp, region=region)
+        if self.skip_refs:
+            log.info(f"Skipped {len(self.skip_refs)}/"
+                     f"{len(self.tstamps_processed)} near-duplicate frames"
+                     f" ({len(self.skip_refs) / len(self.tstamps_processed):.1%})")
+        self.skip_refs = {}
+
+    def _create_tracker(self):
+        """Create the BoxTracker of a response, None if not tracking"""
+        if self.detect_every <= 1 or self.prev_pois:
+            return None
+        return BoxTracker(self.name, self.detect_every,
+                          scene_change_threshold=self.scene_change_threshold)
+
+    def _track(self, tstamps):
+        """Track regions through the frames following processed tstamps"""
+        if self.tracker is None:
+            return
+        self.tracker.detected(tstamps)
+        self.tracker.track(self.response)
+
+    def _finish_tracking(self):
+        """Track regions through the remaining frames and append tracks"""
+        tracks = self.tracker.finish(self.response)
+        num_tracked = len(self.tracker.tracked_tstamps)
+        if self.tstamps_processed:
+            log.info(f"Tracked {num_tracked}/{len(self.tstamps_processed)}"
+                     f" frames between detections, {len(tracks)} tracks")
+        self.tracker = None
+
     @abstractmethod
     def process_images(self,
                        image_batch,
@@ -159,6 +634,40 @@ class ImagesModule(Module):
         props = region.get("props")
         if props is None:
             return False
-        return pandas_query_matches_props(
-            self.prev_pois_bool_exp,
-            pd.DataFrame(props))
+        return self.prev_pois_query(props)
+
+
+class _ResponseRouter:
+    """Stands in for self.response while process_images runs on a batch
+    holding frames of several responses.
+
+    Each frame of the batch is given a unique key, passed to process_images
+    instead of its tstamp. Regions appended with that key are appended to
+    the frame's response, at the frame's tstamp.
+    """
+
+    def __init__(self, responses, tstamps):
+        assert len(responses) == len(tstamps)
+        self._responses = list(responses)
+        self._tstamps = list(tstamps)
+        self.keys = tuple(float(i) for i in range(len(self._responses)))
+
+    def append_region(self, t, region):
+        i = self._index(t)
+        self._responses[i].append_region(t=self._tstamps[i], region=region)
+
+    def append_regions(self, t, regions):
+        i = self._index(t)
+        self._responses[i].append_regions(t=self._tstamps[i], regions=regions)
+
+    def _index(self, t):
+        i = int(t)
+        if i != t or not 0 <= i < len(self._responses):
+            raise KeyError(f"{t} is not a key of this batch")
+        return i
+
+    def __getattr__(self, name):
+        raise AttributeError(
+            f"Response.{name} is not available while processing a batch"
+            " of frames of several responses"
+        )
@@ -7,7 +7,8 @@ from multivitamin.data import Response
 from multivitamin.data.response.dtypes import Footprint
 from multivitamin.data.response.utils import get_current_time
 from multivitamin.module.codes import Codes
-from multivitamin.module.utils import convert_props_to_pandas_query
+from multivitamin.module.utils import (compile_props_query,
+                                       convert_props_to_pandas_query)
 
 
 class Module(ABC):
@@ -31,9 +32,13 @@ class Module(ABC):
         self.prop_id_map = prop_id_map
         self.module_id_map = module_id_map
         self.prev_pois = None
+        self.prev_pois_bool_exp = None
+        self.prev_pois_query = None
         self.code = Codes.SUCCESS
         self.prev_regions_of_interest_count = 0
         self.tstamps_processed = []
+        self.skipped_tstamps = []
+        self.tracked_tstamps = []
 
     def set_prev_props_of_interest(self, pois):
         """If this Module is meant to be one in a sequence of Modules and is
@@ -50,6 +55,11 @@ class Module(ABC):
 
             '(property_type == "object") & (value == "face") | (value == "car")'
 
+        Conditions can also be lists of values, or numeric comparisons,
+        e.g. {"value": ["car", "truck"], "confidence": {">=": 0.5}}. The
+        query is compiled once into a predicate (see PropsQuery), and
+        prev_pois_bool_exp keeps its pandas expression.
+
         Args:
             pois (list[dict]): previous properties of interest
         """
@@ -59,11 +69,12 @@ class Module(ABC):
 
         self.prev_pois = pois
         self.prev_pois_bool_exp = convert_props_to_pandas_query(pois)
+        self.prev_pois_query = compile_props_query(pois)
         log.info(
             "Setting previous properties of interest: "
             f"{json.dumps(pois, indent=2)}"
         )
-        log.info(f"POIs for {self}: {self.prev_pois_bool_exp}")
+        log.info(f"POIs for {self}: {self.prev_pois_query}")
 
     def get_prev_props_of_interest(self):
         """Getter for properties of interest
@@ -82,6 +93,9 @@ class Module(ABC):
         """
         assert isinstance(response, Response)
         self.tstamps_processed = []
+        self.skipped_tstamps = []
+        self.tracked_tstamps = []
+        self.prev_regions_of_interest_count = 0
         self.code = Codes.SUCCESS
         self.response = response
         self.request = response.request
@@ -109,7 +123,11 @@ class Module(ABC):
                 ver=self.version,
                 id="{}{}".format(time, num_footprints + 1),
                 tstamps=self.tstamps_processed,
-                num_images_processed=len(self.tstamps_processed)
+                num_images_processed=(len(self.tstamps_processed) -
+                                      len(self.skipped_tstamps) -
+                                      len(self.tracked_tstamps)),
+                skipped_tstamps=self.skipped_tstamps,
+                tracked_tstamps=self.tracked_tstamps,
             )
         )
         self._update_ids()
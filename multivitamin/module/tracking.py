@@ -0,0 +1,305 @@
+import copy
+
+import cv2
+import numpy as np
+import glog as log
+
+from .utils import frame_signature, signature_distance
+from ..data.response.utils import compute_box_area, round_float
+from ..data.response.dtypes import (create_bbox_contour_from_points,
+                                    create_region_id,
+                                    Property,
+                                    VideoAnn)
+
+TRACK_WIDTH = 320
+IOU_THRESHOLD = 0.3
+MAX_FLOW_POINTS = 50
+MIN_BOX_PX = 4
+TRACKED_SERVER_TRACK = "tracked"
+
+
+def box_of_contour(contour):
+    """Get the bounding box of a contour
+
+    Returns:
+        tuple: (xmin, ymin, xmax, ymax)
+    """
+    xs = [float(pt["x"]) for pt in contour]
+    ys = [float(pt["y"]) for pt in contour]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def iou(box0, box1):
+    """Intersection over union of two (xmin, ymin, xmax, ymax) boxes"""
+    w = min(box0[2], box1[2]) - max(box0[0], box1[0])
+    h = min(box0[3], box1[3]) - max(box0[1], box1[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    area0 = (box0[2] - box0[0]) * (box0[3] - box0[1])
+    area1 = (box1[2] - box1[0]) * (box1[3] - box1[1])
+    return inter / (area0 + area1 - inter)
+
+
+def estimate_box_shift(prev_gray, gray, box):
+    """Estimate the translation of a box between two grayscale frames
+
+    The median Lucas-Kanade optical flow of the corners found in the box is
+    used. Boxes without corners (e.g. flat regions) are matched as
+    templates in a window around them.
+
+    Args:
+        prev_gray (np.ndarray): previous frame
+        gray (np.ndarray): current frame
+        box (tuple): normalized (xmin, ymin, xmax, ymax) in prev_gray
+
+    Returns:
+        tuple: normalized (dx, dy)
+    """
+    h, w = gray.shape[:2]
+    x0, y0 = max(int(box[0] * w), 0), max(int(box[1] * h), 0)
+    x1, y1 = min(int(box[2] * w), w), min(int(box[3] * h), h)
+    if x1 - x0 < MIN_BOX_PX or y1 - y0 < MIN_BOX_PX:
+        return 0.0, 0.0
+
+    points = cv2.goodFeaturesToTrack(prev_gray[y0:y1, x0:x1],
+                                     maxCorners=MAX_FLOW_POINTS,
+                                     qualityLevel=0.01,
+                                     minDistance=3)
+    if points is not None:
+        points = points.astype(np.float32) + np.float32([x0, y0])
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray,
+                                                          points, None)
+        good = status.ravel() == 1
+        if good.any():
+            dx, dy = np.median((next_points - points)[good].reshape(-1, 2),
+                               axis=0)
+            return float(dx) / w, float(dy) / h
+
+    # search the box in a window twice its size
+    mx, my = (x1 - x0) // 2, (y1 - y0) // 2
+    sx0, sy0 = max(x0 - mx, 0), max(y0 - my, 0)
+    sx1, sy1 = min(x1 + mx, w), min(y1 + my, h)
+    scores = cv2.matchTemplate(gray[sy0:sy1, sx0:sx1],
+                               prev_gray[y0:y1, x0:x1],
+                               cv2.TM_CCOEFF_NORMED)
+    _, _, _, (bx, by) = cv2.minMaxLoc(scores)
+    return float(sx0 + bx - x0) / w, float(sy0 + by - y0) / h
+
+
+class Track:
+    def __init__(self, region, props, tstamp):
+        """Regions of an object across frames
+
+        Args:
+            region (Region): detected region that starts the track
+            props (list[Property]): properties of the module in region
+            tstamp (float): tstamp of the region
+        """
+        self.label = tuple(prop["value"] for prop in props)
+        self.props = props
+        self.region = region
+        self.box = box_of_contour(region["contour"])
+        self.region_ids = [region["id"]]
+        self.confidences = [prop["confidence"] for prop in props]
+        self.t1 = tstamp
+        self.t2 = tstamp
+
+    def add_detection(self, region, props, tstamp):
+        self.region = region
+        self.props = props
+        self.box = box_of_contour(region["contour"])
+        self.region_ids.append(region["id"])
+        self.confidences.extend(prop["confidence"] for prop in props)
+        self.t2 = tstamp
+
+    def make_tracked_region(self, tstamp):
+        """Copy the last detected region at the current box of the track"""
+        region = copy.deepcopy(self.region)
+        region["id"] = create_region_id()
+        region["contour"] = create_bbox_contour_from_points(*self.box,
+                                                           bound=True)
+        area = compute_box_area(region["contour"])
+        for prop in region["props"]:
+            if prop["server"] == self.props[0]["server"]:
+                prop["server_track"] = TRACKED_SERVER_TRACK
+                prop["fraction"] = area
+        self.region_ids.append(region["id"])
+        self.t2 = tstamp
+        return region
+
+
+class BoxTracker:
+    def __init__(
+        self,
+        server,
+        detect_every,
+        scene_change_threshold=None,
+        iou_threshold=IOU_THRESHOLD,
+        track_width=TRACK_WIDTH,
+    ):
+        """Propagates the boxes of a detector between the frames it runs on
+
+        Frames are fed in order to is_keyframe. Keyframes (every
+        detect_every-th frame, and frames whose signature changed by more
+        than scene_change_threshold since the last keyframe) are detected,
+        the boxes of the other frames are shifted by optical flow from the
+        previous frame. Detections are associated to the tracked boxes by
+        IoU, to form the tracks.
+
+        Only downscaled grayscale copies of the frames are kept, until the
+        detections of the keyframe before them are known.
+
+        Args:
+            server (str): name of the detector module
+            detect_every (int): run the detector every detect_every frames
+            scene_change_threshold (float): signature distance (see
+                                            signature_distance) from the
+                                            last keyframe that forces a
+                                            detection. None to disable
+            iou_threshold (float): min IoU of a detection and a tracked box
+                                   to continue the track
+            track_width (int): width frames are downscaled to for tracking
+        """
+        self.server = server
+        self.detect_every = detect_every
+        self.scene_change_threshold = scene_change_threshold
+        self.iou_threshold = iou_threshold
+        self.track_width = track_width
+        self.tracks = []
+        self.tracked_tstamps = []
+        self._active = []
+        self._frames = []
+        self._detected = set()
+        self._prev_gray = None
+        self._key_signature = None
+        self._since_keyframe = 0
+
+    def is_keyframe(self, frame, tstamp):
+        """Check if the detector must run on a frame, and queue it
+
+        Returns:
+            bool: False if the regions of the frame will be tracked
+        """
+        gray = frame
+        if gray.ndim == 3:
+            gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+        h, w = gray.shape
+        if w > self.track_width:
+            gray = cv2.resize(gray, (self.track_width,
+                                     max(int(h * self.track_width / w), 1)),
+                              interpolation=cv2.INTER_AREA)
+        signature = frame_signature(gray)
+
+        is_keyframe = (self._key_signature is None or
+                       self._since_keyframe + 1 >= self.detect_every)
+        if (not is_keyframe and self.scene_change_threshold is not None and
+                signature_distance(signature, self._key_signature) >
+                self.scene_change_threshold):
+            log.debug(f"tstamp: {tstamp} scene change, detecting")
+            is_keyframe = True
+
+        if is_keyframe:
+            self._key_signature = signature
+            self._since_keyframe = 0
+        else:
+            self._since_keyframe += 1
+            self.tracked_tstamps.append(tstamp)
+        self._frames.append((tstamp, gray, is_keyframe))
+        return is_keyframe
+
+    def detected(self, tstamps):
+        """Mark keyframes whose detections were appended to the response"""
+        self._detected.update(round_float(t) for t in tstamps)
+
+    def track(self, response, flush=False):
+        """Track the boxes through the queued frames
+
+        Stops at the first keyframe not detected yet, unless flush is set
+        (e.g. once all frames were fed).
+
+        Args:
+            response (Response): response with the detections, where the
+                                 tracked regions are appended
+            flush (bool): do not wait for the detections of keyframes
+        """
+        while self._frames:
+            tstamp, gray, is_keyframe = self._frames[0]
+            if is_keyframe:
+                if not flush and round_float(tstamp) not in self._detected:
+                    break
+                self._update(response, tstamp, gray)
+            else:
+                self._propagate(response, tstamp, gray)
+            self._prev_gray = gray
+            self._frames.pop(0)
+
+    def finish(self, response):
+        """Track the remaining frames and append the tracks to the response
+
+        Returns:
+            list[VideoAnn]: tracks
+        """
+        self.track(response, flush=True)
+        tracks = []
+        for track in self.tracks:
+            props = [
+                Property(
+                    confidence=float(np.mean(track.confidences)),
+                    confidence_min=prop["confidence_min"],
+                    ver=prop["ver"],
+                    server=prop["server"],
+                    value=prop["value"],
+                    property_type=prop["property_type"],
+                    server_track=TRACKED_SERVER_TRACK,
+                )
+                for prop in track.props
+            ]
+            video_ann = VideoAnn(t1=track.t1, t2=track.t2, props=props,
+                                 region_ids=track.region_ids)
+            response.append_track(video_ann)
+            tracks.append(video_ann)
+        self.tracks = []
+        self._active = []
+        return tracks
+
+    def _update(self, response, tstamp, gray):
+        """Associate the detections of a keyframe to the active tracks"""
+        if self._prev_gray is not None:
+            self._shift_boxes(gray)
+        active = []
+        candidates = list(self._active)
+        for region in response.get_regions_from_tstamp(tstamp) or []:
+            props = [prop for prop in region["props"]
+                     if prop["server"] == self.server]
+            if not props:
+                continue
+            box = box_of_contour(region["contour"])
+            label = tuple(prop["value"] for prop in props)
+            best, best_iou = None, self.iou_threshold
+            for track in candidates:
+                overlap = iou(box, track.box)
+                if track.label == label and overlap >= best_iou:
+                    best, best_iou = track, overlap
+            if best is None:
+                best = Track(region, props, tstamp)
+                self.tracks.append(best)
+            else:
+                candidates.remove(best)
+                best.add_detection(region, props, tstamp)
+            active.append(best)
+        self._active = active
+
+    def _propagate(self, response, tstamp, gray):
+        """Append the shifted boxes of the active tracks to a tracked frame"""
+        if self._prev_gray is not None:
+            self._shift_boxes(gray)
+        for track in self._active:
+            response.append_region(t=tstamp,
+                                   region=track.make_tracked_region(tstamp))
+
+    def _shift_boxes(self, gray):
+        for track in self._active:
+            dx, dy = estimate_box_shift(self._prev_gray, gray, track.box)
+            xmin, ymin, xmax, ymax = track.box
+            track.box = (xmin + dx, ymin + dy, xmax + dx, ymax + dy)
@@ -1,9 +1,25 @@
 import os
 import json
+import operator
 import itertools as it
 
+import cv2
+import numpy as np
 import glog as log
 
+SIGNATURE_SIZE = (16, 16)
+
+_QUERY_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "in": lambda value, values: value in values,
+    "not in": lambda value, values: value not in values,
+}
+
 
 def load_idmap(idmap_filepath):
     """Load idmap
@@ -69,10 +85,40 @@ def min_conf_filter_predictions(filter_dict, preds, confs, label_dict=None):
     return qualifying_preds
 
 
+def top_n_predictions(probs, top_n, exclude_mask=None):
+    """Get the indices of the top_n highest scores of each row
+
+    Args:
+        probs (np.ndarray): (num_images, num_labels) scores
+        top_n (int): max number of predictions per row
+        exclude_mask (np.ndarray): (num_labels,) bools, True for labels
+                                   never predicted. Ignored if every label
+                                   is excluded
+
+    Returns:
+        np.ndarray: (num_images, k) label indices by decreasing score, with
+                    k = min(top_n, number of labels not excluded)
+    """
+    probs = np.asarray(probs)
+    num_labels = probs.shape[1]
+    if exclude_mask is not None and not exclude_mask.all():
+        probs = np.where(exclude_mask, -np.inf, probs)
+        num_labels -= int(exclude_mask.sum())
+    k = min(top_n, num_labels)
+    if k < num_labels:
+        top = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(probs.shape[1]), (len(probs), 1))
+    order = np.argsort(-np.take_along_axis(probs, top, axis=1), axis=1,
+                      kind="stable")
+    return np.take_along_axis(top, order, axis=1)[:, :k]
+
+
 def pandas_query_matches_props(bool_exp, props):
     """Evaluates the boolean expression on a list of properties
-    
-        Note: list of properties must be a pandas.DataFrame
+
+        Note: list of properties must be a pandas.DataFrame. Prefer
+        compile_props_query, which does not need pandas
         See: https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.query.html
     Args:
         bool_exp (str): boolean expression
@@ -88,6 +134,104 @@ def pandas_query_matches_props(bool_exp, props):
     return not queried_pois.empty
 
 
+class PropsQuery:
+    def __init__(self, query_props):
+        """Predicate over the properties of a region, compiled from a list
+        of query dicts
+
+        A region matches if one of its properties matches one of the query
+        dicts, i.e. matches all its conditions. Conditions are either a
+        value the property must be equal to, a list/set of values it must be
+        in, or a dict of operator to operand, with operators ==, !=, >, >=,
+        <, <=, in and not in. Properties missing a key never match.
+
+        E.g.
+            [
+                {"property_type":"object", "value":"face"},
+                {"value":["car", "truck"], "confidence":{">=": 0.5}}
+            ]
+
+        matches face objects, and cars or trucks detected with a confidence
+        of at least 0.5.
+
+        Args:
+            query_props (list[dict]): list of dictionaries containing
+                                      key/conditions of interest
+        """
+        assert isinstance(query_props, list)
+        self.query_props = query_props
+        self._conjunctions = []
+        for q in query_props:
+            assert isinstance(q, dict)
+            conditions = []
+            for k, v in q.items():
+                if isinstance(v, dict):
+                    for op, operand in v.items():
+                        if op not in _QUERY_OPERATORS:
+                            raise ValueError(f"Unknown operator {op} for {k},"
+                                             f" one of {list(_QUERY_OPERATORS)}")
+                        if op in ("in", "not in"):
+                            operand = frozenset(operand)
+                        conditions.append((k, _QUERY_OPERATORS[op], operand))
+                elif isinstance(v, (list, tuple, set, frozenset)):
+                    conditions.append((k, _QUERY_OPERATORS["in"], frozenset(v)))
+                else:
+                    conditions.append((k, operator.eq, v))
+            self._conjunctions.append(tuple(conditions))
+
+    def matches_prop(self, prop):
+        """Check if a property matches one of the query dicts"""
+        for conditions in self._conjunctions:
+            for k, op, operand in conditions:
+                value = prop.get(k)
+                try:
+                    if value is None or not op(value, operand):
+                        break
+                except TypeError:  # e.g. str >= float
+                    break
+            else:
+                return True
+        return False
+
+    def __call__(self, props):
+        """Check if one of the properties matches one of the query dicts
+
+        Args:
+            props (list[dict]): properties of a region
+
+        Returns:
+            bool
+        """
+        return any(self.matches_prop(prop) for prop in props)
+
+    def __repr__(self):
+        return " | ".join(
+            " & ".join(f"({k} {_operator_name(op)} {operand!r})"
+                       for k, op, operand in conditions)
+            for conditions in self._conjunctions
+        )
+
+
+def _operator_name(op):
+    for name, query_op in _QUERY_OPERATORS.items():
+        if query_op is op:
+            return name
+    return repr(op)
+
+
+def compile_props_query(query_props):
+    """Compile a list of query dicts into a PropsQuery
+
+    Args:
+        query_props (list[dict]): list of dictionaries containing
+                                  key/conditions of interest
+
+    Returns:
+        PropsQuery: callable returning True if a list of properties matches
+    """
+    return PropsQuery(query_props)
+
+
 def convert_props_to_pandas_query(query_props):
     """Convert a list of query dicts to a boolean expression to be used in pandas.DataFrame.query
 
@@ -145,3 +289,24 @@ def batch_generator(iterator, batch_size):
             batch = []
     if len(batch) > 0:
         yield zip(*batch)
+
+
+def frame_signature(frame, size=SIGNATURE_SIZE):
+    """Compute a cheap signature of a frame, to find near-duplicate frames
+
+    Args:
+        frame (np.ndarray): BGR or grayscale image
+        size (tuple): (width, height) of the signature
+
+    Returns:
+        np.ndarray: downscaled grayscale image, as float32
+    """
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(frame, size,
+                      interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def signature_distance(signature0, signature1):
+    """Mean absolute difference of two signatures, in gray levels (0-255)"""
+    return float(np.mean(np.abs(signature0 - signature1)))
@@ -1,18 +1,28 @@
 import os
 import json
 import traceback
+import time
 import threading
+from queue import Queue, Empty
 
 import glog as log
 from flask import Flask, jsonify
 
 from .apis import CommAPI
-from .module import Module
+from .apis.output_pusher import OutputPusher, MAX_RETRIES
+from .module import Module, ImagesModule
 from .data import Response, Request
+from .media import SharedFramesSource
+from .media.shared_frames_source import MAX_CACHED_BYTES
 from .module.codes import Codes
 
 
 HEALTHPORT = os.environ.get("PORT", 5000)
+PULL_QUEUE_SIZE = 2
+PUSH_QUEUE_SIZE = 8
+MAX_BATCH_WAIT_MS = 10
+
+_STOP = object()
 
 
 class Server(Flask):
@@ -22,6 +32,17 @@ class Server(Flask):
         input_comm,
         output_comms=None,
         schema_registry_url=None,
+        pipelined=False,
+        pull_queue_size=PULL_QUEUE_SIZE,
+        push_queue_size=PUSH_QUEUE_SIZE,
+        max_shared_frames_bytes=MAX_CACHED_BYTES,
+        request_batch_size=1,
+        max_batch_wait_ms=MAX_BATCH_WAIT_MS,
+        async_push=False,
+        async_push_queue_size=PUSH_QUEUE_SIZE,
+        push_retries=MAX_RETRIES,
+        result_cache=None,
+        media_backend=None,
     ):
         """Serves as the public interface for CV services through multivitamin.
 
@@ -39,6 +60,37 @@ class Server(Flask):
                                           somewhere
             schema_registry_url (str): use schema in registry url instead of
                                        local schema
+            pipelined (bool): run pulling, processing and pushing as separate
+                              stages connected by bounded queues, so that
+                              the next request is pulled and prepared while
+                              the current one is being processed
+            pull_queue_size (int): max number of pulled requests waiting to
+                                   be processed (pipelined mode only)
+            push_queue_size (int): max number of processed responses waiting
+                                   to be pushed (pipelined mode only)
+            max_shared_frames_bytes (int): max bytes of decoded frames kept
+                                           in memory to be shared between
+                                           the ImagesModules of a request
+            request_batch_size (int): max number of requests processed
+                                      together. If > 1, ImagesModules batch
+                                      the frames of several requests into
+                                      the same process_images call
+            max_batch_wait_ms (float): max time to wait for more requests
+                                       to fill a batch, after the first one
+                                       was received (pipelined mode only)
+            async_push (bool): push responses from background threads, one
+                               per output_comm, with retries. See
+                               OutputPusher
+            async_push_queue_size (int): max number of responses waiting to
+                                         be pushed, per output_comm
+            push_retries (int): number of retries of a failed push
+                                (async_push only)
+            result_cache (ResultCache): cache of the output of the modules,
+                                        to skip reprocessing identical media
+            media_backend (str): backend decoding the frames shared between
+                                 the ImagesModules, see
+                                 get_media_retriever. Defaults to the
+                                 media_backend of the first ImagesModule
         """
         if isinstance(modules, Module):
             modules = [modules]
@@ -63,6 +115,29 @@ class Server(Flask):
         ]
         self.modules = modules
         self.schema_registry_url = schema_registry_url
+        self.pipelined = pipelined
+        if pull_queue_size < 1 or push_queue_size < 1:
+            raise ValueError("Queue sizes must be >= 1")
+        self.pull_queue_size = pull_queue_size
+        self.push_queue_size = push_queue_size
+        self.max_shared_frames_bytes = max_shared_frames_bytes
+        if request_batch_size < 1:
+            raise ValueError("request_batch_size must be >= 1")
+        self.request_batch_size = request_batch_size
+        self.max_batch_wait_ms = max_batch_wait_ms
+        self.result_cache = result_cache
+        self.output_pusher = None
+        if async_push:
+            self.output_pusher = OutputPusher(
+                output_comms,
+                queue_size=async_push_queue_size,
+                max_retries=push_retries,
+            )
+        images_modules = [m for m in modules if isinstance(m, ImagesModule)]
+        self.num_images_modules = len(images_modules)
+        if media_backend is None and images_modules:
+            media_backend = images_modules[0].media_backend
+        self.media_backend = media_backend or "opencv"
 
         log.info("Input comm type: {}".format(type(input_comm)))
         for out in output_comms:
@@ -74,6 +149,13 @@ class Server(Flask):
         def health_check():
             return jsonify(self.modules_info)
 
+        @self.route("/stats", methods=["GET"])
+        def stats():
+            push_stats = []
+            if self.output_pusher is not None:
+                push_stats = self.output_pusher.stats()
+            return jsonify({"output_comms": push_stats})
+
     def start(self):
         """Public entry point for starting a server.
 
@@ -100,46 +182,233 @@ class Server(Flask):
     def _start(self):
         """Start server. While loop that pulls requests from the input_comm,
         calls _process_request(request), and posts responses to output_comms
+
+        If async_push is set, queued responses are flushed before returning
+        """
+        try:
+            if self.pipelined:
+                self._start_pipelined()
+            else:
+                self._start_sequential()
+        finally:
+            if self.output_pusher is not None:
+                self.output_pusher.shutdown()
+
+    def _start_sequential(self):
+        """Pull, process and push requests one batch after the other"""
+        while True:
+            try:
+                log.debug("Pulling requests")
+                requests = self.input_comm.pull()
+                batch = []
+                for request in requests:
+                    if request.kill_flag is True:
+                        log.info(
+                            "Incoming request with kill_flag == True,"
+                            " killing server"
+                        )
+                        self._process_and_push(batch)
+                        return
+                    batch.append((request, None))
+                    if len(batch) >= self.request_batch_size:
+                        self._process_and_push(batch)
+                        batch = []
+                self._process_and_push(batch)
+            except Exception as e:
+                log.error(e)
+                log.error(traceback.format_exc())
+                log.error("Error processing requests")
+
+    def _start_pipelined(self):
+        """Start server in pipelined mode.
+
+        Pulling and pushing each run in their own thread, connected to the
+        processing loop (run in the calling thread) by bounded FIFO queues.
+        Requests are processed and pushed in the order they were pulled.
+        On a kill_flag request, every request pulled before it is processed
+        and pushed before returning.
+        """
+        pulled = Queue(maxsize=self.pull_queue_size)
+        processed = Queue(maxsize=self.push_queue_size)
+
+        pull_thread = threading.Thread(
+            target=self._pull_stage, args=(pulled,), daemon=True
+        )
+        push_thread = threading.Thread(
+            target=self._push_stage, args=(processed,), daemon=True
+        )
+        pull_thread.start()
+        push_thread.start()
+
+        self._process_stage(pulled, processed)
+        push_thread.join()
+        log.info("Pipelined server stopped")
+
+    def _pull_stage(self, pulled):
+        """Pull requests and prepare their responses ahead of processing
+
+        Args:
+            pulled (Queue): queue of (Request, Response) to be processed
         """
         while True:
             try:
                 log.debug("Pulling requests")
                 requests = self.input_comm.pull()
                 for request in requests:
-                    try:
-                        if request.kill_flag is True:
-                            log.info(
-                                "Incoming request with kill_flag == True,"
-                                " killing server"
-                            )
-                            return
-                        response = self._process_request(request)
+                    if request.kill_flag is True:
                         log.info(
-                            f"Pushing reponse for {request} to output_comms"
+                            "Incoming request with kill_flag == True,"
+                            " killing server"
                         )
-                        for output_comm in self.output_comms:
-                            try:
-                                ret = output_comm.push(response)
-                            except Exception as e:
-                                log.error(e)
-                                log.error(traceback.format_exc())
-                                log.error(
-                                    f"Error pushing response for {request}"
-                                    f" to output_comm: {output_comm}"
-                                )
-                    except Exception:
-                        log.error(traceback.format_exc())
-                        log.error(f"Error processing request: {request}")
+                        pulled.put(_STOP)
+                        return
+                    pulled.put((request, self._prepare_response(request)))
+            except Exception as e:
+                log.error(e)
+                log.error(traceback.format_exc())
+                log.error("Error pulling requests")
+
+    def _process_stage(self, pulled, processed):
+        """Process pulled requests until the stop marker is received
+
+        Args:
+            pulled (Queue): queue of (Request, Response) to be processed
+            processed (Queue): queue of (Request, Response) to be pushed
+        """
+        while True:
+            item = pulled.get()
+            if item is _STOP:
+                processed.put(_STOP)
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.max_batch_wait_ms / 1000.0
+            while len(batch) < self.request_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = pulled.get(timeout=timeout)
+                except Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            try:
+                results = self._process_batch(batch)
             except Exception as e:
                 log.error(e)
                 log.error(traceback.format_exc())
                 log.error("Error processing requests")
+                results = []
+            for request, response in results:
+                processed.put((request, response))
+            if stop:
+                processed.put(_STOP)
+                return
+
+    def _push_stage(self, processed):
+        """Push processed responses until the stop marker is received
+
+        Args:
+            processed (Queue): queue of (Request, Response) to be pushed
+        """
+        while True:
+            item = processed.get()
+            if item is _STOP:
+                return
+            request, response = item
+            try:
+                self._push_response(request, response)
+            except Exception as e:
+                log.error(e)
+                log.error(traceback.format_exc())
+                log.error(f"Error pushing response for {request}")
+
+    def _process_and_push(self, batch):
+        """Process a batch of requests and push their responses
+
+        Args:
+            batch (list[tuple]): list of (Request, Response or None)
+        """
+        for request, response in self._process_batch(batch):
+            self._push_response(request, response)
+
+    def _process_batch(self, batch):
+        """Process a batch of requests, logging requests that fail
+
+        Args:
+            batch (list[tuple]): list of (Request, Response or None)
+
+        Returns:
+            list[tuple]: list of (Request, Response) successfully processed
+        """
+        if len(batch) == 0:
+            return []
+        if len(batch) == 1:
+            request, response = batch[0]
+            try:
+                return [(request, self._process_request(request, response))]
+            except Exception:
+                log.error(traceback.format_exc())
+                log.error(f"Error processing request: {request}")
+                return []
+        return self._process_requests(
+            [request for request, _ in batch],
+            [response for _, response in batch],
+        )
+
+    def _prepare_response(self, request):
+        """Construct the Response for a request ahead of processing
+
+        Errors are not raised here, so that they surface (and are logged)
+        when the request is processed, like in the sequential mode.
+
+        Args:
+            request (Request): incoming request
+
+        Returns:
+            Response: initial response, or None if it could not be created
+        """
+        try:
+            return Response(request, self.schema_registry_url)
+        except Exception:
+            log.debug(traceback.format_exc())
+            return None
 
-    def _process_request(self, request):
+    def _push_response(self, request, response):
+        """Push a response to every output_comm
+
+        Args:
+            request (Request): request the response belongs to
+            response (Response): response to push
+        """
+        if self.output_pusher is not None:
+            log.info(f"Queueing reponse for {request} to output_comms")
+            self.output_pusher.push(response)
+            return
+
+        log.info(f"Pushing reponse for {request} to output_comms")
+        for output_comm in self.output_comms:
+            try:
+                output_comm.push(response)
+            except Exception as e:
+                log.error(e)
+                log.error(traceback.format_exc())
+                log.error(
+                    f"Error pushing response for {request}"
+                    f" to output_comm: {output_comm}"
+                )
+
+    def _process_request(self, request, response=None):
         """Send request_message through all the modules
 
         Args:
             request (Request): incoming request
+            response (Response): initial response, constructed from the
+                                 request if None
 
         Returns:
             Response: outgoing response message
@@ -149,22 +418,225 @@ class Server(Flask):
                              f" not {Request}")
         log.debug(f"Processing: {request}")
 
-        response = Response(request, self.schema_registry_url)
+        if response is None:
+            response = Response(request, self.schema_registry_url)
 
+        if self.result_cache is not None:
+            return self.result_cache.process(
+                request,
+                response,
+                self.modules,
+                lambda response: self._run_modules(request, response),
+            )
+        return self._run_modules(request, response)
+
+    def _run_modules(self, request, response):
+        """Send a response through all the modules
+
+        Args:
+            request (Request): incoming request
+            response (Response): initial response
+
+        Returns:
+            Response: outgoing response message
+        """
+        frames_source = self._create_frames_source(request)
         for module in self.modules:
-            log.info(f"Processing {request} in module: {module}")
+            response = self._process_module(
+                module, request, response, frames_source
+            )
+        return response
+
+    def _process_requests(self, requests, responses=None):
+        """Send a batch of requests through all the modules
+
+        ImagesModules process the whole batch at once, see
+        ImagesModule.process_batch. Other modules process one request at
+        a time.
+
+        Args:
+            requests (list[Request]): incoming requests
+            responses (list[Response]): initial responses, constructed from
+                                        the requests if None
+
+        Returns:
+            list[tuple]: list of (Request, Response) successfully processed
+        """
+        if responses is None:
+            responses = [None] * len(requests)
+
+        batch = []
+        for request, response in zip(requests, responses):
             try:
-                response = module.process(response)
-            except Exception as e:
+                if not isinstance(request, Request):
+                    raise ValueError(f"{request} is of type {type(request)},"
+                                     f" not {Request}")
+                log.debug(f"Processing: {request}")
+                if response is None:
+                    response = Response(request, self.schema_registry_url)
+                batch.append(
+                    (request, response, self._create_frames_source(request))
+                )
+            except Exception:
                 log.error(traceback.format_exc())
-                log.error(f"Processing {request} in {module} FAILED. "
-                          f"Setting error code to {Codes.ERROR_PROCESSING}.")
-                module.code = Codes.ERROR_PROCESSING
-                response = module.update_and_return_response()
-
-            log.info(f"Processing {request} in module: {module}"
-                     f" ...Status: {module.code}")
-            if response is not None:
-                log.debug("response.to_dict():"
-                          f" {json.dumps(response.to_dict(), indent=2)}")
+                log.error(f"Error processing request: {request}")
+
+        cached, duplicates, keys = [], [], {}
+        if self.result_cache is not None:
+            batch, cached, duplicates, keys = self._lookup_batch(batch)
+
+        for module in self.modules:
+            if isinstance(module, ImagesModule) and len(batch) > 1:
+                log.info(f"Processing {len(batch)} requests in module:"
+                         f" {module}")
+                try:
+                    processed = module.process_batch(
+                        [response for _, response, _ in batch],
+                        frames_sources=[source for _, _, source in batch],
+                    )
+                    batch = [
+                        (request, response, source)
+                        for (request, _, source), response
+                        in zip(batch, processed)
+                    ]
+                except Exception:
+                    log.error(traceback.format_exc())
+                    log.error(f"Processing batch in {module} FAILED. "
+                              "Setting error code to "
+                              f"{Codes.ERROR_PROCESSING}.")
+                    batch = [
+                        (request, self._fail_module(module, response), source)
+                        for request, response, source in batch
+                    ]
+                continue
+
+            batch = [
+                (request,
+                 self._process_module(module, request, response, source),
+                 source)
+                for request, response, source in batch
+            ]
+
+        for request, response, _ in batch:
+            if id(request) in keys:
+                key, num_prev_footprints = keys[id(request)]
+                self.result_cache.save(key, response, num_prev_footprints)
+        for request, response, key in duplicates:
+            if self.result_cache.lookup(key, response):
+                cached.append((request, response))
+            else:
+                cached.append(
+                    (request, self._run_modules(request, response))
+                )
+
+        processed = {id(request): response for request, response, _ in batch}
+        processed.update(
+            (id(request), response) for request, response in cached
+        )
+        return [
+            (request, processed[id(request)])
+            for request in requests if id(request) in processed
+        ]
+
+    def _lookup_batch(self, batch):
+        """Look up a batch of requests in the result cache
+
+        Args:
+            batch (list[tuple]): list of (Request, Response, frames_source)
+
+        Returns:
+            list[tuple]: (Request, Response, frames_source) to process
+            list[tuple]: (Request, Response) restored from the cache
+            list[tuple]: (Request, Response, key) of requests identical to
+                         one to process, to be looked up once it is done
+            dict: (key, num_prev_footprints) of the requests to process,
+                  by id(Request)
+        """
+        to_process, cached, duplicates, keys = [], [], [], {}
+        pending = set()
+        for request, response, source in batch:
+            key = self.result_cache.make_key(request, response, self.modules)
+            if key is None:
+                to_process.append((request, response, source))
+            elif key in pending:
+                duplicates.append((request, response, key))
+            elif self.result_cache.lookup(key, response):
+                log.info(f"Result cache hit for {request}")
+                cached.append((request, response))
+            else:
+                pending.add(key)
+                keys[id(request)] = (key, len(response.footprints))
+                to_process.append((request, response, source))
+        return to_process, cached, duplicates, keys
+
+    def _create_frames_source(self, request):
+        """Create a source of frames shared by the ImagesModules, if needed
+
+        Args:
+            request (Request): incoming request
+
+        Returns:
+            SharedFramesSource: source, or None if there is a single
+                                ImagesModule
+        """
+        if self.num_images_modules <= 1:
+            return None
+        log.debug("Sharing decoded frames between ImagesModules")
+        return SharedFramesSource(
+            request.url,
+            request.sample_rate,
+            max_cached_bytes=self.max_shared_frames_bytes,
+            start_tstamp=request.start_tstamp,
+            end_tstamp=request.end_tstamp,
+            media_backend=self.media_backend,
+        )
+
+    def _fail_module(self, module, response):
+        """Set the code of module to ERROR_PROCESSING in a response, like
+        _process_module does when a module raises
+
+        Args:
+            module (Module): module that failed
+            response (Response): response
+
+        Returns:
+            Response: response with the footprint of the failed module
+        """
+        Module.process(module, response)
+        module.code = Codes.ERROR_PROCESSING
+        return module.update_and_return_response()
+
+    def _process_module(self, module, request, response, frames_source=None):
+        """Send a response through a module
+
+        Args:
+            module (Module): module
+            request (Request): incoming request
+            response (Response): response
+            frames_source (SharedFramesSource): frames shared by
+                                                ImagesModules
+
+        Returns:
+            Response: response returned by the module
+        """
+        log.info(f"Processing {request} in module: {module}")
+        try:
+            if isinstance(module, ImagesModule):
+                response = module.process(
+                    response, frames_source=frames_source
+                )
+            else:
+                response = module.process(response)
+        except Exception as e:
+            log.error(traceback.format_exc())
+            log.error(f"Processing {request} in {module} FAILED. "
+                      f"Setting error code to {Codes.ERROR_PROCESSING}.")
+            module.code = Codes.ERROR_PROCESSING
+            response = module.update_and_return_response()
+
+        log.info(f"Processing {request} in module: {module}"
+                 f" ...Status: {module.code}")
+        if response is not None:
+            log.debug("response.to_dict():"
+                      f" {json.dumps(response.to_dict(), indent=2)}")
         return response
@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import traceback
+from collections import OrderedDict
+from abc import ABC, abstractmethod
+
+import glog as log
+
+from multivitamin.media.file_retriever import FileRetriever
+from multivitamin.utils.single_flight import SingleFlight
+
+MAX_CACHE_BYTES = 1024 ** 3
+CACHED_SERVER_TRACK = "cached"
+
+
+class ResultStore(ABC):
+    """Abstract base class to define a key/value store of cached results"""
+
+    @abstractmethod
+    def get(self, key):
+        """Get a value, None if missing"""
+        pass
+
+    @abstractmethod
+    def put(self, key, value):
+        """Set a value (str)"""
+        pass
+
+
+class DiskResultStore(ResultStore):
+    def __init__(self, cache_dir, max_bytes=MAX_CACHE_BYTES):
+        """Stores results as files in a directory, with LRU eviction
+
+        The least recently read or written files are deleted once the
+        total size of the directory exceeds max_bytes.
+
+        Args:
+            cache_dir (str): directory of the cache
+            max_bytes (int): max total size of the cached results
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._sizes = OrderedDict(
+            (path, os.path.getsize(path))
+            for path in sorted(self._paths(), key=os.path.getmtime)
+        )
+        self._size = sum(self._sizes.values())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r") as rf:
+                value = rf.read()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if path in self._sizes:
+                self._sizes.move_to_end(path)
+        os.utime(path)
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as wf:
+            wf.write(value)
+        with self._lock:
+            self._size -= self._sizes.pop(path, 0)
+            os.replace(tmp_path, path)
+            self._sizes[path] = os.path.getsize(path)
+            self._size += self._sizes[path]
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._sizes:
+            path, size = self._sizes.popitem(last=False)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            log.debug(f"Evicted {path} from result cache")
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _paths(self):
+        return [
+            os.path.join(self.cache_dir, fn)
+            for fn in os.listdir(self.cache_dir)
+            if fn.endswith(".json")
+        ]
+
+
+class SQLiteResultStore(ResultStore):
+    def __init__(self, db_path, max_bytes=MAX_CACHE_BYTES):
+        """Stores results in a SQLite table, with LRU eviction
+
+        Args:
+            db_path (str): path to the SQLite database
+            max_bytes (int): max total size of the cached results
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+
+    def get(self, key):
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE results SET accessed = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            return row[0]
+
+    def put(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()[0]
+        while total > self.max_bytes:
+            key, size = self._conn.execute(
+                "SELECT key, size FROM results ORDER BY accessed LIMIT 1"
+            ).fetchone()
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            log.debug(f"Evicted {key} from result cache")
+
+
+class ResultCache:
+    def __init__(self, store, key_fields=()):
+        """Cache of the output of a chain of modules, keyed by media content
+
+        The key combines the quick hash of the media bytes (so identical
+        media under different urls hit the same entry), the sample_rate and
+        time range, the name and version of every module, and the previous
+        response the modules start from. Other request fields are ignored,
+        unless listed in key_fields (e.g. fields read by a module).
+
+        Concurrent calls for the same key are coalesced, so the modules
+        run once. Only results without error codes are stored.
+
+        On a hit, the stored media annotation replaces the one of the
+        response, and the footprints of the modules are marked with
+        server_track == "cached".
+
+        Args:
+            store (ResultStore): where to keep results
+            key_fields (list[str]): request fields to add to the key
+        """
+        assert isinstance(store, ResultStore)
+        self.store = store
+        self.key_fields = list(key_fields)
+        self._single_flight = SingleFlight()
+
+    def make_key(self, request, response, modules):
+        """Make the cache key of a request
+
+        Args:
+            request (Request): request
+            response (Response): response before processing
+            modules (list[Module]): modules processing the request
+
+        Returns:
+            str: key, or None if the media could not be hashed
+        """
+        try:
+            media_hash = FileRetriever(request.url).hash
+        except Exception:
+            log.warning(f"Unable to hash {request.url}, not using cache")
+            log.debug(traceback.format_exc())
+            return None
+
+        media_annotation = response.to_dict()["media_annotation"]
+        media_annotation.pop("url", None)
+        media_annotation.pop("url_original", None)
+        fields = {k: request.get(k) for k in self.key_fields}
+        fields["sample_rate"] = request.sample_rate
+        fields["start_tstamp"] = request.start_tstamp
+        fields["end_tstamp"] = request.end_tstamp
+        key = {
+            "media": media_hash,
+            "request": fields,
+            "modules": [[m.name, m.version] for m in modules],
+            "prev": media_annotation,
+        }
+        key = json.dumps(key, sort_keys=True, default=str)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def process(self, request, response, modules, process):
+        """Return the cached output for the request, or compute it
+
+        Args:
+            request (Request): request
+            response (Response): response before processing
+            modules (list[Module]): modules processing the request
+            process (callable): process(response) -> response, running
+                                the modules
+
+        Returns:
+            Response: processed response
+        """
+        key = self.make_key(request, response, modules)
+        if key is None:
+            return process(response)
+
+        num_prev_footprints = len(response.footprints)
+        cached, processed = self._single_flight.do(
+            key, self._get_or_process, key, response, process
+        )
+        if processed is response:
+            return processed
+        if cached is None:
+            log.debug(f"Result of {request} was not cacheable, processing")
+            return process(response)
+
+        log.info(f"Result cache hit for {request}")
+        self._merge(response, cached, num_prev_footprints)
+        return response
+
+    def lookup(self, key, response):
+        """Merge the cached output into response, if there is one
+
+        Args:
+            key (str): cache key
+            response (Response): response before processing
+
+        Returns:
+            bool: True on a cache hit
+        """
+        cached = self.store.get(key)
+        if cached is None:
+            return False
+        self._merge(response, cached, len(response.footprints))
+        return True
+
+    def save(self, key, response, num_prev_footprints):
+        """Store the output of the modules, unless they returned an error
+
+        Args:
+            key (str): cache key
+            response (Response): processed response
+            num_prev_footprints (int): number of footprints before
+                                       processing
+
+        Returns:
+            str: stored value, or None if not cacheable
+        """
+        codes = [fp["code"] for fp in response.footprints[num_prev_footprints:]]
+        if any(code.startswith("ERROR") for code in codes):
+            log.debug(f"Not caching result with codes: {codes}")
+            return None
+
+        cached = json.dumps(response.to_dict()["media_annotation"])
+        try:
+            self.store.put(key, cached)
+        except Exception:
+            log.error(traceback.format_exc())
+            log.error("Error storing result in cache")
+        return cached
+
+    def _get_or_process(self, key, response, process):
+        cached = self.store.get(key)
+        if cached is not None:
+            return cached, None
+
+        num_prev_footprints = len(response.footprints)
+        response = process(response)
+        return self.save(key, response, num_prev_footprints), response
+
+    def _merge(self, response, cached, num_prev_footprints):
+        media_annotation = json.loads(cached)
+        media_annotation["url"] = response.url
+        media_annotation["url_original"] = response.url_original
+        for footprint in media_annotation["codes"][num_prev_footprints:]:
+            footprint["server_track"] = CACHED_SERVER_TRACK
+        response.set_media_annotation(media_annotation)
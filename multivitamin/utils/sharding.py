@@ -0,0 +1,365 @@
+import sys
+import math
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import glog as log
+
+from multivitamin.data import Request, Response
+from multivitamin.data.response.config import TIME_EPS
+from multivitamin.data.response.utils import round_float
+from multivitamin.media import get_media_retriever
+from multivitamin.module import Codes
+
+MIN_SHARD_SEC = 30.0
+NUM_SHARDS = 4
+REDIS_POLL_SEC = 0.5
+
+_MODULES = {}
+
+
+def compute_shard_boundaries(
+    length,
+    num_shards,
+    period,
+    keyframes=None,
+    min_shard_sec=MIN_SHARD_SEC,
+):
+    """Split [0, length] into time ranges of about the same duration
+
+    Boundaries are snapped to the sampling grid (multiples of period), so
+    that shards sample the same tstamps as a single pass would. If
+    keyframes are given, each boundary is the first grid tstamp at or
+    after the nearest keyframe, so that a shard starts decoding in the GOP
+    of that keyframe.
+
+    Args:
+        length (float): length of the media in seconds
+        num_shards (int): max number of shards
+        period (float): sampling period in seconds
+        keyframes (list[float]): optional tstamps of the keyframes
+        min_shard_sec (float): min duration of a shard
+
+    Returns:
+        list[tuple]: (start_tstamp, end_tstamp) of each shard, the
+                     end_tstamp of the last shard is None (end of media)
+    """
+    num_shards = max(1, min(num_shards, int(length // min_shard_sec)))
+    step = length / num_shards
+    starts = [0.0]
+    for idx in range(1, num_shards):
+        tstamp = idx * step
+        if keyframes:
+            tstamp = min(keyframes, key=lambda k: abs(k - tstamp))
+            if period > 0:
+                tstamp = math.ceil(round_float(tstamp / period)) * period
+        elif period > 0:
+            tstamp = round(tstamp / period) * period
+        tstamp = round_float(tstamp)
+        if tstamp > starts[-1]:
+            starts.append(tstamp)
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def split_request(request, boundaries):
+    """Create one request per time range
+
+    Args:
+        request (Request): request of the whole media
+        boundaries (list[tuple]): (start_tstamp, end_tstamp) of each shard
+
+    Returns:
+        list[Request]: shard requests
+    """
+    requests = []
+    for start_tstamp, end_tstamp in boundaries:
+        shard = dict(request.request, start_tstamp=start_tstamp)
+        shard.pop("end_tstamp", None)
+        if end_tstamp is not None:
+            shard["end_tstamp"] = end_tstamp
+        requests.append(Request(shard, request.request_id))
+    return requests
+
+
+def _owns(request, tstamp):
+    """Check if tstamp falls in the time range of a shard request
+
+    Frames iterators may yield one frame past end_tstamp, the shard
+    starting there owns it.
+    """
+    return (request.start_tstamp - TIME_EPS <= tstamp and
+            tstamp < request.end_tstamp - TIME_EPS)
+
+
+def _merge_footprints(footprints, requests):
+    """Merge the footprints of a module across shards"""
+    merged = dict(footprints[0])
+    tstamps = {}
+    for footprint, request in zip(footprints, requests):
+        tstamps.update(
+            (round_float(t), t) for t in footprint["tstamps"]
+            if _owns(request, t)
+        )
+    merged["tstamps"] = [tstamps[t] for t in sorted(tstamps)]
+    for key in ("skipped_tstamps", "tracked_tstamps"):
+        skipped = {}
+        for footprint, request in zip(footprints, requests):
+            skipped.update(
+                (round_float(t), t) for t in footprint.get(key, [])
+                if _owns(request, t)
+            )
+        merged[key] = [skipped[t] for t in sorted(skipped)]
+    merged["num_images_processed"] = (len(merged["tstamps"]) -
+                                      len(merged["skipped_tstamps"]) -
+                                      len(merged["tracked_tstamps"]))
+    merged["date"] = max(footprint["date"] for footprint in footprints)
+
+    codes = [footprint["code"] for footprint in footprints]
+    errors = [code for code in codes if code.startswith("ERROR")]
+    if errors:
+        merged["code"] = errors[0]
+    elif Codes.SUCCESS.name in codes:
+        merged["code"] = Codes.SUCCESS.name
+    return merged
+
+
+def merge_responses(response, shards):
+    """Merge the responses of the shards of a request
+
+    The merge only depends on the order of the shards: each frame
+    annotation (and footprint tstamp) is taken from the shard whose time
+    range contains it, footprints of the same module are merged into one,
+    and tracks and media summaries of the shards are concatenated.
+
+    Args:
+        response (Response): response before processing, i.e. built from
+                             the request of the whole media
+        shards (list[tuple]): (Request, dict) of each shard, in order, with
+                              the shard's response as dict
+
+    Returns:
+        Response: merged response
+    """
+    media_ann = response.to_dict()["media_annotation"]
+    shard_anns = [
+        (request, shard_dict["media_annotation"])
+        for request, shard_dict in shards
+    ]
+    prev_ids = set(footprint["id"] for footprint in media_ann["codes"])
+    num_prev_tracks = len(media_ann["tracks_summary"])
+    num_prev_summaries = len(media_ann["media_summary"])
+
+    frame_anns = {}
+    footprints = {}
+    tracks = []
+    summaries = []
+    for request, shard_ann in shard_anns:
+        for image_ann in shard_ann["frames_annotation"]:
+            tstamp = round_float(image_ann["t"])
+            if tstamp not in frame_anns and _owns(request, tstamp):
+                frame_anns[tstamp] = image_ann
+        for footprint in shard_ann["codes"]:
+            if footprint["id"] in prev_ids:
+                continue
+            key = (footprint["server"], footprint["ver"])
+            footprints.setdefault(key, []).append((footprint, request))
+        tracks.extend(shard_ann["tracks_summary"][num_prev_tracks:])
+        summaries.extend(shard_ann["media_summary"][num_prev_summaries:])
+        if not media_ann["w"]:
+            media_ann["w"] = shard_ann["w"]
+            media_ann["h"] = shard_ann["h"]
+
+    # regions of the previous response that no shard owns
+    for image_ann in media_ann["frames_annotation"]:
+        frame_anns.setdefault(round_float(image_ann["t"]), image_ann)
+
+    kept_ids = set()
+    for _, shard_ann in shard_anns:
+        kept_ids.update(fp["id"] for fp in shard_ann["codes"]
+                        if fp["id"] in prev_ids)
+    media_ann["codes"] = [
+        fp for fp in media_ann["codes"] if fp["id"] in kept_ids
+    ] + [
+        _merge_footprints(*zip(*module_footprints))
+        for module_footprints in footprints.values()
+    ]
+    media_ann["frames_annotation"] = [
+        frame_anns[t] for t in sorted(frame_anns)
+    ]
+    media_ann["tracks_summary"] += sorted(tracks, key=lambda k: k["t1"])
+    media_ann["media_summary"] += summaries
+    response.set_media_annotation(media_ann)
+    return response
+
+
+def _get_modules(modules_factory):
+    """Get the modules of a factory, created once per process"""
+    key = (modules_factory.__module__, modules_factory.__qualname__)
+    if key not in _MODULES:
+        log.info(f"Creating modules with {modules_factory}")
+        modules = modules_factory()
+        if not isinstance(modules, list):
+            modules = [modules]
+        _MODULES[key] = modules
+    return _MODULES[key]
+
+
+def process_shard(modules_factory, request_dict, request_id=None):
+    """Process a shard request through the modules of modules_factory
+
+    Runs in a worker process (or a redis worker), where the modules are
+    created on the first call and reused for the following shards.
+
+    Args:
+        modules_factory (callable): picklable function returning the
+                                    list of modules
+        request_dict (dict): shard request
+        request_id (str): ID of the request
+
+    Returns:
+        dict: response of the shard
+    """
+    request = Request(request_dict, request_id)
+    response = Response(request)
+    for module in _get_modules(modules_factory):
+        log.info(f"Processing {request} in module: {module}")
+        try:
+            response = module.process(response)
+        except Exception:
+            log.error(traceback.format_exc())
+            log.error(f"Processing {request} in {module} FAILED. "
+                      f"Setting error code to {Codes.ERROR_PROCESSING}.")
+            module.code = Codes.ERROR_PROCESSING
+            response = module.update_and_return_response()
+    return response.to_dict()
+
+
+class ShardedProcessor:
+    def __init__(
+        self,
+        modules_factory,
+        num_shards=NUM_SHARDS,
+        parallelization="process",
+        min_shard_sec=MIN_SHARD_SEC,
+        q_name="default-redis-queue",
+        timeout=None,
+        media_backend="opencv",
+    ):
+        """Processes long videos as time shards in parallel
+
+        A video request is split into up to num_shards time ranges, which
+        are processed in parallel, and the responses of the shards are
+        merged back into a single response. Images and videos shorter than
+        2 * min_shard_sec are processed as a single shard.
+
+        With parallelization == "process", shards are processed by a pool
+        of num_shards local processes. With parallelization == "redis",
+        shards are enqueued on the rq queue q_name, to be processed by
+        workers on any machine (e.g. started by WorkerManager), which must
+        be able to import modules_factory.
+
+        Args:
+            modules_factory (callable): picklable function returning the
+                                        list of modules, called once per
+                                        worker process
+            num_shards (int): max number of shards per request
+            parallelization (str): "process" or "redis"
+            min_shard_sec (float): min duration of a shard
+            q_name (str): name of the redis queue
+            timeout (float): max seconds to wait for a redis shard
+            media_backend (str): backend probing the media to split it,
+                                 see get_media_retriever. The modules
+                                 decode with their own media_backend
+        """
+        if parallelization not in ("process", "redis"):
+            raise ValueError(f"Unsupported parallelization: {parallelization}")
+        self.modules_factory = modules_factory
+        self.num_shards = num_shards
+        self.parallelization = parallelization
+        self.min_shard_sec = min_shard_sec
+        self.timeout = timeout
+        self.media_backend = media_backend
+        self._executor = None
+        self._queue = None
+        if parallelization == "process":
+            self._executor = ProcessPoolExecutor(max_workers=num_shards)
+        else:
+            from redis import Redis
+            from rq import Queue as rQueue
+            self._queue = rQueue(q_name, connection=Redis())
+
+    def process(self, request, keyframes=None):
+        """Process a request, split into time shards
+
+        Args:
+            request (Request): request of the whole media
+            keyframes (list[float]): tstamps of the keyframes, to align the
+                                     shards on. Defaults to the keyframes
+                                     of media.frame_index, if the video is
+                                     indexed without a full scan (see
+                                     AbstractMediaRetriever.indexed)
+
+        Returns:
+            Response: merged response
+        """
+        response = Response(request)
+        media = get_media_retriever(request.url, self.media_backend)
+        if media.is_video:
+            if keyframes is None and media.indexed:
+                keyframes = media.frame_index.keyframe_tstamps()
+            period = max(1.0 / request.sample_rate, 1.0 / media.fps)
+            start_tstamp = request.start_tstamp
+            end_tstamp = min(request.end_tstamp, media.length)
+            boundaries = [
+                (start_tstamp + start, None if end is None
+                 else start_tstamp + end)
+                for start, end in compute_shard_boundaries(
+                    end_tstamp - start_tstamp,
+                    self.num_shards,
+                    period,
+                    keyframes=[k - start_tstamp for k in keyframes or []
+                               if start_tstamp <= k <= end_tstamp],
+                    min_shard_sec=self.min_shard_sec,
+                )
+            ]
+            if request.end_tstamp != sys.maxsize:
+                boundaries[-1] = (boundaries[-1][0], request.end_tstamp)
+        else:
+            boundaries = [(request.start_tstamp, None)]
+
+        requests = split_request(request, boundaries)
+        log.info(f"Processing {request} in {len(requests)} shards:"
+                 f" {boundaries}")
+        shards = list(zip(requests, self._map(requests)))
+        return merge_responses(response, shards)
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def _map(self, requests):
+        """Process shard requests in parallel, results in order"""
+        if self._executor is not None:
+            futures = [
+                self._executor.submit(process_shard, self.modules_factory,
+                                      request.request, request.request_id)
+                for request in requests
+            ]
+            return [future.result() for future in futures]
+
+        jobs = [
+            self._queue.enqueue(process_shard, self.modules_factory,
+                                request.request, request.request_id)
+            for request in requests
+        ]
+        start = time.time()
+        while not all(job.is_finished or job.is_failed for job in jobs):
+            if self.timeout is not None and time.time() - start > self.timeout:
+                raise TimeoutError(f"Shards of {requests[0]} timed out")
+            time.sleep(REDIS_POLL_SEC)
+        for job in jobs:
+            if job.is_failed:
+                raise RuntimeError(f"Shard job {job.id} failed: {job.exc_info}")
+        return [job.result for job in jobs]
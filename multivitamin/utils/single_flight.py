@@ -0,0 +1,66 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls sharing the same key.
+
+    While a call for a key is in flight, other callers with the same key
+    wait for it and get its result (or its exception) instead of running
+    the function again.
+
+    Usage:
+    single_flight = SingleFlight()
+    result = single_flight.do(key, expensive_function, arg0, arg1)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """Call func(*args, **kwargs), unless a call for key is in flight
+
+        Args:
+            key (hashable): key identifying the call
+            func (callable): function to call
+
+        Returns:
+            Any: result of func
+
+        Raises:
+            Exception: exception raised by func
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = func(*args, **kwargs)
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self, key):
+        """Check if a call for key is in flight"""
+        with self._lock:
+            return key in self._calls
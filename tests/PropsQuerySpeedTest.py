@@ -0,0 +1,71 @@
+"""Regions/sec matched against previous properties of interest, with the
+compiled PropsQuery and with the former pandas DataFrame.query path
+
+Usage:
+    python PropsQuerySpeedTest.py [num_regions]
+"""
+import sys
+import random
+from datetime import datetime
+
+from tabulate import tabulate
+
+try:
+    import pandas as pd
+except ImportError:
+    raise ImportError("package: pandas not found")
+
+from multivitamin.data.response.dtypes import Property
+from multivitamin.module.utils import (compile_props_query,
+                                       convert_props_to_pandas_query,
+                                       pandas_query_matches_props)
+
+VALUES = ["car", "truck", "face", "person", "dog", "bike"]
+POIS = [
+    [{"value": "car"}],
+    [{"property_type": "object", "value": "face"}, {"value": "car"}],
+    [{"property_type": "object", "value": "truck"},
+     {"property_type": "object", "value": "car"},
+     {"property_type": "label", "value": "person"}],
+]
+
+
+def create_regions(num_regions):
+    random.seed(0)
+    return [
+        [
+            Property(property_type=random.choice(["object", "label"]),
+                     value=random.choice(VALUES),
+                     confidence=random.random())
+            for _ in range(random.randint(1, 3))
+        ]
+        for _ in range(num_regions)
+    ]
+
+
+def benchmark(match, regions):
+    start = datetime.now()
+    matches = [match(props) for props in regions]
+    seconds = (datetime.now() - start).total_seconds()
+    return len(regions) / seconds, matches
+
+
+if __name__ == "__main__":
+    print("SPEED TEST!!!")
+    num_regions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    regions = create_regions(num_regions)
+    rows = []
+    for pois in POIS:
+        bool_exp = convert_props_to_pandas_query(pois)
+        pandas_rate, expected = benchmark(
+            lambda props: pandas_query_matches_props(bool_exp,
+                                                     pd.DataFrame(props)),
+            regions,
+        )
+        compiled_rate, matches = benchmark(compile_props_query(pois),
+                                           regions)
+        assert matches == expected, f"{bool_exp}: matches differ"
+        rows.append([bool_exp, f"{pandas_rate:.0f}", f"{compiled_rate:.0f}",
+                     f"{compiled_rate / pandas_rate:.0f}x"])
+    print(tabulate(rows, headers=["query", "pandas (regions/sec)",
+                                  "compiled (regions/sec)", "speedup"]))
@@ -0,0 +1,81 @@
+"""Frames/sec of each OpenCVFramesIterator sampling strategy, of the
+strategy MediaRetriever picks by default, and of the PyAV backend
+
+Usage:
+    python SamplingSpeedTest.py [video_url ...]
+
+Without urls, a synthetic 60 fps video is generated.
+"""
+import sys
+import tempfile
+from datetime import datetime
+
+import cv2
+import numpy as np
+from tabulate import tabulate
+
+from multivitamin.media import MediaRetriever, get_media_retriever
+from multivitamin.media.opencv_media_retriever import (
+    OpenCVFramesIterator,
+    STRATEGIES,
+)
+
+SAMPLE_RATES = [0.2, 1.0, 5.0, 30.0]
+
+
+def create_video(num_frames=3600, fps=60, w=640, h=360):
+    path = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False).name
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps,
+                             (w, h))
+    for idx in range(num_frames):
+        frame = np.random.randint(0, 32, (h, w, 3), np.uint8)
+        frame[:, :, idx % 3] += np.uint8(idx % 200)
+        writer.write(frame)
+    writer.release()
+    return "file://" + path
+
+
+def benchmark(url, sample_rate, strategy):
+    """strategy None benchmarks the default media.get_frames_iterator"""
+    media = MediaRetriever(url)
+    if strategy is None:
+        frames_iterator = media.get_frames_iterator(sample_rate)
+    else:
+        frames_iterator = OpenCVFramesIterator(media.video_capture,
+                                               media.fps, sample_rate,
+                                               strategy=strategy)
+    start = datetime.now()
+    tstamps = [tstamp for _, tstamp in frames_iterator]
+    seconds = (datetime.now() - start).total_seconds()
+    return len(tstamps) / seconds, tstamps
+
+
+def benchmark_pyav(url, sample_rate):
+    media = get_media_retriever(url, backend="pyav")
+    start = datetime.now()
+    tstamps = [tstamp for _, tstamp in media.get_frames_iterator(sample_rate)]
+    seconds = (datetime.now() - start).total_seconds()
+    return len(tstamps) / seconds
+
+
+if __name__ == "__main__":
+    print("SPEED TEST!!!")
+    urls = sys.argv[1:] or [create_video()]
+    for url in urls:
+        rows = []
+        for sample_rate in SAMPLE_RATES:
+            row = [sample_rate]
+            reference = None
+            for strategy in STRATEGIES + (None,):
+                fps, tstamps = benchmark(url, sample_rate, strategy)
+                if reference is None:
+                    reference = tstamps
+                assert tstamps == reference, f"{strategy} tstamps differ"
+                row.append(f"{fps:.1f}")
+            row.append(f"{benchmark_pyav(url, sample_rate):.1f}")
+            rows.append(row)
+        print(url)
+        print(tabulate(rows, headers=["sample_rate"] +
+                       [f"{s} (frames/sec)" for s in STRATEGIES] +
+                       ["default (frames/sec)"] +
+                       ["pyav (frames/sec)"]))
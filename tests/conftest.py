@@ -0,0 +1,216 @@
+"""Fixtures and helpers shared by the test modules
+
+Helpers are imported by the test modules with `from conftest import ...`.
+multivitamin.data needs confluent_kafka, so it is only imported by the
+helpers that use it, and the other test modules collect without it.
+"""
+import re
+import threading
+from functools import lru_cache, partial
+from http.server import (HTTPServer,
+                         ThreadingHTTPServer,
+                         BaseHTTPRequestHandler,
+                         SimpleHTTPRequestHandler)
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+
+@lru_cache(maxsize=None)
+def _mean_module_class():
+    from multivitamin.data.response.dtypes import Region, Property
+    from multivitamin.module import ImagesModule
+
+    class MeanModule(ImagesModule):
+        """Labels each frame with its mean pixel value"""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.batch_lengths = []
+
+        def process_images(self, images, tstamps, prev_regions=None):
+            self.batch_lengths.append(len(images))
+            for image, tstamp in zip(images, tstamps):
+                prop = Property(server=self.name,
+                                value=str(int(image.mean())))
+                self.response.append_region(t=tstamp,
+                                            region=Region(props=[prop]))
+
+    return MeanModule
+
+
+def __getattr__(name):
+    """`from conftest import MeanModule` builds MeanModule on first use"""
+    if name == "MeanModule":
+        return _mean_module_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def first_value(response):
+    """Value of the first property of the first frame of a response"""
+    return response.frame_anns[0]["regions"][0]["props"][0]["value"]
+
+
+def write_video(path, frames, fps=10):
+    """Write BGR frames into an mp4v video
+
+    Args:
+        path (str): filepath of the video
+        frames (iterable): frames, all of the size of the first one
+        fps (float): frame rate
+
+    Returns:
+        str: path
+    """
+    writer = None
+    for frame in frames:
+        if writer is None:
+            h, w = frame.shape[:2]
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"),
+                                     fps, (w, h))
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def varint(value):
+    """Protobuf encoding of an unsigned int"""
+    out = b""
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out += bytes([byte | 0x80])
+        else:
+            return out + bytes([byte])
+
+
+def protobuf_field(number, payload):
+    """Protobuf encoding of a field, a varint if payload is an int,
+    length-delimited otherwise (str, bytes or an encoded message)
+    """
+    if isinstance(payload, int):
+        return varint(number << 3) + varint(payload)
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return varint(number << 3 | 2) + varint(len(payload)) + payload
+
+
+def gray_frames(num_frames, step=8, size=(64, 48)):
+    """Uniform frames, frame i filled with i * step"""
+    w, h = size
+    for i in range(num_frames):
+        yield np.full((h, w, 3), i * step, np.uint8)
+
+
+@pytest.fixture
+def video_url(tmpdir):
+    """3 sec video at 10 fps, frame i filled with i * 8"""
+    return "file://" + write_video(str(tmpdir.join("video.mp4")),
+                                   gray_frames(30))
+
+
+@pytest.fixture
+def media_dir(tmpdir):
+    """Folder with an image.jpg and the video.mp4 of video_url"""
+    Image.fromarray(np.full((48, 64, 3), 100, np.uint8)).save(
+        str(tmpdir.join("image.jpg")))
+    write_video(str(tmpdir.join("video.mp4")), gray_frames(30))
+    return str(tmpdir)
+
+
+@pytest.fixture
+def http_server(media_dir):
+    """Serves media_dir, recording the HTTP methods of the requests"""
+    methods = []
+
+    class Handler(SimpleHTTPRequestHandler):
+        def do_HEAD(self):
+            methods.append("HEAD")
+            super().do_HEAD()
+
+        def do_GET(self):
+            methods.append("GET")
+            super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0),
+                        partial(Handler, directory=media_dir))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", methods
+    server.shutdown()
+
+
+@pytest.fixture
+def range_server():
+    """Serves files with range requests and keep-alive connections
+
+    Setting stats["ignore_range"] makes it answer range requests with the
+    whole file, stats["fail_from"] with a 500 from that byte on, and
+    stats["reject_head"] HEAD requests with a 403.
+    """
+    files = {}
+    stats = {"requests": [], "connections": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        wbufsize = -1  # one write per response, no delayed ACKs
+
+        def setup(self):
+            stats["connections"] += 1
+            super().setup()
+
+        def do_HEAD(self):
+            if stats.get("reject_head"):
+                self.send_response(403)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self._send_headers(files[self.path], len(files[self.path]))
+            self.end_headers()
+
+        def do_GET(self):
+            data = files[self.path]
+            match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+            start, end = 0, len(data) - 1
+            if match and not stats.get("ignore_range"):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), len(data) - 1)
+            if start >= stats.get("fail_from", len(data) + 1):
+                self.send_response(500)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if match and not stats.get("ignore_range"):
+                self.send_response(206)
+                self.send_header("Content-Range",
+                                 f"bytes {start}-{end}/{len(data)}")
+            else:
+                self.send_response(200)
+            stats["requests"].append((start, end))
+            self._send_headers(data, end - start + 1)
+            self.end_headers()
+            try:
+                self.wfile.write(data[start:end + 1])
+            except ConnectionError:
+                pass  # the client only read part of the body
+
+        def _send_headers(self, data, length):
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", '"{}"'.format(hash(data)))
+            self.send_header("Content-Length", str(length))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", files, stats
+    server.shutdown()
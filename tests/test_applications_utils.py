@@ -0,0 +1,247 @@
+import numpy as np
+import pytest
+
+from multivitamin.applications.utils import (LOGOEXCLUDE,
+                                             label_array,
+                                             lookup_labels,
+                                             detection_regions,
+                                             load_mean_binaryproto,
+                                             parse_label_prototxt,
+                                             caffe_input_shape,
+                                             onnx_input_shape,
+                                             dnn_blob,
+                                             label_thresholds,
+                                             classification_props)
+from multivitamin.data.response.dtypes import (create_bbox_contour_from_points,
+                                               Region,
+                                               Property)
+from multivitamin.data.response.utils import compute_box_area
+
+from conftest import varint, protobuf_field
+
+CONFIDENCE_MIN = 0.3
+
+# caffe.io.Transformer.preprocess(image) of _test_image, with a mean of
+# [10, 20, 30] and a (2, 0, 1) transpose, recorded with skimage 0.21
+TRANSFORMER_3X4_TO_5X6 = [
+    [[-10.0000, 34.4000, 93.6000, 152.8000, 111.6000, 44.6667],
+     [54.3333, 72.5000, 96.3000, 170.3000, 118.8000, 39.0000],
+     [150.8333, 113.0000, 61.5000, 135.5000, 84.0000, 10.0000],
+     [121.8333, 153.5000, 152.2000, 125.8000, 124.5000, 106.5000],
+     [80.0000, 142.4000, 168.1333, 93.4667, 119.2000, 134.6667]],
+    [[4.6667, 54.0000, 79.7333, 5.0667, 30.8000, 59.3333],
+     [75.1667, 99.5000, 98.2000, 71.8000, 70.5000, 59.8333],
+     [171.6667, 140.0000, 88.5000, 162.5000, 111.0000, 30.8333],
+     [142.6667, 105.2000, 53.7000, 127.7000, 76.2000, 1.8333],
+     [94.6667, 61.6000, 20.4000, 79.6000, 38.4000, -18.0000]],
+    [[19.3333, 73.6000, 99.3333, 24.6667, 50.4000, 74.0000],
+     [12.3333, 76.3000, 125.2000, 98.8000, 97.5000, 80.6667],
+     [-16.6667, 41.5000, 115.5000, 189.5000, 138.0000, 51.6667],
+     [79.8333, 82.0000, 80.7000, 154.7000, 103.2000, 22.6667],
+     [109.3333, 81.2000, 40.0000, 99.2000, 58.0000, -3.3333]],
+]
+TRANSFORMER_7X9_TO_3X4 = [
+    [[110.4983, 109.6503, 79.3949, 58.0086],
+     [140.6353, 107.8805, 75.2983, 53.7777],
+     [120.3724, 89.2356, 64.0123, 131.4979]],
+    [[57.4335, 87.2197, 103.7517, 79.9508],
+     [77.0049, 134.3664, 102.2556, 77.3976],
+     [60.7442, 113.4812, 83.2983, 60.9344]],
+    [[75.5388, 67.2792, 91.8371, 101.8920],
+     [73.4156, 71.5927, 98.0390, 101.7953],
+     [56.5234, 82.9230, 107.4809, 82.8766]],
+]
+# same, with skimage.transform.resize(..., anti_aliasing=False)
+TRANSFORMER_7X9_TO_3X4_ALIASED = [
+    [[118.7917, 86.1667, 53.5417, 52.2917],
+     [138.5000, 74.5000, 41.8750, 40.6250],
+     [126.8333, 62.8333, 30.2083, 185.8333]],
+    [[83.0417, 81.7917, 80.5417, 79.2917],
+     [71.3750, 101.5000, 68.8750, 67.6250],
+     [59.7083, 89.8333, 57.2083, 55.9583]],
+    [[110.0417, 108.7917, 107.5417, 106.2917],
+     [98.3750, 97.1250, 95.8750, 94.6250],
+     [86.7083, 85.4583, 84.2083, 82.9583]],
+]
+
+
+def _reference_regions(predictions, num_images, labelmap):
+    """Regions built one detection at a time, like SSDDetector used to"""
+    regions = [[] for _ in range(num_images)]
+    for pred in predictions:
+        confidence = float(pred[2])
+        if confidence < CONFIDENCE_MIN or not 0 <= int(pred[0]) < num_images:
+            continue
+        if int(pred[1]) not in labelmap:
+            continue
+        contour = create_bbox_contour_from_points(
+            float(pred[3]), float(pred[4]), float(pred[5]), float(pred[6]),
+            bound=True
+        )
+        prop = Property(
+            confidence=confidence,
+            confidence_min=CONFIDENCE_MIN,
+            ver="1.0.0",
+            server="SSD",
+            value=labelmap[int(pred[1])],
+            property_type="object",
+            fraction=compute_box_area(contour),
+        )
+        regions[int(pred[0])].append(Region(contour=contour, props=[prop]))
+    return regions
+
+
+def test_lookup_labels():
+    labels = label_array({1: "car", 3: "face"})
+    assert lookup_labels(labels, np.array([3.0, 1.0, 2.0, 7.0, -1.0])).tolist() == [
+        "face", "car", None, None, None
+    ]
+
+
+def test_detection_regions_match_per_detection_loop():
+    rng = np.random.RandomState(0)
+    num_dets = 500
+    predictions = np.zeros((num_dets, 7), np.float32)
+    predictions[:, 0] = rng.randint(-1, 4, num_dets)
+    predictions[:, 1] = rng.randint(0, 6, num_dets)
+    predictions[:, 2] = rng.rand(num_dets)
+    predictions[:, 3:5] = rng.uniform(-0.1, 0.8, (num_dets, 2))
+    predictions[:, 5:7] = predictions[:, 3:5] + rng.uniform(0, 0.4, (num_dets, 2))
+    labelmap = {1: "car", 2: "truck", 3: "face", 4: "dog"}
+
+    regions = detection_regions(
+        4,
+        predictions[:, 0],
+        predictions[:, 3:7],
+        predictions[:, 2],
+        lookup_labels(label_array(labelmap), predictions[:, 1]),
+        confidence_min=CONFIDENCE_MIN,
+        ver="1.0.0",
+        server="SSD",
+        property_type="object",
+    )
+    expected = _reference_regions(predictions, 4, labelmap)
+    assert [len(r) for r in regions] == [len(r) for r in expected]
+    for image_regions, expected_regions in zip(regions, expected):
+        for region, expected_region in zip(image_regions, expected_regions):
+            assert region["contour"] == expected_region["contour"]
+            assert region["props"] == expected_region["props"]
+
+
+def test_detection_regions_without_bounds():
+    regions = detection_regions(
+        1, [0], [[-0.1, 0.2, 0.5, 1.2]], [0.9], ["car"], bound=False,
+    )
+    contour = regions[0][0]["contour"]
+    assert (contour[0]["x"], contour[0]["y"]) == (-0.1, 0.2)
+    assert (contour[2]["x"], contour[2]["y"]) == (0.5, 1.2)
+    assert regions[0][0]["props"][0]["fraction"] == 0.0
+
+
+def test_load_mean_binaryproto(tmpdir):
+    mean = np.arange(2 * 3 * 4, dtype=np.float32).reshape(3, 2, 4)
+    data = protobuf_field(5, mean.astype("<f4").tobytes())
+
+    legacy = tmpdir.join("legacy.binaryproto")
+    legacy.write_binary(protobuf_field(1, 1) + protobuf_field(2, 3) +
+                        protobuf_field(3, 2) + protobuf_field(4, 4) + data)
+    np.testing.assert_array_equal(load_mean_binaryproto(str(legacy)), mean)
+
+    dims = b"".join(varint(dim) for dim in (1, 3, 2, 4))
+    shaped = tmpdir.join("shaped.binaryproto")
+    shaped.write_binary(data + protobuf_field(7, protobuf_field(1, dims)))
+    np.testing.assert_array_equal(load_mean_binaryproto(str(shaped)), mean)
+
+
+def test_parse_label_prototxt_and_input_shape(tmpdir):
+    labelmap = tmpdir.join("labelmap.prototxt")
+    labelmap.write('item {\n  name: "none_of_the_above"\n  label: 0\n'
+                   '  display_name: "background"\n}\n'
+                   'item {\n  name: "car"\n  label: 7\n  display_name: "car"\n}\n')
+    assert parse_label_prototxt(str(labelmap)) == {0: "background", 7: "car"}
+
+    deploy = tmpdir.join("deploy.prototxt")
+    deploy.write('input: "data"\ninput_shape {\n  dim: 1\n  dim: 3\n'
+                 '  dim: 300\n  dim: 200\n}\n')
+    assert caffe_input_shape(str(deploy)) == (1, 3, 300, 200)
+    deploy.write('input: "data"\ninput_dim: 10\ninput_dim: 3\n'
+                 'input_dim: 227\ninput_dim: 227\n')
+    assert caffe_input_shape(str(deploy)) == (10, 3, 227, 227)
+
+
+def test_onnx_input_shape(tmpdir):
+    # ModelProto.graph.input[0].type.tensor_type.shape, "N" a symbolic dim
+    dims = (protobuf_field(1, protobuf_field(2, "N")) +
+            b"".join(protobuf_field(1, protobuf_field(1, dim))
+                     for dim in (3, 224, 160)))
+    tensor_type = protobuf_field(1, 1) + protobuf_field(2, dims)
+    value_info = (protobuf_field(1, "data") +
+                  protobuf_field(2, protobuf_field(1, tensor_type)))
+    model = tmpdir.join("model.onnx")
+    model.write_binary(protobuf_field(1, 7) +
+                       protobuf_field(7, protobuf_field(11, value_info)))
+    assert onnx_input_shape(str(model)) == (None, 3, 224, 160)
+
+
+def test_dnn_blob():
+    rng = np.random.RandomState(0)
+    images = [rng.randint(0, 255, (8, 6, 3)).astype(np.uint8)
+              for _ in range(2)]
+    mean = np.array([10.0, 20.0, 30.0])
+    blob = dnn_blob(images, (6, 8), mean)
+    assert blob.shape == (2, 3, 8, 6)
+    for image, image_blob in zip(images, blob):
+        np.testing.assert_allclose(
+            image_blob, image.transpose(2, 0, 1) - mean[:, None, None]
+        )
+    assert dnn_blob(images, (3, 4), swap_rb=True).shape == (2, 3, 4, 3)
+
+
+def _test_image(height, width):
+    return ((np.arange(height * width * 3).reshape(height, width, 3) * 37) %
+            251).astype(np.uint8)
+
+
+@pytest.mark.parametrize("image_shape, size, anti_aliasing, expected", [
+    ((3, 4), (6, 5), True, TRANSFORMER_3X4_TO_5X6),
+    ((7, 9), (4, 3), True, TRANSFORMER_7X9_TO_3X4),
+    ((7, 9), (4, 3), False, TRANSFORMER_7X9_TO_3X4_ALIASED),
+])
+def test_dnn_blob_matches_caffe_transformer(image_shape, size, anti_aliasing,
+                                            expected):
+    blob = dnn_blob([_test_image(*image_shape)], size, [10.0, 20.0, 30.0],
+                    anti_aliasing=anti_aliasing)
+    assert blob.dtype == np.float32
+    np.testing.assert_allclose(blob[0], expected, atol=1e-3)
+
+
+def test_classification_props():
+    labels = {0: "Garbage", 1: "car", 2: "dog", 3: "cat"}
+    probs = np.array([[0.5, 0.3, 0.15, 0.05], [0.1, 0.1, 0.2, 0.6]],
+                     np.float32)
+    min_conf_filter, min_confs = label_thresholds(labels, 0.1, {"dog": 0.5})
+    assert min_conf_filter == {"Garbage": 0.1, "car": 0.1, "dog": 0.5,
+                               "cat": 0.1}
+    exclude_mask = np.array([label in LOGOEXCLUDE
+                             for label in labels.values()])
+    props = classification_props(probs, labels, 2, min_confs, exclude_mask,
+                                 server="Clf")
+    assert [[p["value"] for p in frame_props] for frame_props in props] == [
+        ["car", "Unknown"], ["cat", "Unknown"]
+    ]
+    assert props[0][1]["confidence_min"] == 0.5
+    assert props[1][0]["confidence"] == float(np.float32(0.6))
+    assert props[1][0]["server"] == "Clf"
+
+
+def test_classification_props_keep_exact_min_confidences():
+    labels = {0: "car", 1: "dog"}
+    _, min_confs = label_thresholds(labels, 0.1, {"dog": 0.3})
+    probs = np.array([[0.9, 0.1], [0.2, 0.8]], np.float32)
+    props = classification_props(probs, labels, 2, min_confs, server="Clf")
+    confidence_mins = {p["value"]: p["confidence_min"]
+                       for frame_props in props for p in frame_props}
+    # not float(np.float32(0.1)) == 0.10000000149011612
+    assert confidence_mins == {"car": 0.1, "dog": 0.3, "Unknown": 0.3}
+    assert all(type(p["confidence_min"]) is float
+               for frame_props in props for p in frame_props)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from multivitamin.applications.caffe_io import resize_image
+
+# caffe.io.resize_image(image, (height, width)) of _test_image, recorded
+# with skimage 0.21
+RESIZED_2X3_TO_3X4 = [
+    [0.0000, 57.8125, 127.1875, 161.8750],
+    [35.8750, 110.3750, 146.5625, 120.3125],
+    [59.7917, 126.1458, 117.0833, 38.6458],
+]
+RESIZED_5X4_TO_2X2 = [
+    [102.9297, 109.0426],
+    [109.2904, 121.3104],
+]
+# same, with skimage.transform.resize(..., anti_aliasing=False)
+RESIZED_5X4_TO_2X2_ALIASED = [
+    [106.1250, 108.5000],
+    [118.0000, 120.3750],
+]
+
+
+def _test_image(height, width):
+    return ((np.arange(height * width).reshape(height, width, 1) * 111) %
+            251).astype(np.uint8)
+
+
+@pytest.mark.parametrize("image_shape, size, anti_aliasing, expected", [
+    ((2, 3), (4, 3), True, RESIZED_2X3_TO_3X4),
+    ((2, 3), (4, 3), False, RESIZED_2X3_TO_3X4),
+    ((5, 4), (2, 2), True, RESIZED_5X4_TO_2X2),
+    ((5, 4), (2, 2), False, RESIZED_5X4_TO_2X2_ALIASED),
+])
+def test_resize_image_matches_caffe_io(image_shape, size, anti_aliasing,
+                                       expected):
+    resized = resize_image(_test_image(*image_shape), size, anti_aliasing)
+    assert resized.dtype == np.float32
+    assert resized.shape == (size[1], size[0], 1)
+    np.testing.assert_allclose(resized[..., 0], expected, atol=1e-3)
+
+
+def test_resize_image_keeps_channels_apart():
+    # channels share the [0, 1] scaling but are smoothed separately
+    image = np.concatenate([_test_image(5, 4),
+                            np.zeros((5, 4, 1), np.uint8)], axis=2)
+    resized = resize_image(image, (2, 2))
+    assert resized.shape == (2, 2, 2)
+    np.testing.assert_allclose(resized[..., 0], RESIZED_5X4_TO_2X2,
+                               atol=1e-3)
+    assert (resized[..., 1] == 0).all()
+
+
+def test_resize_image_of_uniform_image():
+    image = np.full((4, 4, 3), 7, np.uint8)
+    resized = resize_image(image, (3, 2))
+    assert resized.shape == (2, 3, 3)
+    assert (resized == 7).all()
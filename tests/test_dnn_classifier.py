@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+import cv2
+
+from multivitamin.data import Request, Response
+from multivitamin.applications.images.classifiers.dnn_classifier import (
+    DNNClassifier,
+)
+
+from conftest import protobuf_field
+
+DEPLOY = """name: "mean_color"
+input: "data"
+input_shape { dim: 1 dim: 3 dim: 8 dim: 8 }
+layer {
+  name: "pool"
+  type: "Pooling"
+  bottom: "data"
+  top: "pool"
+  pooling_param { pool: AVE global_pooling: true }
+}
+layer {
+  name: "prob"
+  type: "Softmax"
+  bottom: "pool"
+  top: "prob"
+}
+"""
+
+
+def _onnx_value_info(name, dims):
+    shape = b"".join(protobuf_field(1, protobuf_field(1, dim)) for dim in dims)
+    tensor_type = protobuf_field(1, 1) + protobuf_field(2, shape)
+    return (protobuf_field(1, name) +
+            protobuf_field(2, protobuf_field(1, tensor_type)))
+
+
+def _onnx_node(op_type, inputs, outputs):
+    return protobuf_field(1, b"".join(
+        [protobuf_field(1, name) for name in inputs] +
+        [protobuf_field(2, name) for name in outputs] +
+        [protobuf_field(4, op_type)]
+    ))
+
+
+def _mean_color_onnx():
+    """ModelProto of the DEPLOY net, encoded by hand"""
+    graph = b"".join([
+        _onnx_node("GlobalAveragePool", ["data"], ["pool"]),
+        _onnx_node("Flatten", ["pool"], ["flat"]),
+        _onnx_node("Softmax", ["flat"], ["prob"]),
+        protobuf_field(2, "mean_color"),
+        protobuf_field(11, _onnx_value_info("data", [1, 3, 8, 8])),
+        protobuf_field(12, _onnx_value_info("prob", [1, 3])),
+    ])
+    opset = protobuf_field(2, 13)
+    return (protobuf_field(1, 7) + protobuf_field(8, opset) +
+            protobuf_field(7, graph))
+
+
+@pytest.fixture
+def labels_dir(tmpdir):
+    tmpdir.join("labels.txt").write("blue\ngreen\nred\n")
+    return tmpdir
+
+
+@pytest.fixture
+def caffe_net_data_dir(labels_dir):
+    """Weight-free net: softmax of the mean of each BGR channel"""
+    if not hasattr(cv2.dnn, "readNetFromCaffe"):
+        pytest.skip("OpenCV was built without the Caffe importer")
+    labels_dir.join("deploy.prototxt").write(DEPLOY)
+    labels_dir.join("model.caffemodel").write_binary(b"")
+    return str(labels_dir)
+
+
+@pytest.fixture
+def onnx_net_data_dir(labels_dir):
+    """The net of caffe_net_data_dir, converted to ONNX"""
+    labels_dir.join("model.onnx").write_binary(_mean_color_onnx())
+    return str(labels_dir)
+
+
+def _classify(net_data_dir):
+    classifier = DNNClassifier("DNNClassifier", "1.0.0", net_data_dir,
+                               confidence_min=0.5, batch_size=4)
+    assert classifier.input_size == (8, 8)
+    response = Response(Request({"url": "file:///tmp/image.png"}))
+    classifier.response = response
+    images = [np.zeros((16, 12, 3), np.uint8) for _ in range(3)]
+    for channel, image in enumerate(images):
+        image[..., channel] = 10
+    classifier.process_images(images, [0.0, 1.0, 2.0], [None] * 3)
+    return response
+
+
+@pytest.mark.parametrize("net_data_dir", ["caffe_net_data_dir",
+                                          "onnx_net_data_dir"])
+def test_dnn_classifier(request, net_data_dir):
+    response = _classify(request.getfixturevalue(net_data_dir))
+
+    for t, value in [(0.0, "blue"), (1.0, "green"), (2.0, "red")]:
+        regions = response.get_regions_from_tstamp(t)
+        assert len(regions) == 1
+        prop = regions[0]["props"][0]
+        assert prop["value"] == value
+        assert prop["confidence"] > 0.99
+        assert prop["confidence_min"] == 0.5
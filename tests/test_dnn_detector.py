@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from multivitamin.data import Request, Response
+from multivitamin.applications.images.detectors.dnn_detector import (
+    DNNDetector,
+)
+
+from conftest import varint, protobuf_field
+
+DT_FLOAT = 1
+DT_INT32 = 3
+
+
+def _attr(key, value):
+    return protobuf_field(5, protobuf_field(1, key) +
+                          protobuf_field(2, value))
+
+
+def _node(name, op, inputs=(), attrs=b""):
+    return protobuf_field(1, b"".join(
+        [protobuf_field(1, name), protobuf_field(2, op)] +
+        [protobuf_field(3, name) for name in inputs]
+    ) + attrs)
+
+
+def _const(name, array, dtype):
+    shape = b"".join(protobuf_field(2, protobuf_field(1, dim))
+                     for dim in array.shape)
+    tensor = (protobuf_field(1, dtype) + protobuf_field(2, shape) +
+              protobuf_field(4, array.tobytes()))
+    return _node(name, "Const",
+                 attrs=_attr("dtype", protobuf_field(6, dtype)) +
+                 _attr("value", protobuf_field(8, tensor)))
+
+
+def _fake_detection_graph():
+    """GraphDef with the output rows of the object detection API
+
+    The mean RGB color (r, g, b) of image i gives one detection
+    [r / 100, 1, g / 255, 0.1, 0.2, 0.5, 1.2], i.e. a label 1 box of
+    confidence g / 255 in image r / 100, crossing the bottom of the image.
+    """
+    weights = np.zeros((1, 1, 3, 7), np.float32)
+    bias = np.zeros(7, np.float32)
+    weights[0, 0, 0, 0] = 1 / 100.0
+    bias[1] = 1.0
+    weights[0, 0, 1, 2] = 1 / 255.0
+    bias[3:7] = [0.1, 0.2, 0.5, 1.2]
+    strides = protobuf_field(1, protobuf_field(
+        3, b"".join(varint(1) for _ in range(4))))
+    nhwc = _attr("data_format", protobuf_field(2, "NHWC"))
+    return b"".join([
+        _node("image_tensor", "Placeholder",
+              attrs=_attr("dtype", protobuf_field(6, DT_FLOAT))),
+        _const("mean/reduction_indices", np.array([1, 2], np.int32),
+               DT_INT32),
+        _node("mean", "Mean", ["image_tensor", "mean/reduction_indices"],
+              _attr("keep_dims", protobuf_field(5, 1)) +
+              _attr("Tidx", protobuf_field(6, DT_INT32))),
+        _const("conv/weights", weights, DT_FLOAT),
+        _node("conv", "Conv2D", ["mean", "conv/weights"],
+              _attr("strides", strides) +
+              _attr("padding", protobuf_field(2, "VALID")) + nhwc),
+        _const("conv/bias", bias, DT_FLOAT),
+        _node("detection_out", "BiasAdd", ["conv", "conv/bias"], nhwc),
+    ])
+
+
+@pytest.fixture
+def net_data_dir(tmpdir):
+    """TFDetector layout, without the optional graph.pbtxt"""
+    tmpdir.join("frozen_inference_graph.pb").write_binary(
+        _fake_detection_graph())
+    tmpdir.join("idmap.txt").write("1\tcar\n")
+    return str(tmpdir)
+
+
+def test_dnn_detector_tf_graph(net_data_dir):
+    detector = DNNDetector("DNNDetector", "1.0.0", net_data_dir,
+                           confidence_min=0.5, input_size=(8, 8))
+    response = Response(Request({"url": "file:///tmp/image.png"}))
+    detector.response = response
+    # BGR frames of different sizes, G sets the confidence
+    images = []
+    for i, green in enumerate([230, 50, 204]):
+        image = np.zeros((20 + i, 30, 3), np.uint8)
+        image[..., 1] = green
+        image[..., 2] = 100 * i
+        images.append(image)
+    assert detector.process_images(images, [0.0, 1.0, 2.0]) is None
+
+    assert [ann["t"] for ann in response.frame_anns] == [0.0, 2.0]
+    for t, confidence in [(0.0, 230 / 255), (2.0, 204 / 255)]:
+        regions = response.get_regions_from_tstamp(t)
+        assert len(regions) == 1
+        xs = [pt["x"] for pt in regions[0]["contour"]]
+        ys = [pt["y"] for pt in regions[0]["contour"]]
+        assert (min(xs), min(ys), max(xs), max(ys)) == pytest.approx(
+            (0.1, 0.2, 0.5, 1.2))
+        prop = regions[0]["props"][0]
+        assert prop["value"] == "car"
+        assert prop["confidence"] == pytest.approx(confidence, abs=1e-5)
+        # TF boxes are not bounded, like TFDetector's
+        assert prop["fraction"] == 0.0
+        assert prop["property_type"] == "object"
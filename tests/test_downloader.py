@@ -0,0 +1,68 @@
+import os
+
+import pytest
+import requests
+
+from multivitamin.media.downloader import (download_file, PART_SUFFIX,
+                                           STATE_SUFFIX)
+
+
+def test_parallel_download(range_server, tmpdir):
+    base_url, files, stats = range_server
+    files["/video.mp4"] = os.urandom(1000 * 1000 + 7)
+    path = str(tmpdir.join("video.mp4"))
+    download_file(base_url + "/video.mp4", path, num_connections=4,
+                  part_bytes=64 * 1024)
+    with open(path, "rb") as rf:
+        assert rf.read() == files["/video.mp4"]
+    # the first byte, to get the size, then the parts
+    assert stats["requests"][0] == (0, 0)
+    assert len(stats["requests"]) == 17
+    assert not os.path.exists(path + PART_SUFFIX)
+    assert not os.path.exists(path + STATE_SUFFIX)
+
+
+def test_download_resumes(range_server, tmpdir):
+    base_url, files, stats = range_server
+    files["/video.mp4"] = os.urandom(10 * 1024)
+    path = str(tmpdir.join("video.mp4"))
+    stats["fail_from"] = 6 * 1024
+    with pytest.raises(requests.HTTPError):
+        download_file(base_url + "/video.mp4", path, num_connections=1,
+                      part_bytes=1024)
+    assert not os.path.exists(path)
+    assert os.path.exists(path + PART_SUFFIX)
+
+    del stats["fail_from"]
+    del stats["requests"][:]
+    download_file(base_url + "/video.mp4", path, part_bytes=1024)
+    with open(path, "rb") as rf:
+        assert rf.read() == files["/video.mp4"]
+    assert sorted(stats["requests"][1:]) == [
+        (start, start + 1023) for start in range(6 * 1024, 10 * 1024, 1024)
+    ]
+
+
+def test_download_checks_etag(range_server, tmpdir):
+    base_url, files, stats = range_server
+    files["/video.mp4"] = os.urandom(1024)
+    with pytest.raises(IOError):
+        download_file(base_url + "/video.mp4", str(tmpdir.join("video.mp4")),
+                      expected_etag='"stale"')
+
+
+@pytest.mark.parametrize("ignore_range", [False, True])
+def test_download_without_head_requests(range_server, tmpdir, ignore_range):
+    base_url, files, stats = range_server
+    files["/video.mp4"] = os.urandom(3000)
+    stats["reject_head"] = True  # like presigned S3 GET urls
+    stats["ignore_range"] = ignore_range
+    path = str(tmpdir.join("video.mp4"))
+    download_file(base_url + "/video.mp4", path, part_bytes=1024)
+    with open(path, "rb") as rf:
+        assert rf.read() == files["/video.mp4"]
+    if ignore_range:
+        # the whole file is streamed from the first response
+        assert stats["requests"] == [(0, 2999)]
+    else:
+        assert len(stats["requests"]) == 4
@@ -0,0 +1,122 @@
+import os
+
+import numpy as np
+import pytest
+
+from multivitamin.media import get_media_retriever
+from multivitamin.media import frame_index as frame_index_module
+from multivitamin.media.frame_index import FrameIndex, INDEX_SUFFIX
+from multivitamin.media.media_cache import get_media_cache, set_media_cache
+from multivitamin.media.media_cache import MediaCache
+
+# variable frame rate: frame i is displayed from PTS[i]
+PTS = [0.0, 0.1, 0.15, 0.5, 0.55, 1.2, 1.25, 1.3, 2.0, 2.05, 2.1, 2.9]
+
+
+def _value(i):
+    return 20 * i
+
+
+@pytest.fixture
+def vfr_video(tmpdir):
+    av = pytest.importorskip("av")
+    path = str(tmpdir.join("vfr.mp4"))
+    with av.open(path, "w") as container:
+        stream = container.add_stream("mpeg4", rate=100)
+        stream.width, stream.height = 64, 48
+        stream.pix_fmt = "yuv420p"
+        stream.codec_context.gop_size = 4
+        for i, pts in enumerate(PTS):
+            image = np.full((48, 64, 3), _value(i), np.uint8)
+            frame = av.VideoFrame.from_ndarray(image, format="bgr24")
+            frame.pts = int(round(pts * 100))
+            frame.time_base = stream.codec_context.time_base
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return "file://" + path
+
+
+def test_frame_index_lookup():
+    index = FrameIndex([0.2, 0.0, 0.1, 0.3], keyframes=[0, 2])
+    assert index.pts == [0.0, 0.1, 0.2, 0.3]
+    assert index.frame_index(0.0) == 0
+    assert index.frame_index(0.1999) == 2
+    assert index.frame_index(0.25) == 2
+    assert index.frame_index(10.0) == 3
+    assert index.keyframe_before(1) == 0
+    assert index.keyframe_before(3) == 2
+    assert index.should_seek(1, 3, seek_cost_frames=0)
+    assert not index.should_seek(1, 3, seek_cost_frames=1)
+    assert not index.should_seek(2, 3, seek_cost_frames=0)
+    assert index.should_seek(3, 2, seek_cost_frames=100)
+
+
+@pytest.mark.parametrize("backend", ["opencv", "pyav"])
+def test_get_frames_on_vfr_video(vfr_video, backend):
+    media = get_media_retriever(vfr_video, backend=backend)
+    index = media.frame_index
+    assert np.allclose(index.pts, PTS)
+    assert index.keyframes[0] == 0
+
+    tstamps = [2.95, 0.12, 1.27, 0.0, 0.52, 2.0, 1.24]
+    frames = media.get_frames(tstamps)
+    for tstamp, frame in zip(tstamps, frames):
+        expected = max(i for i, pts in enumerate(PTS) if pts <= tstamp)
+        assert abs(frame.mean() - _value(expected)) < 8, tstamp
+
+    frame = media.get_frame(1.2, target_size=(32, 24))
+    assert frame.shape == (24, 32, 3)
+    assert abs(frame.mean() - _value(5)) < 8
+
+
+def test_get_frame_without_pyav_does_not_index(video_url, monkeypatch):
+    monkeypatch.setattr(frame_index_module, "av", None)
+    monkeypatch.setattr(frame_index_module, "_build_frame_index_opencv",
+                        lambda src: pytest.fail("indexed every frame"))
+    media = get_media_retriever(video_url)
+    assert not media.indexed
+    assert media.tstamp_to_frame_index(1.04) == 10
+    frame = media.get_frame(1.0)
+    assert frame.shape == (48, 64, 3)
+    assert abs(frame.mean() - 10 * 8) < 8
+
+    # get_frames builds the index, which get_frame then uses
+    monkeypatch.undo()
+    monkeypatch.setattr(frame_index_module, "av", None)
+    assert len(get_media_retriever(video_url).get_frames([1.0, 2.0])) == 2
+    assert get_media_retriever(video_url).indexed
+
+
+def test_get_frames_of_image(media_dir):
+    media = get_media_retriever("file://" + os.path.join(media_dir,
+                                                         "image.jpg"))
+    frames = media.get_frames([0.0, 1.0])
+    assert len(frames) == 2
+    assert frames[0].shape == (48, 64, 3)
+
+
+def test_index_is_saved_in_media_cache(http_server, tmpdir):
+    base_url, methods = http_server
+    prev_cache = get_media_cache()
+    set_media_cache(MediaCache(str(tmpdir.join("media_cache"))))
+    try:
+        media = get_media_retriever(base_url + "/video.mp4")
+        assert len(media.frame_index) == 30
+        assert os.path.exists(media.local_path + INDEX_SUFFIX)
+        assert len(FrameIndex.load(media.local_path + INDEX_SUFFIX)) == 30
+    finally:
+        set_media_cache(prev_cache)
+
+
+@pytest.mark.parametrize("backend", ["opencv", "pyav"])
+def test_tstamps_iterator_matches_sampled_iterator(vfr_video, backend):
+    media = get_media_retriever(vfr_video, backend=backend)
+    sampled = list(media.get_frames_iterator(sample_rate=100.0))
+    media = get_media_retriever(vfr_video, backend=backend)
+    tstamps = [t for _, t in sampled][::3]
+    targeted = list(media.get_frames_iterator(tstamps=tstamps[::-1]))
+    assert [t for _, t in targeted] == tstamps
+    for (frame, _), (expected, _) in zip(targeted, sampled[::3]):
+        assert np.array_equal(frame, expected)
@@ -0,0 +1,99 @@
+import io
+import os
+import zipfile
+
+import numpy as np
+import pytest
+from imohash import hashfile, hashfileobject
+from PIL import Image
+
+from multivitamin.media.http_fileobj import HTTPFile
+
+
+def test_reads_match_the_file(range_server):
+    base_url, files, stats = range_server
+    data = os.urandom(300 * 1000)
+    files["/data"] = data
+    f = HTTPFile(base_url + "/data", block_size=4096, max_cached_blocks=8)
+    assert f.content_length == len(data)
+    rng = np.random.RandomState(0)
+    for _ in range(50):
+        pos = int(rng.randint(0, len(data)))
+        amt = int(rng.randint(0, 20000))
+        f.seek(pos)
+        assert f.read(amt) == data[pos:pos + amt]
+    f.seek(-10, 2)
+    assert f.read() == data[-10:]
+    assert f.read(5) == b""
+    f.seek(0)
+    assert f.read() == data
+
+
+def test_sequential_reads_are_read_ahead(range_server):
+    base_url, files, stats = range_server
+    files["/data"] = os.urandom(1024 * 1024)
+    f = HTTPFile(base_url + "/data", block_size=4096, max_cached_blocks=64)
+    chunks = iter(lambda: f.read(4096), b"")
+    assert b"".join(chunks) == files["/data"]
+    # 256 blocks, read ahead up to 16 blocks at a time
+    assert f.num_requests < 256 / 8
+    assert stats["connections"] == 1
+
+
+def test_adjacent_missing_blocks_are_coalesced(range_server):
+    base_url, files, stats = range_server
+    files["/data"] = os.urandom(100 * 1024)
+    f = HTTPFile(base_url + "/data", block_size=1024)
+    f.seek(10 * 1024)
+    f.read(10)
+    f.seek(13 * 1024)
+    f.read(10)
+    del stats["requests"][:]
+    f.seek(9 * 1024)
+    assert f.read(6 * 1024) == files["/data"][9 * 1024:15 * 1024]
+    assert stats["requests"] == [(9 * 1024, 10 * 1024 - 1),
+                                 (11 * 1024, 13 * 1024 - 1),
+                                 (14 * 1024, 15 * 1024 - 1)]
+
+
+def test_ignored_ranges_are_streamed(range_server):
+    base_url, files, stats = range_server
+    stats["ignore_range"] = True
+    files["/data"] = os.urandom(1024 * 1024)
+    f = HTTPFile(base_url + "/data", block_size=4096)
+    assert not f.seekable()
+    assert f.read(10) == files["/data"][:10]
+    chunks = iter(lambda: f.read(5000), b"")
+    assert f.read(0) + b"".join(chunks) == files["/data"][10:]
+    assert f.num_requests == 1
+    with pytest.raises(OSError):
+        f.seek(0)
+    f.close()
+
+    f = HTTPFile(base_url + "/data", block_size=4096)
+    f.close()  # without reading the rest of the file
+    assert f.num_requests == 1
+
+
+def test_works_with_imohash_pil_and_zip(range_server, tmpdir):
+    base_url, files, stats = range_server
+    buf = io.BytesIO()
+    Image.fromarray(np.full((480, 640, 3), 7, np.uint8)).save(buf, "PNG")
+    files["/image.png"] = buf.getvalue()
+    path = str(tmpdir.join("image.png"))
+    with open(path, "wb") as wf:
+        wf.write(files["/image.png"])
+
+    f = HTTPFile(base_url + "/image.png")
+    assert (hashfileobject(f, hexdigest=True) ==
+            hashfile(path, hexdigest=True))
+    assert f.num_requests <= 3
+    f.seek(0)
+    assert Image.open(f).size == (640, 480)
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("a.txt", "hello")
+    files["/a.zip"] = buf.getvalue()
+    with zipfile.ZipFile(HTTPFile(base_url + "/a.zip")) as zf:
+        assert zf.read("a.txt") == b"hello"
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from multivitamin.data import Request, Response
+from multivitamin.module import Codes
+
+from conftest import MeanModule, first_value, write_video
+
+
+@pytest.fixture
+def image_urls(tmpdir):
+    urls = []
+    for value in [10, 20, 30]:
+        path = str(tmpdir.join(f"{value}.png"))
+        Image.fromarray(np.full((8, 8, 3), value, np.uint8)).save(path)
+        urls.append("file://" + path)
+    return urls
+
+
+def test_process_batch_routes_regions(image_urls):
+    module = MeanModule("Mean", "1.0.0", batch_size=4)
+    responses = [Response(Request({"url": url})) for url in image_urls]
+    responses = module.process_batch(responses)
+
+    assert module.batch_lengths == [3]
+    assert [first_value(r) for r in responses] == ["10", "20", "30"]
+    for response in responses:
+        assert response.frame_anns[0]["t"] == 0.0
+        assert response.footprints[-1]["code"] == Codes.SUCCESS.name
+        assert response.footprints[-1]["tstamps"] == [0.0]
+
+
+def test_process_batch_keeps_errors_per_response(image_urls):
+    module = MeanModule("Mean", "1.0.0", batch_size=4)
+    urls = [image_urls[0], "file:///does/not/exist.png", image_urls[1]]
+    responses = [Response(Request({"url": url})) for url in urls]
+    responses = module.process_batch(responses)
+
+    codes = [r.footprints[-1]["code"] for r in responses]
+    assert codes == [Codes.SUCCESS.name,
+                     Codes.ERROR_LOADING_MEDIA.name,
+                     Codes.SUCCESS.name]
+    assert first_value(responses[0]) == "10"
+    assert first_value(responses[2]) == "20"
+
+
+def test_incremental_processes_missing_tstamps_only(video_url):
+    module = MeanModule("Mean", "1.0.0", incremental=True)
+    first = module.process(Response(Request({"url": video_url,
+                                             "sample_rate": 1.0})))
+    first_tstamps = first.footprints[-1]["tstamps"]
+    assert len(first_tstamps) == sum(module.batch_lengths)
+
+    module.batch_lengths = []
+    request = Request({"url": video_url, "sample_rate": 2.0,
+                       "prev_response": first.to_dict()})
+    second = module.process(Response(request))
+
+    assert len(second.footprints) == 1
+    footprint = second.footprints[0]
+    assert footprint["code"] == Codes.SUCCESS.name
+    assert set(first_tstamps) < set(footprint["tstamps"])
+    assert (sum(module.batch_lengths) ==
+            len(footprint["tstamps"]) - len(first_tstamps))
+    assert len(second.frame_anns) == len(footprint["tstamps"])
+
+
+@pytest.fixture
+def static_video_url(tmpdir):
+    # 4 static shots of 1 sec
+    frames = (np.full((48, 64, 3), 40 + (i // 10) * 50, np.uint8)
+              for i in range(40))
+    return "file://" + write_video(str(tmpdir.join("static.mp4")), frames)
+
+
+def test_near_duplicate_frames_are_skipped(static_video_url):
+    module = MeanModule("Mean", "1.0.0", batch_size=4,
+                        skip_similar_threshold=2.0)
+    response = module.process(Response(Request({"url": static_video_url,
+                                                "sample_rate": 5.0})))
+    footprint = response.footprints[-1]
+    tstamps = footprint["tstamps"]
+    assert sum(module.batch_lengths) == footprint["num_images_processed"]
+    assert 4 <= footprint["num_images_processed"] <= 8
+    assert (len(footprint["skipped_tstamps"]) ==
+            len(tstamps) - footprint["num_images_processed"])
+
+    values = {ann["t"]: ann["regions"][0]["props"][0]["value"]
+              for ann in response.frame_anns}
+    assert sorted(values) == tstamps
+    reference = MeanModule("Mean", "1.0.0").process(
+        Response(Request({"url": static_video_url, "sample_rate": 5.0}))
+    )
+    assert values == {ann["t"]: ann["regions"][0]["props"][0]["value"]
+                      for ann in reference.frame_anns}
@@ -0,0 +1,68 @@
+import os
+import threading
+
+import pytest
+
+from multivitamin.media import MediaRetriever
+from multivitamin.media.media_cache import (MediaCache, get_media_cache,
+                                            set_media_cache)
+
+
+@pytest.fixture
+def media_cache(tmpdir):
+    prev_cache = get_media_cache()
+    cache = MediaCache(str(tmpdir.join("media_cache")))
+    set_media_cache(cache)
+    yield cache
+    set_media_cache(prev_cache)
+
+
+def test_concurrent_downloads_are_coalesced(http_server, media_cache):
+    base_url, methods = http_server
+    paths = []
+    threads = [
+        threading.Thread(target=lambda: paths.append(
+            media_cache.get_path(base_url + "/video.mp4", "etag")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(paths)) == 1
+    assert methods.count("GET") == 1
+    assert paths[0].endswith(".mp4")
+
+    other = media_cache.get_path(base_url + "/video.mp4", "new-etag")
+    assert other != paths[0]
+    assert methods.count("GET") == 2
+
+
+def test_least_recently_used_files_are_evicted(http_server, tmpdir):
+    base_url, _ = http_server
+    cache = MediaCache(str(tmpdir.join("small")), max_bytes=1)
+    image_path = cache.get_path(base_url + "/image.jpg")
+    video_path = cache.get_path(base_url + "/video.mp4")
+    assert not os.path.exists(image_path)
+    assert os.path.exists(video_path)
+    assert cache.size == os.path.getsize(video_path)
+
+    reloaded = MediaCache(str(tmpdir.join("small")), max_bytes=1)
+    assert reloaded.size == cache.size
+
+
+def test_retrievers_read_from_the_cache(http_server, media_cache):
+    base_url, methods = http_server
+    media = MediaRetriever(base_url + "/video.mp4")
+    frames = list(media.get_frames_iterator(sample_rate=1.0))
+    assert len(frames) == 3
+    assert media.video_capture.isOpened()
+
+    image = MediaRetriever(base_url + "/image.jpg")
+    assert image.get_image().shape == (48, 64, 3)
+    assert image.download(return_filelike=True).read()
+    num_gets = methods.count("GET")
+    image = MediaRetriever(base_url + "/image.jpg")
+    assert image.get_image().shape == (48, 64, 3)
+    assert image.hash
+    assert methods.count("GET") == num_gets
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("mmcv")
+pytest.importorskip("mmdet")
+
+from multivitamin.data import Request, Response  # noqa: E402
+from multivitamin.applications.images.detectors import mm_detector  # noqa: E402
+from multivitamin.applications.images.detectors.mm_detector import (  # noqa: E402
+    MMDetector,
+)
+
+CLASSES = ("car", "dog", "cat")
+
+
+class FakeModel:
+    CLASSES = CLASSES
+
+
+def _no_boxes():
+    return np.zeros((0, 5), np.float32)
+
+
+def _results(images):
+    """Boxes in pixels: a car and a cat (plus a low confidence one) in the
+    first frame, nothing in the others
+    """
+    results = []
+    for i, image in enumerate(images):
+        if i == 0 and image.any():
+            height, width = image.shape[:2]
+            results.append([
+                np.array([[0.1 * width, 0.2 * height, 0.5 * width,
+                           0.6 * height, 0.9]], np.float32),
+                _no_boxes(),
+                np.array([[0, 0, 2 * width, height, 0.8],
+                          [1, 1, 2, 2, 0.1]], np.float32),
+            ])
+        else:
+            results.append([_no_boxes() for _ in CLASSES])
+    return results
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Patches mmdet's API, recording the batches of inference_detector"""
+    calls = []
+    monkeypatch.setattr(mm_detector, "init_detector",
+                        lambda config, checkpoint, device: FakeModel())
+    monkeypatch.setattr(mm_detector.mmcv.Config, "fromfile",
+                        staticmethod(lambda path: {}))
+    return calls
+
+
+def _patch_inference(monkeypatch, calls, generator=False, masks=False):
+    def inference_detector(model, imgs):
+        calls.append([img.shape for img in imgs])
+        results = _results(imgs)
+        if masks:
+            results = [(result, [[] for _ in result]) for result in results]
+        return iter(results) if generator else results
+
+    monkeypatch.setattr(mm_detector, "inference_detector", inference_detector)
+
+
+def _detector(tmpdir, **kwargs):
+    config_file = tmpdir.join("config.py")
+    model_file = tmpdir.join("model.pth")
+    config_file.write("")
+    model_file.write("")
+    return MMDetector("MMDetector", "1.0.0", str(config_file),
+                      str(model_file), confidence_min=0.5, **kwargs)
+
+
+def test_warmup_runs_batches_of_each_shape(tmpdir, calls, monkeypatch):
+    _patch_inference(monkeypatch, calls)
+    _detector(tmpdir, batch_size=3, warmup_shapes=[(8, 16), (4, 4)])
+    assert calls == [[(8, 16, 3)] * 3, [(4, 4, 3)] * 3]
+
+
+@pytest.mark.parametrize("generator", [False, True])
+@pytest.mark.parametrize("masks", [False, True])
+def test_batch_is_inferred_at_once(tmpdir, calls, monkeypatch, generator,
+                                   masks):
+    _patch_inference(monkeypatch, calls, generator=generator, masks=masks)
+    detector = _detector(tmpdir, batch_size=2, warmup_shapes=[])
+    detector.response = Response(Request({"url": "file:///tmp/image.png"}))
+    images = [np.full((50, 100, 3), 1, np.uint8),
+              np.full((20, 40, 3), 1, np.uint8)]
+    detector.process_images(images, [0.0, 1.0])
+
+    assert calls == [[(50, 100, 3), (20, 40, 3)]]
+    response = detector.response
+    assert [ann["t"] for ann in response.frame_anns] == [0.0]
+    regions = response.get_regions_from_tstamp(0.0)
+    boxes = {}
+    for region in regions:
+        xs = [pt["x"] for pt in region["contour"]]
+        ys = [pt["y"] for pt in region["contour"]]
+        boxes[region["props"][0]["value"]] = (
+            (min(xs), min(ys), max(xs), max(ys)),
+            region["props"][0],
+        )
+    assert sorted(boxes) == ["car", "cat"]
+    # normalized by the frame size, the cat box clamped to the frame
+    assert boxes["car"][0] == pytest.approx((0.1, 0.2, 0.5, 0.6))
+    assert boxes["car"][1]["confidence"] == pytest.approx(0.9)
+    assert boxes["car"][1]["fraction"] == pytest.approx(0.16)
+    assert boxes["cat"][0] == pytest.approx((0.0, 0.0, 1.0, 1.0))
+    assert boxes["cat"][1]["fraction"] == pytest.approx(1.0)
+    assert boxes["cat"][1]["confidence_min"] == 0.5
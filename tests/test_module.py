@@ -1,4 +1,10 @@
+import pytest
+
+from multivitamin.data.response.dtypes import Property
 from multivitamin.module import Module
+from multivitamin.module.utils import (compile_props_query,
+                                       convert_props_to_pandas_query,
+                                       pandas_query_matches_props)
 
 
 def test_prev_props_of_interest():
@@ -11,3 +17,62 @@ def test_prev_props_of_interest():
     cmod = ConcreteModule(server_name, version)
     pois = [{"property_type": "object", "value": "car"}]
     cmod.set_prev_props_of_interest(pois)
+
+
+PROPS = [
+    [Property(property_type="object", value="car", confidence=0.9)],
+    [Property(property_type="object", value="face", confidence=0.4)],
+    [Property(property_type="label", value="face", confidence=0.8)],
+    [Property(property_type="object", value="truck", confidence=0.3),
+     Property(property_type="label", value="car", confidence=0.6)],
+    [{"value": "car"}],
+    [{"property_type": "object"}],
+]
+
+POIS = [
+    [{"property_type": "object", "value": "car"}],
+    [{"value": "car"}, {"value": "face"}],
+    [{"property_type": "object", "value": "face"}, {"value": "car"}],
+    [{"property_type": "label"}],
+    [{"value": "bike"}],
+]
+
+
+def test_props_query_matches_pandas_query():
+    pd = pytest.importorskip("pandas")
+    for pois in POIS:
+        query = compile_props_query(pois)
+        bool_exp = convert_props_to_pandas_query(pois)
+        for props in PROPS[:4]:  # pandas fails on missing columns
+            expected = pandas_query_matches_props(bool_exp,
+                                                  pd.DataFrame(props))
+            assert query(props) == expected, (pois, props)
+
+
+def test_props_query_comparisons():
+    query = compile_props_query([
+        {"value": ["car", "truck"], "confidence": {">=": 0.5}},
+        {"value": {"in": ["face"]}, "property_type": {"!=": "label"}},
+    ])
+    assert [query(props) for props in PROPS] == [
+        True, True, False, True, False, False
+    ]
+    assert not query([{"value": "car", "confidence": "high"}])
+    assert compile_props_query([{"confidence": {"<": 0.5}}])(PROPS[3])
+    assert not compile_props_query([{"value": {"not in": ["car", "face"]}}])(
+        PROPS[4]
+    )
+    with pytest.raises(ValueError):
+        compile_props_query([{"confidence": {"~": 0.5}}])
+
+
+def test_set_prev_props_of_interest_compiles_query():
+    class ConcreteModule(Module):
+        def process(self, response):
+            super().process(response)
+
+    cmod = ConcreteModule("Dummy", "1.0.0")
+    cmod.set_prev_props_of_interest([{"value": "car"}])
+    assert cmod.prev_pois_bool_exp == '(value == "car")'
+    assert cmod.prev_pois_query(PROPS[0])
+    assert not cmod.prev_pois_query(PROPS[1])
@@ -0,0 +1,28 @@
+import numpy as np
+
+from multivitamin.module.utils import top_n_predictions
+
+
+def _reference_top_n(p, top_n, exclude_mask):
+    indices = [i for i in np.argsort(-p, kind="stable") if not exclude_mask[i]]
+    return indices[:top_n]
+
+
+def test_top_n_predictions():
+    rng = np.random.RandomState(0)
+    probs = rng.rand(32, 20).astype(np.float32)
+    exclude_mask = np.zeros(20, bool)
+    exclude_mask[[0, 3, 7]] = True
+    probs[:, 3] = 2.0  # excluded labels are skipped even when on top
+    for top_n in [1, 5, 17, 30]:
+        top = top_n_predictions(probs, top_n, exclude_mask)
+        assert top.shape == (32, min(top_n, 17))
+        for p, indices in zip(probs, top):
+            assert list(indices) == _reference_top_n(p, top_n, exclude_mask)
+
+
+def test_top_n_predictions_without_exclusions():
+    probs = np.array([[0.1, 0.7, 0.2], [0.5, 0.1, 0.4]])
+    assert top_n_predictions(probs, 2).tolist() == [[1, 2], [0, 2]]
+    # every label excluded: the mask is ignored
+    assert top_n_predictions(probs, 1, np.ones(3, bool)).tolist() == [[1], [0]]
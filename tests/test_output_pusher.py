@@ -0,0 +1,54 @@
+import time
+
+from multivitamin.apis import CommAPI, OutputPusher
+
+
+class RecordingComm(CommAPI):
+    def __init__(self, failures=0, delay=0.0):
+        self.failures = failures
+        self.delay = delay
+        self.pushed = []
+
+    def pull(self):
+        raise NotImplementedError()
+
+    def push(self, response):
+        time.sleep(self.delay)
+        if self.failures > 0:
+            self.failures -= 1
+            raise IOError("sink unavailable")
+        self.pushed.append(response)
+
+
+def test_pushes_in_order_to_every_comm():
+    fast, slow = RecordingComm(), RecordingComm(delay=0.01)
+    pusher = OutputPusher([fast, slow], queue_size=2)
+    for i in range(10):
+        pusher.push(i)
+    pusher.shutdown()
+    assert fast.pushed == list(range(10))
+    assert slow.pushed == list(range(10))
+
+
+def test_retries_with_backoff():
+    flaky = RecordingComm(failures=2)
+    pusher = OutputPusher(flaky, max_retries=3, backoff_base_sec=0.001)
+    pusher.push("response")
+    pusher.flush()
+    stats = pusher.stats()[0]
+    assert flaky.pushed == ["response"]
+    assert stats["retried"] == 2
+    assert stats["failed"] == 0
+    pusher.shutdown()
+
+
+def test_counts_failures_after_last_retry():
+    broken = RecordingComm(failures=100)
+    pusher = OutputPusher(broken, max_retries=1, backoff_base_sec=0.001)
+    pusher.push("a")
+    pusher.push("b")
+    pusher.shutdown()
+    stats = pusher.stats()[0]
+    assert stats["failed"] == 2
+    assert stats["pushed"] == 0
+    assert stats["queue_depth"] == 0
@@ -0,0 +1,130 @@
+import os
+import json
+
+from multivitamin.server import Server
+from multivitamin.apis import LocalAPI
+from multivitamin.module import PropertiesModule
+from multivitamin.data.response.dtypes import Property, VideoAnn
+
+from conftest import MeanModule
+
+
+class CountingModule(PropertiesModule):
+    def process_properties(self):
+        self.response.append_media_summary(
+            VideoAnn(props=[Property(server=self.name,
+                                     value=self.request.get("id"))])
+        )
+
+
+def _write_requests(folder, n):
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "requests.json"), "w") as wf:
+        for i in range(n):
+            wf.write(json.dumps({"url": f"file://{i}.jpg", "id": str(i)}))
+            wf.write("\n")
+
+
+def test_pipelined_server_processes_in_order(tmpdir):
+    pulling_folder = str(tmpdir.join("requests"))
+    pushing_folder = str(tmpdir.join("responses"))
+    _write_requests(pulling_folder, 5)
+
+    pushed = []
+
+    class RecordingAPI(LocalAPI):
+        def push(self, responses):
+            pushed.append(responses.request.get("id"))
+            return super().push(responses)
+
+    local_api = RecordingAPI(pulling_folder, pushing_folder)
+    server = Server(CountingModule("Counter", "1.0.0"), local_api,
+                    pipelined=True, pull_queue_size=1, push_queue_size=1)
+    server._start()
+    assert pushed == [str(i) for i in range(5)]
+
+
+def test_pipelined_server_survives_failed_batches(tmpdir):
+    pulling_folder = str(tmpdir.join("requests"))
+    pushing_folder = str(tmpdir.join("responses"))
+    _write_requests(pulling_folder, 5)
+
+    pushed = []
+
+    class RecordingAPI(LocalAPI):
+        def push(self, responses):
+            pushed.append(responses.request.get("id"))
+            return super().push(responses)
+
+    local_api = RecordingAPI(pulling_folder, pushing_folder)
+    server = Server(CountingModule("Counter", "1.0.0"), local_api,
+                    pipelined=True, pull_queue_size=1, push_queue_size=1)
+    process_batch = server._process_batch
+
+    def failing_process_batch(batch):
+        # e.g. a result cache failing to save
+        if batch[0][0].get("id") == "2":
+            raise RuntimeError("batch failed")
+        return process_batch(batch)
+
+    server._process_batch = failing_process_batch
+    server._start()
+    assert pushed == ["0", "1", "3", "4"]
+
+
+def test_pipelined_server_batches_requests(tmpdir):
+    import numpy as np
+    from PIL import Image
+
+    pulling_folder = str(tmpdir.join("requests"))
+    os.makedirs(pulling_folder)
+    with open(os.path.join(pulling_folder, "requests.json"), "w") as wf:
+        for i in range(4):
+            path = str(tmpdir.join(f"{i}.png"))
+            Image.fromarray(np.full((8, 8, 3), i, np.uint8)).save(path)
+            wf.write(json.dumps({"url": "file://" + path, "id": str(i)}))
+            wf.write("\n")
+
+    pushed = []
+
+    class RecordingAPI(LocalAPI):
+        def push(self, responses):
+            value = responses.frame_anns[0]["regions"][0]["props"][0]["value"]
+            pushed.append((responses.request.get("id"), value))
+
+    module = MeanModule("Mean", "1.0.0", batch_size=4)
+    local_api = RecordingAPI(pulling_folder, str(tmpdir.join("responses")))
+    server = Server(module, local_api, pipelined=True, pull_queue_size=4,
+                    request_batch_size=4, max_batch_wait_ms=500)
+    server._start()
+    assert pushed == [(str(i), str(i)) for i in range(4)]
+    assert sum(module.batch_lengths) == 4
+    assert max(module.batch_lengths) > 1
+
+
+def test_failed_batch_sets_error_code(tmpdir):
+    import numpy as np
+    from PIL import Image
+    from multivitamin.data import Request
+    from multivitamin.module import Codes
+
+    class FailingModule(MeanModule):
+        def process_batch(self, responses, frames_sources=None):
+            raise RuntimeError("out of GPU memory")
+
+    requests = []
+    for i in range(2):
+        path = str(tmpdir.join(f"{i}.png"))
+        Image.fromarray(np.full((8, 8, 3), i, np.uint8)).save(path)
+        requests.append(Request({"url": "file://" + path}))
+
+    server = Server([FailingModule("Failing", "1.0.0"),
+                     MeanModule("Mean", "1.0.0")],
+                    LocalAPI(str(tmpdir), str(tmpdir)))
+    processed = server._process_requests(requests)
+    assert [request for request, _ in processed] == requests
+    for _, response in processed:
+        assert [(fp["server"], fp["code"]) for fp in response.footprints] == [
+            ("Failing", Codes.ERROR_PROCESSING.name),
+            ("Mean", Codes.SUCCESS.name),
+        ]
@@ -0,0 +1,90 @@
+import threading
+
+import numpy as np
+import pytest
+
+from multivitamin.data import Request, Response
+from multivitamin.media.prefetching_frames_iterator import (
+    PrefetchingFramesIterator,
+)
+
+from conftest import MeanModule
+
+
+def _frames(n, produced=None):
+    for i in range(n):
+        if produced is not None:
+            produced.append(i)
+        yield np.full((4, 4, 3), i, np.uint8), float(i)
+
+
+def test_frames_are_yielded_in_order():
+    frames = list(PrefetchingFramesIterator(_frames(50), depth=4))
+    assert [t for _, t in frames] == [float(i) for i in range(50)]
+    assert [int(f[0, 0, 0]) for f, _ in frames] == list(range(50))
+
+
+def test_prefetch_is_bounded():
+    produced = []
+    frames_iterator = PrefetchingFramesIterator(_frames(50, produced),
+                                                depth=4)
+    next(frames_iterator)
+    frames_iterator._thread.join(timeout=0.2)
+    # consumed 1, buffered up to depth, 1 waiting for room
+    assert len(produced) <= 1 + 4 + 1
+    frames_iterator.close()
+    assert not frames_iterator._thread.is_alive()
+
+    produced = []
+    frames_iterator = PrefetchingFramesIterator(_frames(50, produced),
+                                                depth=40, max_bytes=48 * 2)
+    next(frames_iterator)
+    frames_iterator._thread.join(timeout=0.2)
+    assert frames_iterator.buffered_bytes <= 48 * 2
+    frames_iterator.close()
+
+
+def test_close_stops_iteration():
+    produced = []
+    frames_iterator = PrefetchingFramesIterator(_frames(50, produced))
+    frames_iterator.close()
+    # run in a thread so that a hang fails the test
+    frames = []
+    consumer = threading.Thread(target=lambda: frames.extend(frames_iterator),
+                                daemon=True)
+    consumer.start()
+    consumer.join(timeout=5)
+    assert not consumer.is_alive()
+    assert frames == [] and produced == []
+    assert frames_iterator._thread is None
+
+    frames_iterator = PrefetchingFramesIterator(_frames(50), depth=4)
+    next(frames_iterator)
+    frames_iterator.close()
+    with pytest.raises(StopIteration):
+        next(frames_iterator)
+
+
+def test_errors_are_raised_after_decoded_frames():
+    def failing():
+        yield from _frames(3)
+        raise ValueError("corrupt frame")
+
+    frames_iterator = PrefetchingFramesIterator(failing(), depth=2)
+    assert [t for _, t in (next(frames_iterator) for _ in range(3))] == [
+        0.0, 1.0, 2.0
+    ]
+    with pytest.raises(ValueError):
+        next(frames_iterator)
+
+
+def test_imagesmodule_prefetches(video_url):
+    request = Request({"url": video_url, "sample_rate": 5.0})
+
+    expected = MeanModule("Mean", "1.0.0").process(Response(request))
+    module = MeanModule("Mean", "1.0.0", batch_size=2, prefetch_depth=4)
+    response = module.process(Response(request))
+    assert isinstance(module.frames_iterator, PrefetchingFramesIterator)
+    assert response.footprints[-1]["tstamps"] == \
+        expected.footprints[-1]["tstamps"]
+    assert not module.frames_iterator._thread.is_alive()
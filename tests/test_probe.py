@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from multivitamin.media import MediaRetriever
+from multivitamin.media.probe import probe, ProbeCache
+from multivitamin.utils.result_cache import SQLiteResultStore
+
+
+def test_probe_local_media(media_dir):
+    cache = ProbeCache()
+    image = probe(os.path.join(media_dir, "image.jpg"), cache)
+    assert (image.width, image.height, image.num_frames) == (64, 48, 1)
+    assert image.content_type == "image/jpeg"
+
+    video = probe("file://" + os.path.join(media_dir, "video.mp4"), cache)
+    assert (video.width, video.height, video.num_frames) == (64, 48, 30)
+    assert video.fps == 10
+    assert video.duration == 3
+
+    assert probe(os.path.join(media_dir, "missing.jpg"), cache) is None
+
+
+def test_local_file_change_is_probed_again(media_dir):
+    cache = ProbeCache()
+    path = os.path.join(media_dir, "image.jpg")
+    assert probe(path, cache).width == 64
+    Image.fromarray(np.zeros((10, 20, 3), np.uint8)).save(path)
+    os.utime(path, ns=(1, 1))
+    assert probe(path, cache).width == 20
+
+
+def test_remote_media_is_probed_once(http_server, tmpdir):
+    base_url, methods = http_server
+    store = SQLiteResultStore(str(tmpdir.join("probe.db")))
+    cache = ProbeCache(store)
+    info = probe(base_url + "/image.jpg", cache)
+    assert (info.width, info.height) == (64, 48)
+    assert info.etag is not None
+    assert methods == ["GET"]
+
+    assert probe(base_url + "/image.jpg", cache) is info
+    assert methods == ["GET"]
+
+    # a new process reads the disk cache
+    info = probe(base_url + "/image.jpg", ProbeCache(store))
+    assert (info.width, info.height) == (64, 48)
+    assert methods == ["GET"]
+
+    # expired entries are revalidated with a HEAD
+    expired = ProbeCache(store, ttl=0)
+    assert probe(base_url + "/image.jpg", expired).width == 64
+    assert methods == ["GET", "HEAD"]
+
+    assert probe(base_url + "/missing.jpg", cache) is None
+
+
+def test_media_retriever_does_not_decode_to_get_shape(media_dir,
+                                                      monkeypatch):
+    path = os.path.join(media_dir, "video.mp4")
+    monkeypatch.setattr(MediaRetriever, "_get_video_frame_shape",
+                        lambda self: pytest.fail("decoded a frame"))
+    media = MediaRetriever("file://" + path)
+    assert media.get_w_h() == (64, 48)
+    assert media.info.num_frames == 30
@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("av")
+
+from multivitamin.data import Request, Response
+from multivitamin.media import get_media_retriever
+from multivitamin.media.pyav_media_retriever import PyAVMediaRetriever
+from multivitamin.apis import LocalAPI
+from multivitamin.server import Server
+from multivitamin.utils import sharding
+
+from conftest import MeanModule, write_video
+
+
+@pytest.fixture(scope="module")
+def video_url(tmpdir_factory):
+    path = str(tmpdir_factory.mktemp("video").join("video.mp4"))
+    frames = (np.dstack([np.full((48, 64), (i * 37) % 256, np.uint8),
+                         np.full((48, 64), (i * 11) % 256, np.uint8),
+                         np.full((48, 64), i, np.uint8)])
+              for i in range(150))
+    return "file://" + write_video(path, frames, fps=30)
+
+
+def _decode_all(url):
+    cap = cv2.VideoCapture(url.replace("file://", ""))
+    frames = []
+    ret, frame = cap.read()
+    while ret:
+        frames.append(frame.astype(np.int16))
+        ret, frame = cap.read()
+    return frames
+
+
+def test_get_media_retriever_selects_backend(video_url):
+    media = get_media_retriever(video_url, backend="pyav")
+    assert isinstance(media, PyAVMediaRetriever)
+    with pytest.raises(ValueError):
+        get_media_retriever(video_url, backend="unknown")
+
+
+def test_attributes_match_opencv(video_url):
+    pyav = get_media_retriever(video_url, backend="pyav")
+    opencv = get_media_retriever(video_url, backend="opencv")
+    assert pyav.fps == opencv.fps
+    assert pyav.total_frames == opencv.total_frames
+    assert pyav.get_w_h() == opencv.get_w_h()
+
+
+@pytest.mark.parametrize("sample_rate", [0.5, 2.0, 30.0])
+def test_frames_are_sampled_by_pts(video_url, sample_rate):
+    media = get_media_retriever(video_url, backend="pyav", skip_nonref=False)
+    frames = list(media.get_frames_iterator(sample_rate))
+    tstamps = [tstamp for _, tstamp in frames]
+    period = max(1.0 / sample_rate, 1.0 / 30)
+    assert tstamps[0] == 0.0
+    assert all(b - a >= period - 0.001 for a, b in zip(tstamps, tstamps[1:]))
+    all_frames = _decode_all(video_url)
+    for frame, tstamp in frames:
+        assert frame.shape == (48, 64, 3)
+        diffs = [np.abs(f - frame).mean() for f in all_frames]
+        assert int(np.argmin(diffs)) == round(tstamp * 30)
+
+
+def test_time_range_and_buffers(video_url):
+    media = get_media_retriever(video_url, backend="pyav", num_buffers=2)
+    frames = list(media.get_frames_iterator(1.0, start_tstamp=1.0,
+                                            end_tstamp=3.0))
+    assert [tstamp for _, tstamp in frames] == [1.0, 2.0, 3.0]
+    assert frames[0][0] is frames[2][0]
+
+
+def test_modules_decode_with_media_backend(video_url, tmpdir):
+    module = MeanModule("Mean", "1.0.0", media_backend="pyav")
+    response = module.process(Response(Request({"url": video_url,
+                                                "sample_rate": 1.0})))
+    assert isinstance(module.media, PyAVMediaRetriever)
+    assert len(response.frame_anns) == 5
+
+    # shared frames are decoded with the backend of the modules by default
+    modules = [MeanModule("Mean", "1.0.0", media_backend="pyav"),
+               MeanModule("Mean2", "1.0.0", media_backend="pyav")]
+    server = Server(modules, LocalAPI(str(tmpdir), str(tmpdir)))
+    source = server._create_frames_source(Request({"url": video_url}))
+    assert isinstance(source.media, PyAVMediaRetriever)
+    server = Server(modules, LocalAPI(str(tmpdir), str(tmpdir)),
+                    media_backend="opencv")
+    source = server._create_frames_source(Request({"url": video_url}))
+    assert not isinstance(source.media, PyAVMediaRetriever)
+
+    with pytest.raises(ValueError):
+        MeanModule("Mean", "1.0.0", media_backend="unknown")
+
+
+def test_sharded_processor_probes_with_media_backend(video_url, monkeypatch):
+    backends = []
+
+    def media_retriever(url, backend="opencv", **kwargs):
+        backends.append(backend)
+        return get_media_retriever(url, backend, **kwargs)
+
+    monkeypatch.setattr(sharding, "get_media_retriever", media_retriever)
+    processor = sharding.ShardedProcessor(
+        lambda: [MeanModule("Mean", "1.0.0")], num_shards=1,
+        parallelization="process", media_backend="pyav",
+    )
+    monkeypatch.setattr(processor, "_map", lambda requests: [
+        Response(request).to_dict() for request in requests
+    ])
+    try:
+        processor.process(Request({"url": video_url}))
+    finally:
+        processor.shutdown()
+    assert backends == ["pyav"]
@@ -0,0 +1,16 @@
+from multivitamin.data import Request, Response
+from multivitamin.data.response.dtypes import Region, Property
+
+
+def test_append_regions_extends_existing_frame_ann():
+    response = Response(Request({"url": "file:///tmp/image.png"}))
+    response.append_region(t=1.0, region=Region(props=[Property(value="a")]))
+    response.append_regions(t=1.0, regions=[Region(props=[Property(value="b")]),
+                                            Region(props=[Property(value="c")])])
+    response.append_regions(t=2.0, regions=[Region(props=[Property(value="d")])])
+
+    assert len(response.frame_anns) == 2
+    values = [region["props"][0]["value"]
+              for region in response.get_regions_from_tstamp(1.0)]
+    assert values == ["a", "b", "c"]
+    assert len(response.get_regions_from_tstamp(2.0)) == 1
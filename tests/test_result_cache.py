@@ -0,0 +1,130 @@
+import os
+import json
+import shutil
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from multivitamin.server import Server
+from multivitamin.apis import LocalAPI
+from multivitamin.data import Request, Response
+from multivitamin.utils.single_flight import SingleFlight
+from multivitamin.utils.result_cache import (
+    ResultCache,
+    DiskResultStore,
+    SQLiteResultStore,
+    CACHED_SERVER_TRACK,
+)
+
+from conftest import MeanModule, first_value
+
+
+@pytest.fixture(params=["disk", "sqlite"])
+def store_factory(request, tmpdir):
+    def factory(max_bytes):
+        if request.param == "disk":
+            return DiskResultStore(str(tmpdir.join("cache")), max_bytes)
+        return SQLiteResultStore(str(tmpdir.join("cache.db")), max_bytes)
+    return factory
+
+
+def test_store_evicts_least_recently_used(store_factory):
+    store = store_factory(max_bytes=20)
+    store.put("a", "x" * 8)
+    store.put("b", "y" * 8)
+    assert store.get("a") == "x" * 8
+    store.put("c", "z" * 8)
+    assert store.get("b") is None
+    assert store.get("a") == "x" * 8
+    assert store.get("c") == "z" * 8
+
+
+def test_single_flight_runs_once():
+    single_flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return "done"
+
+    leader = threading.Thread(
+        target=lambda: results.append(single_flight.do("k", slow))
+    )
+    leader.start()
+    started.wait()
+    follower = threading.Thread(
+        target=lambda: results.append(single_flight.do("k", slow))
+    )
+    follower.start()
+    release.set()
+    leader.join()
+    follower.join()
+    assert calls == [1]
+    assert results == ["done", "done"]
+
+
+@pytest.fixture
+def image_path(tmpdir):
+    path = str(tmpdir.join("a.png"))
+    Image.fromarray(np.full((8, 8, 3), 42, np.uint8)).save(path)
+    return path
+
+
+def test_cache_hits_identical_media(tmpdir, image_path):
+    copy_path = str(tmpdir.join("b.png"))
+    shutil.copy(image_path, copy_path)
+    cache = ResultCache(DiskResultStore(str(tmpdir.join("cache"))))
+    module = MeanModule("Mean", "1.0.0")
+
+    def process(request):
+        response = Response(request)
+        return cache.process(request, response, [module], module.process)
+
+    first = process(Request({"url": "file://" + image_path}))
+    second = process(Request({"url": "file://" + copy_path}))
+
+    assert module.batch_lengths == [1]
+    assert first_value(second) == first_value(first) == "42"
+    assert second.url == "file://" + copy_path
+    assert second.footprints[-1]["server_track"] == CACHED_SERVER_TRACK
+    assert first.footprints[-1]["server_track"] != CACHED_SERVER_TRACK
+
+
+def test_cache_misses_on_new_module_version(tmpdir, image_path):
+    cache = ResultCache(DiskResultStore(str(tmpdir.join("cache"))))
+    request = Request({"url": "file://" + image_path})
+    v1 = MeanModule("Mean", "1.0.0")
+    v2 = MeanModule("Mean", "2.0.0")
+    assert (cache.make_key(request, Response(request), [v1])
+            != cache.make_key(request, Response(request), [v2]))
+
+
+def test_server_dedupes_batch(tmpdir, image_path):
+    pulling_folder = str(tmpdir.join("requests"))
+    os.makedirs(pulling_folder)
+    with open(os.path.join(pulling_folder, "requests.json"), "w") as wf:
+        for i in range(3):
+            wf.write(json.dumps({"url": "file://" + image_path, "id": str(i)}))
+            wf.write("\n")
+
+    pushed = []
+
+    class RecordingAPI(LocalAPI):
+        def push(self, responses):
+            pushed.append(responses.footprints[-1]["server_track"])
+
+    module = MeanModule("Mean", "1.0.0", batch_size=4)
+    cache = ResultCache(SQLiteResultStore(str(tmpdir.join("cache.db"))))
+    local_api = RecordingAPI(pulling_folder, str(tmpdir.join("responses")))
+    server = Server(module, local_api, pipelined=True, pull_queue_size=3,
+                    request_batch_size=3, max_batch_wait_ms=500,
+                    result_cache=cache)
+    server._start()
+    assert module.batch_lengths == [1]
+    assert len(pushed) == 3
+    assert pushed.count(CACHED_SERVER_TRACK) == 2
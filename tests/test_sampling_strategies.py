@@ -0,0 +1,135 @@
+import sys
+from fractions import Fraction
+
+import cv2
+import numpy as np
+import pytest
+
+from multivitamin.media.frame_index import FrameIndex
+from multivitamin.media.opencv_media_retriever import (
+    OpenCVFramesIterator,
+    GRAB_STRATEGY,
+    COUNT_STRATEGY,
+    SEEK_STRATEGY,
+)
+
+from conftest import write_video
+
+
+@pytest.fixture(scope="module")
+def video_path(tmpdir_factory):
+    path = str(tmpdir_factory.mktemp("video").join("video.mp4"))
+    return write_video(path, (_frame(i) for i in range(300)), fps=30)
+
+
+def _frame(i):
+    return np.dstack([np.full((48, 64), (i * 37) % 256, np.uint8),
+                      np.full((48, 64), (i * 11) % 256, np.uint8),
+                      np.full((48, 64), i // 2, np.uint8)])
+
+
+@pytest.fixture(scope="module")
+def vfr_video_path(tmpdir_factory):
+    """300 frames, 30 fps except frames 100 to 200 at 10 fps"""
+    av = pytest.importorskip("av")
+    path = str(tmpdir_factory.mktemp("video").join("vfr.mp4"))
+    time_base = Fraction(1, 1000)
+    with av.open(path, "w") as container:
+        stream = container.add_stream("mpeg4", rate=30)
+        stream.width, stream.height = 64, 48
+        stream.pix_fmt = "yuv420p"
+        stream.time_base = stream.codec_context.time_base = time_base
+        pts = 0
+        for i in range(300):
+            frame = av.VideoFrame.from_ndarray(_frame(i), format="bgr24")
+            frame.pts, frame.time_base = pts, time_base
+            pts += 100 if 100 <= i < 200 else 33
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return path
+
+
+def _sample(path, sample_rate, strategy, start_tstamp=0.0,
+            end_tstamp=sys.maxsize, frame_index=None):
+    cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG)
+    frames_iterator = OpenCVFramesIterator(
+        cap, cap.get(cv2.CAP_PROP_FPS), sample_rate, start_tstamp,
+        end_tstamp, strategy=strategy, frame_index=frame_index
+    )
+    return list(frames_iterator), frames_iterator.strategy
+
+
+@pytest.mark.parametrize("sample_rate", [0.2, 1.0, 7.0, 30.0, 100.0])
+@pytest.mark.parametrize("time_range", [(0.0, sys.maxsize), (2.0, 6.0)])
+def test_strategies_return_identical_frames(video_path, sample_rate,
+                                            time_range):
+    expected, _ = _sample(video_path, sample_rate, GRAB_STRATEGY, *time_range)
+    for strategy in [COUNT_STRATEGY, SEEK_STRATEGY, None]:
+        frames, _ = _sample(video_path, sample_rate, strategy, *time_range)
+        assert [t for _, t in frames] == [t for _, t in expected]
+        for (frame, _), (expected_frame, _) in zip(frames, expected):
+            assert np.array_equal(frame, expected_frame)
+
+
+def test_strategy_is_picked_from_sample_rate(video_path):
+    frame_index = FrameIndex([i / 30.0 for i in range(300)])
+    assert _sample(video_path, 0.5, None,
+                   frame_index=frame_index)[1] == SEEK_STRATEGY
+    assert _sample(video_path, 5.0, None,
+                   frame_index=frame_index)[1] == COUNT_STRATEGY
+
+
+def test_grab_strategy_if_index_shows_variable_frame_rate(video_path):
+    # strategies are kept to the end on constant frame rate videos
+    assert _sample(video_path, 0.5, None)[1] == SEEK_STRATEGY
+    assert _sample(video_path, 5.0, None)[1] == COUNT_STRATEGY
+    vfr_index = FrameIndex([i / 30.0 + (i > 100) * 0.5 for i in range(300)])
+    assert _sample(video_path, 0.5, None,
+                   frame_index=vfr_index)[1] == GRAB_STRATEGY
+
+
+@pytest.mark.parametrize("sample_rate", [0.5, 2.0, 5.0, 30.0])
+@pytest.mark.parametrize("strategy", [COUNT_STRATEGY, SEEK_STRATEGY, None])
+def test_variable_frame_rate_falls_back_to_grab(vfr_video_path, sample_rate,
+                                                strategy):
+    expected, _ = _sample(vfr_video_path, sample_rate, GRAB_STRATEGY)
+    frames, picked = _sample(vfr_video_path, sample_rate, strategy)
+    assert picked == GRAB_STRATEGY
+    assert [t for _, t in frames] == [t for _, t in expected]
+    for (frame, _), (expected_frame, _) in zip(frames, expected):
+        assert np.array_equal(frame, expected_frame)
+
+
+def test_retriever_passes_frame_index(video_path):
+    pytest.importorskip("av")
+    from multivitamin.media import OpenCVMediaRetriever
+
+    media = OpenCVMediaRetriever("file://" + video_path)
+    assert media.indexed
+    assert media.get_frames_iterator(0.5).strategy == SEEK_STRATEGY
+
+
+@pytest.mark.parametrize("start_tstamp", [0.5, 1.0, 2.0, 3.3])
+def test_start_tstamp_matches_full_pass(video_path, start_tstamp):
+    expected, _ = _sample(video_path, 100.0, GRAB_STRATEGY)
+    expected = [(f, t) for f, t in expected if t >= start_tstamp - 1e-6]
+    frames, _ = _sample(video_path, 100.0, GRAB_STRATEGY, start_tstamp)
+    assert [t for _, t in frames] == [t for _, t in expected]
+    for (frame, _), (expected_frame, _) in zip(frames, expected):
+        assert np.array_equal(frame, expected_frame)
+
+
+@pytest.mark.parametrize("start_tstamp", [1.0, 5.0, 8.5, 14.0])
+def test_start_tstamp_on_variable_frame_rate(vfr_video_path, start_tstamp):
+    cap = cv2.VideoCapture(vfr_video_path, cv2.CAP_FFMPEG)
+    labels = []
+    while True:
+        label = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if not cap.grab():
+            break
+        labels.append(label)
+    frames, _ = _sample(vfr_video_path, 100.0, GRAB_STRATEGY, start_tstamp)
+    first = min(label for label in labels if label >= start_tstamp - 1e-3)
+    assert frames[0][1] == pytest.approx(first, abs=1e-3)
@@ -0,0 +1,101 @@
+import pytest
+
+from multivitamin.data import Request, Response
+from multivitamin.module import Codes
+from multivitamin.utils import sharding
+from multivitamin.utils.sharding import (
+    ShardedProcessor,
+    compute_shard_boundaries,
+    split_request,
+)
+
+from conftest import MeanModule, gray_frames, write_video
+
+
+def mean_modules():
+    return [MeanModule("Mean", "1.0.0")]
+
+
+@pytest.fixture
+def video_url(tmpdir):
+    return "file://" + write_video(str(tmpdir.join("video.mp4")),
+                                   gray_frames(60, step=4))
+
+
+def test_boundaries_are_aligned_and_cover_media():
+    boundaries = compute_shard_boundaries(100.0, 3, 0.5, min_shard_sec=10)
+    assert boundaries[0][0] == 0.0
+    assert boundaries[-1][1] is None
+    for (_, end), (start, _) in zip(boundaries, boundaries[1:]):
+        assert end == start
+        assert start % 0.5 == 0.0
+
+    keyframes = [0.0, 31.0, 70.0]
+    boundaries = compute_shard_boundaries(100.0, 3, 0.5, keyframes=keyframes,
+                                          min_shard_sec=10)
+    assert [start for start, _ in boundaries] == keyframes
+
+    # shards start on the sampling grid, at or after the keyframes
+    boundaries = compute_shard_boundaries(100.0, 3, 0.5,
+                                          keyframes=[0.0, 30.7, 70.2],
+                                          min_shard_sec=10)
+    assert [start for start, _ in boundaries] == [0.0, 31.0, 70.5]
+
+
+def test_short_media_is_not_split():
+    assert compute_shard_boundaries(5.0, 4, 1.0, min_shard_sec=10) == [
+        (0.0, None)
+    ]
+
+
+def test_split_request_sets_time_ranges():
+    request = Request({"url": "file://a.mp4", "end_tstamp": 9.0})
+    shards = split_request(request, [(0.0, 3.0), (3.0, None)])
+    assert [(r.start_tstamp, r.end_tstamp) for r in shards[:1]] == [(0.0, 3.0)]
+    assert shards[1].get("end_tstamp") is None
+
+
+def test_merged_footprints_keep_tracked_tstamps():
+    requests = split_request(Request({"url": "file://a.mp4"}),
+                             [(0.0, 2.0), (2.0, None)])
+    footprints = [
+        {"tstamps": [0.0, 1.0, 2.0], "skipped_tstamps": [1.0],
+         "tracked_tstamps": [2.0], "date": "1", "code": "SUCCESS"},
+        {"tstamps": [2.0, 3.0, 4.0], "skipped_tstamps": [],
+         "tracked_tstamps": [3.0], "date": "2", "code": "SUCCESS"},
+    ]
+    merged = sharding._merge_footprints(footprints, requests)
+    assert merged["tstamps"] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert merged["skipped_tstamps"] == [1.0]
+    assert merged["tracked_tstamps"] == [3.0]
+    assert merged["num_images_processed"] == 3
+
+
+def test_sharded_matches_single_pass(video_url, monkeypatch):
+    pytest.importorskip("av")  # to index the keyframes
+    request = Request({"url": video_url, "sample_rate": 2.0})
+    single = mean_modules()[0].process(Response(request))
+
+    keyframes = []
+
+    def compute_boundaries(*args, **kwargs):
+        keyframes.append(kwargs["keyframes"])
+        return compute_shard_boundaries(*args, **kwargs)
+
+    monkeypatch.setattr(sharding, "compute_shard_boundaries",
+                        compute_boundaries)
+
+    processor = ShardedProcessor(mean_modules, num_shards=3, min_shard_sec=1.0)
+    try:
+        sharded = processor.process(request)
+    finally:
+        processor.shutdown()
+
+    # aligned on the keyframes of the frame index by default
+    assert keyframes[0] and keyframes[0][0] == 0.0
+    assert len(sharded.footprints) == 1
+    footprint = sharded.footprints[0]
+    assert footprint["code"] == Codes.SUCCESS.name
+    assert footprint["tstamps"] == single.footprints[0]["tstamps"]
+    assert ([ann["t"] for ann in sharded.frame_anns] ==
+            [ann["t"] for ann in single.frame_anns])
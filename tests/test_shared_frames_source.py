@@ -0,0 +1,29 @@
+from multivitamin.media import SharedFramesSource
+
+
+def test_frames_are_decoded_once(video_url):
+    source = SharedFramesSource(video_url, sample_rate=2.0)
+    first = list(source.get_frames_iterator())
+    assert len(first) > 0
+
+    source._media = None  # a replay must not touch the media again
+    second = list(source.get_frames_iterator())
+    assert [t for _, t in first] == [t for _, t in second]
+    for (f0, _), (f1, _) in zip(first, second):
+        assert f0 is f1
+
+
+def test_overflow_falls_back_to_decoding(video_url):
+    source = SharedFramesSource(video_url, sample_rate=2.0,
+                                max_cached_bytes=1)
+    first = [t for _, t in source.get_frames_iterator()]
+    assert source.cached_bytes == 0
+    second = [t for _, t in source.get_frames_iterator()]
+    assert first == second
+
+
+def test_partial_consumption_is_not_replayed(video_url):
+    source = SharedFramesSource(video_url, sample_rate=2.0)
+    for _ in source.get_frames_iterator():
+        break
+    assert len(list(source.get_frames_iterator())) > 1
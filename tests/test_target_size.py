@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from multivitamin.data import Request, Response
+from multivitamin.data.response.dtypes import Region, Property
+from multivitamin.media import get_media_retriever, SharedFramesSource
+from multivitamin.module import ImagesModule
+
+TARGET_SIZE = (32, 24)
+
+
+class ShapeModule(ImagesModule):
+    """Labels each frame with its shape"""
+
+    def process_images(self, images, tstamps, prev_regions=None):
+        for image, tstamp in zip(images, tstamps):
+            prop = Property(server=self.name, value=str(image.shape))
+            self.response.append_region(t=tstamp, region=Region(props=[prop]))
+
+
+@pytest.fixture
+def image_url(tmpdir):
+    path = str(tmpdir.join("image.jpg"))
+    Image.fromarray(np.full((480, 640, 3), 100, np.uint8)).save(path)
+    return "file://" + path
+
+
+@pytest.mark.parametrize("backend", ["opencv", "pyav"])
+def test_video_frames_are_resized(video_url, backend):
+    if backend == "pyav":
+        pytest.importorskip("av")
+    media = get_media_retriever(video_url, backend=backend)
+    full = list(media.get_frames_iterator(sample_rate=2.0))
+    media = get_media_retriever(video_url, backend=backend)
+    resized = list(media.get_frames_iterator(sample_rate=2.0,
+                                             target_size=TARGET_SIZE))
+    assert [t for _, t in full] == [t for _, t in resized]
+    for (f0, _), (f1, _) in zip(full, resized):
+        assert f1.shape == (24, 32, 3)
+        assert abs(f0.mean() - f1.mean()) < 2
+
+    frame = media.get_frame(1.0, target_size=TARGET_SIZE)
+    assert frame.shape == (24, 32, 3)
+
+
+def test_image_is_resized(image_url):
+    media = get_media_retriever(image_url)
+    assert media.get_image().shape == (480, 640, 3)
+    image = media.get_image(target_size=TARGET_SIZE)
+    assert image.shape == (24, 32, 3)
+    assert abs(int(image.mean()) - 100) <= 1
+
+
+def test_unknown_interpolation_raises(image_url):
+    with pytest.raises(ValueError):
+        get_media_retriever(image_url).get_frames_iterator(
+            target_size=TARGET_SIZE, interpolation="lanczos")
+
+
+def test_module_decodes_at_target_size(video_url):
+    module = ShapeModule("Shape", "1.0.0", target_size=TARGET_SIZE)
+    response = module.process(Response(Request({"url": video_url,
+                                                "sample_rate": 2.0})))
+    values = set(ann["regions"][0]["props"][0]["value"]
+                 for ann in response.frame_anns)
+    assert values == {str((24, 32, 3))}
+    assert (response.width, response.height) == (64, 48)
+
+
+def test_shared_source_records_each_size(video_url):
+    source = SharedFramesSource(video_url, sample_rate=2.0)
+    full = list(source.get_frames_iterator())
+    small = list(source.get_frames_iterator(target_size=TARGET_SIZE))
+    assert full[0][0].shape == (48, 64, 3)
+    assert small[0][0].shape == (24, 32, 3)
+
+    source._media = None  # both sizes are replayed
+    assert list(source.get_frames_iterator())[0][0] is full[0][0]
+    replayed = list(source.get_frames_iterator(target_size=TARGET_SIZE))
+    assert replayed[0][0] is small[0][0]
+    assert source.cached_bytes == sum(f.nbytes for f, _ in full + small)
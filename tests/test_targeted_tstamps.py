@@ -0,0 +1,85 @@
+import pytest
+
+from multivitamin.data import Request, Response
+from multivitamin.data.response.dtypes import Region, Property
+from multivitamin.media import OpenCVMediaRetriever
+from multivitamin.module import ImagesModule
+from multivitamin.apis import LocalAPI
+from multivitamin.server import Server
+
+from conftest import gray_frames, write_video
+
+
+class FrameIdModule(ImagesModule):
+    """Labels each frame with the id drawn in it, "hit" every 4th frame"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_frames = 0
+
+    def process_images(self, images, tstamps, prev_regions=None):
+        for image, tstamp in zip(images, tstamps):
+            self.num_frames += 1
+            frame_id = int(round(image[0, 0, 0] / 2))
+            props = [Property(server=self.name, value=str(frame_id))]
+            if frame_id % 4 == 0 and self.prev_pois is None:
+                props.append(Property(server=self.name, value="hit"))
+            self.response.append_region(t=tstamp, region=Region(props=props))
+
+
+@pytest.fixture
+def video_url(tmpdir):
+    return "file://" + write_video(str(tmpdir.join("video.mp4")),
+                                   gray_frames(100, step=2))
+
+
+def _frame_ids(response, server):
+    ids = {}
+    for image_ann in response.frame_anns:
+        for region in image_ann["regions"]:
+            for prop in region["props"]:
+                if prop["server"] == server and prop["value"] != "hit":
+                    ids[image_ann["t"]] = prop["value"]
+    return ids
+
+
+def test_only_frames_of_interest_are_decoded(video_url, monkeypatch):
+    detector = FrameIdModule("Detector", "1.0.0")
+    response = detector.process(Response(Request({"url": video_url,
+                                                   "sample_rate": 10.0})))
+    detected = _frame_ids(response, "Detector")
+    hits = [t for t, frame_id in detected.items() if int(frame_id) % 4 == 0]
+    assert len(detected) > 90
+
+    monkeypatch.setattr(OpenCVMediaRetriever, "_get_frames_iterator_class",
+                        lambda self: pytest.fail("iterated every frame"))
+
+    classifier = FrameIdModule("Classifier", "1.0.0")
+    classifier.set_prev_props_of_interest([{"value": "hit"}])
+    response = classifier.process(response)
+    classified = _frame_ids(response, "Classifier")
+
+    assert classifier.num_frames == len(hits)
+    assert response.footprints[-1]["tstamps"] == sorted(hits)
+    # the classifier sees the frames the detector saw at these tstamps
+    assert classified == {t: detected[t] for t in hits}
+
+
+@pytest.mark.parametrize("max_shared_frames_bytes", [1024 ** 3, 0])
+def test_chained_modules_share_frames_of_interest(video_url, tmpdir,
+                                                  max_shared_frames_bytes):
+    detector = FrameIdModule("Detector", "1.0.0")
+    classifier = FrameIdModule("Classifier", "1.0.0")
+    classifier.set_prev_props_of_interest([{"value": "hit"}])
+    server = Server([detector, classifier],
+                    LocalAPI(str(tmpdir), str(tmpdir)),
+                    max_shared_frames_bytes=max_shared_frames_bytes)
+    response = server._process_request(Request({"url": video_url,
+                                                 "sample_rate": 10.0}))
+
+    detected = _frame_ids(response, "Detector")
+    hits = [t for t, frame_id in detected.items() if int(frame_id) % 4 == 0]
+    assert len(detected) > 90
+    assert classifier.num_frames == len(hits)
+    assert response.footprints[-1]["tstamps"] == sorted(hits)
+    assert _frame_ids(response, "Classifier") == {t: detected[t] for t in hits}
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+if not hasattr(tf, "Session"):
+    pytest.skip("TFDetector requires the TensorFlow 1.x API",
+                allow_module_level=True)
+
+from multivitamin.data import Request, Response  # noqa: E402
+from multivitamin.applications.images.detectors.tf_detector import (  # noqa: E402
+    TFDetector,
+)
+
+
+@pytest.fixture
+def net_data_dir(tmpdir):
+    """Fake detection graph: a "car" box scored by the mean pixel value of
+    the image, and a low confidence "dog" box
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        image = tf.placeholder(tf.uint8, [None, None, None, 3],
+                               name="image_tensor")
+        n = tf.shape(image)[0]
+        mean = tf.reduce_mean(tf.cast(image, tf.float32), axis=[1, 2, 3])
+        tf.tile(tf.constant([[[0.1, 0.2, 0.5, 0.6], [0.0, 0.0, 1.0, 1.0]]]),
+                [n, 1, 1], name="detection_boxes")
+        tf.stack([mean / 255.0, tf.fill([n], 0.1)], axis=1,
+                 name="detection_scores")
+        tf.tile(tf.constant([[1.0, 2.0]]), [n, 1], name="detection_classes")
+        tf.fill([n], 2.0, name="num_detections")
+    tmpdir.join("frozen_inference_graph.pb").write_binary(
+        graph.as_graph_def().SerializeToString()
+    )
+    tmpdir.join("idmap.txt").write("1\tcar\n2\tdog\nbg\tbackground\n")
+    return str(tmpdir)
+
+
+def test_tf_detector_on_cpu(net_data_dir):
+    detector = TFDetector("TFDetector", "1.0.0", net_data_dir, use_gpu=False,
+                          confidence_min=0.5, batch_size=4)
+    response = Response(Request({"url": "file:///tmp/image.png"}))
+    detector.response = response
+    images = [np.full((48, 64, 3), 200, np.uint8),
+              np.full((32, 32, 3), 220, np.uint8),
+              np.full((48, 64, 3), 20, np.uint8),
+              np.full((32, 32, 3), 255, np.uint8)]
+    detector.process_images(images, [0.0, 1.0, 2.0, 3.0])
+
+    assert sorted(ann["t"] for ann in response.frame_anns) == [0.0, 1.0, 3.0]
+    for t, value in [(0.0, 200), (1.0, 220), (3.0, 255)]:
+        regions = response.get_regions_from_tstamp(t)
+        assert len(regions) == 1
+        prop = regions[0]["props"][0]
+        assert prop["value"] == "car"
+        assert prop["confidence"] == pytest.approx(value / 255.0)
+        assert prop["confidence_min"] == 0.5
+        assert prop["fraction"] == 0.0  # not set, like before batching
+        xs = [pt["x"] for pt in regions[0]["contour"]]
+        ys = [pt["y"] for pt in regions[0]["contour"]]
+        assert (min(xs), min(ys), max(xs), max(ys)) == pytest.approx(
+            (0.2, 0.1, 0.6, 0.5)
+        )
@@ -0,0 +1,154 @@
+import cv2
+import numpy as np
+import pytest
+
+from multivitamin.data import Request, Response
+from multivitamin.data.response.dtypes import (create_bbox_contour_from_points,
+                                               Region,
+                                               Property)
+from multivitamin.module import ImagesModule
+from multivitamin.module.tracking import (box_of_contour,
+                                          estimate_box_shift,
+                                          iou,
+                                          TRACKED_SERVER_TRACK)
+
+from conftest import write_video
+
+W, H = 160, 120
+SIZE = 24
+NUM_FRAMES = 30
+REQUEST = {"sample_rate": 10.0}
+
+
+class SquareDetector(ImagesModule):
+    """Detects the bright square of the test videos"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.num_detected = 0
+
+    def process_images(self, images, tstamps, prev_regions=None):
+        for image, tstamp in zip(images, tstamps):
+            self.num_detected += 1
+            ys, xs = np.nonzero(image[:, :, 0] > 200)
+            if not len(xs):
+                continue
+            h, w = image.shape[:2]
+            contour = create_bbox_contour_from_points(
+                xs.min() / w, ys.min() / h, (xs.max() + 1) / w,
+                (ys.max() + 1) / h
+            )
+            prop = Property(server=self.name, value="square",
+                            confidence=0.9)
+            self.response.append_region(
+                t=tstamp, region=Region(contour=contour, props=[prop])
+            )
+
+
+def _square_frames(cut_at=None):
+    rng = np.random.RandomState(0)
+    background = rng.randint(0, 80, (H, W, 3)).astype(np.uint8)
+    for i in range(NUM_FRAMES):
+        frame = background.copy()
+        if cut_at is not None and i >= cut_at:
+            frame = 255 - frame // 2
+            frame[frame > 200] = 200
+        x, y = 10 + 3 * i, 40 + i
+        frame[y:y + SIZE, x:x + SIZE] = 255
+        frame[y + 8:y + 16, x + 8:x + 16] = 120
+        yield frame
+
+
+def _write_video(path, cut_at=None):
+    return "file://" + write_video(path, _square_frames(cut_at))
+
+
+@pytest.fixture
+def moving_square_url(tmpdir):
+    return _write_video(str(tmpdir.join("square.mp4")))
+
+
+def _boxes(response, server):
+    boxes = {}
+    for ann in response.frame_anns:
+        for region in ann["regions"]:
+            if region["props"][0]["server"] == server:
+                boxes[ann["t"]] = (box_of_contour(region["contour"]),
+                                   region)
+    return boxes
+
+
+def test_iou():
+    assert iou((0, 0, 1, 1), (0, 0, 1, 1)) == 1.0
+    assert iou((0, 0, 0.5, 1), (0.5, 0, 1, 1)) == 0.0
+    assert iou((0, 0, 0.5, 0.5), (0.25, 0.25, 0.75, 0.75)) == pytest.approx(1 / 7)
+
+
+def test_estimate_box_shift():
+    rng = np.random.RandomState(0)
+    prev_gray = rng.randint(0, 255, (H, W)).astype(np.uint8)
+    prev_gray = cv2.GaussianBlur(prev_gray, (5, 5), 0)
+    gray = np.roll(prev_gray, (2, 4), axis=(0, 1))
+    dx, dy = estimate_box_shift(prev_gray, gray, (0.25, 0.25, 0.75, 0.75))
+    assert dx * W == pytest.approx(4, abs=0.5)
+    assert dy * H == pytest.approx(2, abs=0.5)
+
+
+def test_detect_then_track(moving_square_url):
+    request = dict(REQUEST, url=moving_square_url)
+    module = SquareDetector("Square", "1.0.0", batch_size=2, detect_every=5)
+    response = module.process(Response(Request(request)))
+    reference = SquareDetector("Square", "1.0.0").process(
+        Response(Request(request))
+    )
+
+    footprint = response.footprints[-1]
+    num_frames = len(footprint["tstamps"])
+    num_detected = (num_frames + 4) // 5
+    assert num_frames >= NUM_FRAMES - 1
+    assert module.num_detected == num_detected
+    assert footprint["num_images_processed"] == num_detected
+    assert len(footprint["tracked_tstamps"]) == num_frames - num_detected
+    assert footprint["skipped_tstamps"] == []
+
+    boxes = _boxes(response, "Square")
+    expected = _boxes(reference, "Square")
+    assert sorted(boxes) == sorted(expected)
+    tracked = set(footprint["tracked_tstamps"])
+    for t, (box, region) in boxes.items():
+        assert iou(box, expected[t][0]) > 0.6
+        server_track = region["props"][0]["server_track"]
+        assert (server_track == TRACKED_SERVER_TRACK) == (t in tracked)
+
+    assert len(response.tracks) == 1
+    track = response.tracks[0]
+    assert track["t1"] == min(boxes)
+    assert track["t2"] == max(boxes)
+    assert track["props"][0]["value"] == "square"
+    assert sorted(track["region_ids"]) == sorted(
+        region["id"] for _, region in boxes.values()
+    )
+
+
+def test_scene_change_forces_detection(tmpdir):
+    url = _write_video(str(tmpdir.join("cut.mp4")), cut_at=12)
+    module = SquareDetector("Square", "1.0.0", detect_every=10,
+                            scene_change_threshold=20.0)
+    response = module.process(Response(Request(dict(REQUEST, url=url))))
+    detected = sorted(set(response.footprints[-1]["tstamps"]) -
+                      set(response.footprints[-1]["tracked_tstamps"]))
+    assert len(detected) == 4  # frames 0, 10, 12 and 22
+    assert 1.0 < detected[2] < 1.3
+
+
+def test_tracking_in_process_batch(moving_square_url):
+    module = SquareDetector("Square", "1.0.0", batch_size=4, detect_every=5)
+    request = dict(REQUEST, url=moving_square_url)
+    responses = module.process_batch(
+        [Response(Request(request)) for _ in range(2)]
+    )
+    num_frames = len(responses[0].footprints[-1]["tstamps"])
+    assert module.num_detected == 2 * ((num_frames + 4) // 5)
+    for response in responses:
+        assert len(_boxes(response, "Square")) == num_frames
+        assert len(response.tracks) == 1